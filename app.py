@@ -1,86 +1,216 @@
 import os
 import io
+import time
+import json
 import base64
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for
-from werkzeug.utils import secure_filename
+import datetime
+import asyncio
+import inspect
+import threading
+import functools
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, as_completed, wait
+from flask import Flask, Response, render_template, request, jsonify, flash, redirect, url_for, send_file, abort, g
 from PIL import Image
-import openai
-import google.generativeai as genai
 from dotenv import load_dotenv
+import metrics
+import deadlines
+from deadlines import DeadlineExceeded, deadline_scope
+from circuit import CircuitBreaker, CircuitOpen
+from engines import EngineRegistry
+from gemini_client import GeminiClient
+from rate_limit import AdaptiveConcurrency, OutboundPolicy, RateLimited, SharedTokenBucket
+from result_cache import ResultCache, make_cache_key
+from result_store import ResultStore
+from phash_index import NearDuplicateIndex, HASH_FUNCTIONS
+from job_queue import JobStore, JobWorkerPool
+from preprocess import PreprocessOptions, preprocess_image
+from previews import PreviewStore, make_preview, preview_data_url
+from tesseract_engine import TesseractEngine
+from hybrid import HybridPolicy
+from field_extractor import extract_fields
+from results import EMPTY_RESULT, ExtractionResult, ResultJSONProvider, dumps, empty_result, packb
+from json_stream import IncrementalJSONParser, iter_leaves
+from profiling import Profiler
+from pages import PageError, first_page, is_multi_page, is_pdf, iter_pages, merge_results
+from tiling import tile_layout, iter_tiles, stitch_text
+from upload_buffer import SpoolingRequest, DEFAULT_SPOOL_MAX_BYTES, read_upload
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+# Keep uploads in memory instead of spooling them to disk while parsing
+app.request_class = SpoolingRequest
+# Serialize JSON responses with orjson when installed, extraction results included
+app.json = ResultJSONProvider(app)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024)))  # 16MB max request size
 
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'jfif'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Configure uploads. Files are processed in memory; uploads larger than
+# UPLOAD_SPOOL_MAX_BYTES fall back to a temporary file while the request is parsed.
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'tif', 'jfif', 'pdf'}
+app.config['UPLOAD_SPOOL_MAX_BYTES'] = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', str(DEFAULT_SPOOL_MAX_BYTES)))
 
-# Create upload directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Configure result page previews: 'inline' embeds a small WebP thumbnail in the page,
+# 'url' serves it from /preview/<id> with cache headers
+app.config['PREVIEW_MODE'] = os.getenv('PREVIEW_MODE', 'inline').lower()
+app.config['PREVIEW_MAX_SIDE'] = int(os.getenv('PREVIEW_MAX_SIDE', '480'))
+app.config['PREVIEW_DIR'] = os.getenv('PREVIEW_DIR', os.path.join('cache', 'previews'))
+app.config['PREVIEW_TTL'] = int(os.getenv('PREVIEW_TTL', '3600'))
 
-# Configure OpenAI (optional)
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# Configure batch extraction. The pool is shared by all batch requests in a worker process,
+# so the total number of concurrent Gemini calls is at most workers * BATCH_MAX_WORKERS.
+app.config['BATCH_MAX_WORKERS'] = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+app.config['BATCH_MAX_FILES'] = int(os.getenv('BATCH_MAX_FILES', '100'))
 
-# Configure Gemini (optional)
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-if gemini_api_key:
-    genai.configure(api_key=gemini_api_key)
+# Configure multi-page documents (multi-frame TIFF/GIF, and PDF when pypdfium2 is installed).
+# Pages are extracted on their own pool of PAGE_MAX_WORKERS threads per worker process, and
+# at most that many pages of a document are rasterized ahead of the extraction.
+app.config['PAGE_MAX_WORKERS'] = int(os.getenv('PAGE_MAX_WORKERS', '4'))
+app.config['PAGE_MAX_PAGES'] = int(os.getenv('PAGE_MAX_PAGES', '50'))
+app.config['PDF_DPI'] = int(os.getenv('PDF_DPI', '200'))
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Configure tiling of very large scans: images (or pages) whose longest side exceeds
+# TILE_MIN_SIDE are cut into TILE_SIZE tiles overlapping by TILE_OVERLAP pixels and
+# extracted concurrently on TILE_MAX_WORKERS threads. Off by default (TILE_MIN_SIDE=0):
+# every tile is its own extraction, so with the default tile size a 24 MP photo
+# (6000x4000) costs 12 Gemini calls and a 48 MP one (8000x6000) 20 instead of one.
+app.config['TILE_MIN_SIDE'] = int(os.getenv('TILE_MIN_SIDE', '0'))
+app.config['TILE_SIZE'] = int(os.getenv('TILE_SIZE', '2048'))
+app.config['TILE_OVERLAP'] = int(os.getenv('TILE_OVERLAP', '192'))
+app.config['TILE_MAX_WORKERS'] = int(os.getenv('TILE_MAX_WORKERS', '4'))
 
-def extract_text_gemini(image_path):
-    """Extract text using Google Gemini Vision API with comprehensive structured field extraction"""
-    try:
-        # Debug: Print environment variable info
-        print(f"DEBUG: GEMINI_API_KEY exists: {bool(gemini_api_key)}")
-        print(f"DEBUG: GEMINI_API_KEY length: {len(gemini_api_key) if gemini_api_key else 0}")
-        print(f"DEBUG: All env vars starting with GEMINI: {[k for k in os.environ.keys() if 'GEMINI' in k]}")
-        
-        if not gemini_api_key:
-            return {
-                "text": "Gemini API key not configured. Please set GEMINI_API_KEY in your .env file or environment variables",
-                "personal_info": {
-                    "name": "",
-                    "phone": "",
-                    "email": "",
-                    "date_of_birth": "",
-                    "other_personal": ""
-                },
-                "transactional_info": {
-                    "invoice_number": "",
-                    "order_id": "",
-                    "total_amount": "",
-                    "payment_method": "",
-                    "other_transactional": ""
-                },
-                "dates": {
-                    "due_date": "",
-                    "issue_date": "",
-                    "other_dates": ""
-                },
-                "locations": {
-                    "addresses": "",
-                    "other_locations": ""
-                },
-                "other_data": ""
-            }
-        
-        # Load and prepare image
-        image = Image.open(image_path)
-        
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Generate text extraction with comprehensive structured field detection
-        response = model.generate_content([
-            """Please extract and classify any key pieces of information found in this image, such as:
+# Configure the ASGI app (asgi.py). Blocking steps of its async extractions (cache lookups,
+# preprocessing) run on ASYNC_OFFLOAD_WORKERS threads per worker process.
+app.config['ASYNC_OFFLOAD_WORKERS'] = int(os.getenv('ASYNC_OFFLOAD_WORKERS', str((os.cpu_count() or 2) * 2)))
+
+# Configure asynchronous jobs
+app.config['JOBS_ENABLED'] = os.getenv('JOBS_ENABLED', 'true').lower() == 'true'
+app.config['JOBS_DB_PATH'] = os.getenv('JOBS_DB_PATH', os.path.join('data', 'jobs.sqlite3'))
+app.config['JOBS_WORKERS'] = int(os.getenv('JOBS_WORKERS', '2'))
+app.config['JOBS_LEASE_SECONDS'] = int(os.getenv('JOBS_LEASE_SECONDS', '300'))
+app.config['JOBS_MAX_ATTEMPTS'] = int(os.getenv('JOBS_MAX_ATTEMPTS', '3'))
+app.config['JOBS_RETENTION_SECONDS'] = int(os.getenv('JOBS_RETENTION_SECONDS', str(24 * 3600)))
+app.config['JOBS_RETRY_DELAY_SECONDS'] = float(os.getenv('JOBS_RETRY_DELAY_SECONDS', '10'))
+
+# Configure the searchable result store (/api/search). Successful extractions are queued and a
+# background thread per worker process writes them in batches of up to RESULT_STORE_BATCH_SIZE,
+# at least every RESULT_STORE_FLUSH_SECONDS; with RESULT_STORE_QUEUE_SIZE results waiting, new
+# ones are dropped. RESULT_STORE_TOKENIZER is the FTS5 tokenizer, fixed when the index is created
+# ('trigram' matches substrings, e.g. in Japanese text without spaces, with a ~5x larger index).
+app.config['RESULT_STORE_ENABLED'] = os.getenv('RESULT_STORE_ENABLED', 'false').lower() == 'true'
+app.config['RESULT_STORE_DB_PATH'] = os.getenv('RESULT_STORE_DB_PATH', os.path.join('data', 'results.sqlite3'))
+app.config['RESULT_STORE_BATCH_SIZE'] = int(os.getenv('RESULT_STORE_BATCH_SIZE', '200'))
+app.config['RESULT_STORE_FLUSH_SECONDS'] = float(os.getenv('RESULT_STORE_FLUSH_SECONDS', '1.0'))
+app.config['RESULT_STORE_QUEUE_SIZE'] = int(os.getenv('RESULT_STORE_QUEUE_SIZE', '10000'))
+app.config['RESULT_STORE_TOKENIZER'] = os.getenv('RESULT_STORE_TOKENIZER', 'unicode61 remove_diacritics 2')
+app.config['SEARCH_MAX_LIMIT'] = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+
+# Configure local Tesseract OCR. Recognition runs in TESSERACT_PROCESSES pool processes
+# per web worker; 0 runs it inside the web worker instead.
+app.config['TESSERACT_PROCESSES'] = int(os.getenv('TESSERACT_PROCESSES', str(max(1, (os.cpu_count() or 2) // 2))))
+app.config['TESSERACT_LANGUAGES'] = [
+    lang.strip() for lang in os.getenv('TESSERACT_LANGUAGES', 'eng,jpn').split(',') if lang.strip()
+]
+
+# Configure method=auto: local OCR first, escalate to Gemini when the result looks unreliable
+app.config['AUTO_MIN_CONFIDENCE'] = float(os.getenv('AUTO_MIN_CONFIDENCE', '80'))
+app.config['AUTO_MAX_LOW_CONFIDENCE_RATIO'] = float(os.getenv('AUTO_MAX_LOW_CONFIDENCE_RATIO', '0.15'))
+app.config['AUTO_MIN_WORDS'] = int(os.getenv('AUTO_MIN_WORDS', '5'))
+app.config['AUTO_MIN_FIELD_COVERAGE'] = float(os.getenv('AUTO_MIN_FIELD_COVERAGE', '0.2'))
+
+# Configure Gemini (optional). The client is created once per worker process and reused.
+app.config['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+# Bump whenever the extraction prompt changes so cached results are not reused
+PROMPT_VERSION = '1'
+# 'schema' asks for JSON matching RESPONSE_SCHEMA (constrained decoding, short prompt),
+# 'prompt' describes the JSON format in a long prompt and parses whatever comes back
+app.config['GEMINI_OUTPUT_MODE'] = os.getenv('GEMINI_OUTPUT_MODE', 'schema').lower()
+
+# Configure outbound Gemini limits. GEMINI_RPM is one budget shared by all worker processes
+# on the host through GEMINI_RATE_LIMIT_DB (0 disables it); concurrency adapts per process
+# between 1 and GEMINI_MAX_CONCURRENCY, cut on 429s or calls slower than GEMINI_LATENCY_TARGET
+# seconds (0: twice the recent median).
+app.config['GEMINI_RPM'] = int(os.getenv('GEMINI_RPM', '0'))
+app.config['GEMINI_BURST'] = int(os.getenv('GEMINI_BURST', '0'))
+app.config['GEMINI_RATE_LIMIT_DB'] = os.getenv('GEMINI_RATE_LIMIT_DB', os.path.join('data', 'ratelimit.sqlite3'))
+app.config['GEMINI_INITIAL_CONCURRENCY'] = int(os.getenv('GEMINI_INITIAL_CONCURRENCY', '8'))
+app.config['GEMINI_MAX_CONCURRENCY'] = int(os.getenv('GEMINI_MAX_CONCURRENCY', '32'))
+app.config['GEMINI_LATENCY_TARGET'] = float(os.getenv('GEMINI_LATENCY_TARGET', '0'))
+app.config['GEMINI_MAX_RETRIES'] = int(os.getenv('GEMINI_MAX_RETRIES', '3'))
+app.config['GEMINI_ACQUIRE_TIMEOUT'] = float(os.getenv('GEMINI_ACQUIRE_TIMEOUT', '30'))
+# Send a duplicate request when a call runs past the recent p95 latency
+app.config['GEMINI_HEDGE'] = os.getenv('GEMINI_HEDGE', 'false').lower() == 'true'
+
+# Configure request deadlines. Every extraction request gets REQUEST_DEADLINE_SECONDS, which a
+# client can change (up to REQUEST_MAX_DEADLINE_SECONDS) with an X-Request-Deadline header or a
+# deadline form field. Keep the default below the gunicorn worker timeout (30 s by default).
+app.config['REQUEST_DEADLINE_SECONDS'] = float(os.getenv('REQUEST_DEADLINE_SECONDS', '25'))
+app.config['REQUEST_MAX_DEADLINE_SECONDS'] = float(os.getenv('REQUEST_MAX_DEADLINE_SECONDS', '120'))
+
+# Configure the Gemini circuit breaker: it opens for BREAKER_OPEN_SECONDS when at least
+# BREAKER_FAILURE_RATE of the calls of the last BREAKER_WINDOW_SECONDS failed upstream (with
+# BREAKER_MIN_CALLS or more calls). While open, BREAKER_FALLBACK=tesseract answers
+# method=gemini requests with local OCR; 'none' fails them fast.
+app.config['BREAKER_ENABLED'] = os.getenv('BREAKER_ENABLED', 'true').lower() == 'true'
+app.config['BREAKER_FAILURE_RATE'] = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+app.config['BREAKER_MIN_CALLS'] = int(os.getenv('BREAKER_MIN_CALLS', '10'))
+app.config['BREAKER_WINDOW_SECONDS'] = float(os.getenv('BREAKER_WINDOW_SECONDS', '30'))
+app.config['BREAKER_OPEN_SECONDS'] = float(os.getenv('BREAKER_OPEN_SECONDS', '30'))
+app.config['BREAKER_FALLBACK'] = os.getenv('BREAKER_FALLBACK', 'none').lower()
+
+# Configure image preprocessing before the Gemini call
+app.config['PREPROCESS_ENABLED'] = os.getenv('PREPROCESS_ENABLED', 'true').lower() == 'true'
+app.config['PREPROCESS_MAX_SIDE'] = int(os.getenv('PREPROCESS_MAX_SIDE', '2048'))
+app.config['PREPROCESS_FORMAT'] = os.getenv('PREPROCESS_FORMAT', 'jpeg').lower()
+app.config['PREPROCESS_QUALITY'] = int(os.getenv('PREPROCESS_QUALITY', '85'))
+app.config['PREPROCESS_GRAYSCALE'] = os.getenv('PREPROCESS_GRAYSCALE', 'auto').lower()
+app.config['PREPROCESS_SKIP_BELOW_BYTES'] = int(os.getenv('PREPROCESS_SKIP_BELOW_BYTES', str(256 * 1024)))
+
+# Configure result cache
+app.config['CACHE_ENABLED'] = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
+app.config['CACHE_DB_PATH'] = os.getenv('CACHE_DB_PATH', os.path.join('cache', 'results.sqlite3'))
+app.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+app.config['CACHE_MAX_BYTES'] = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+app.config['CACHE_TTL'] = int(os.getenv('CACHE_TTL', str(7 * 24 * 3600)))
+
+# Configure near-duplicate lookup (re-photographed or recompressed documents)
+app.config['NEAR_DUP_ENABLED'] = os.getenv('NEAR_DUP_ENABLED', 'false').lower() == 'true'
+app.config['NEAR_DUP_HASH'] = os.getenv('NEAR_DUP_HASH', 'dhash')
+app.config['NEAR_DUP_MAX_DISTANCE'] = int(os.getenv('NEAR_DUP_MAX_DISTANCE', '4'))
+
+# Configure the Prometheus /metrics endpoint (needs prometheus_client). Under gunicorn the
+# values of every worker are aggregated through PROMETHEUS_MULTIPROC_DIR, see gunicorn.conf.py.
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Configure request profiling (off by default). When enabled, PROFILE_SAMPLE_RATE of the
+# extraction requests, and those sent with an X-Profile: true header, run under cProfile.
+# Profiles are written to PROFILE_DIR, which keeps at most PROFILE_MAX_FILES of them, none
+# older than PROFILE_MAX_AGE seconds.
+app.config['PROFILE_ENABLED'] = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', 'profiles')
+app.config['PROFILE_MAX_FILES'] = int(os.getenv('PROFILE_MAX_FILES', '100'))
+app.config['PROFILE_MAX_AGE'] = int(os.getenv('PROFILE_MAX_AGE', str(7 * 24 * 3600)))
+PROFILED_ENDPOINTS = ('upload_file', 'api_extract', 'api_extract_batch')
+
+# Services are built by create_app(). Engines are registered there but only created,
+# together with the SDK they import, on first use or during warm_up().
+engines = EngineRegistry()
+preview_store = None
+hybrid_policy = None
+preprocess_options = None
+result_cache = None
+near_duplicate_index = None
+job_store = None
+job_workers = None
+result_store = None
+profiler = None
+_app_created = False
+
+EXTRACTION_PROMPT = """Please extract and classify any key pieces of information found in this image, such as:
 
         Personal info (name, phone, date of birth, email...)
         Transactional info (invoice numbers, order IDs, total amount, payment method...)
@@ -132,186 +262,836 @@ def extract_text_gemini(image_path):
         - Be thorough - extract even small details that might be important
         - Return ONLY the JSON object, no other text
 
-        Extract and classify ALL information exactly as it appears in the image.""",
-            image
-        ])
+        Extract and classify ALL information exactly as it appears in the image."""
+
+# Used with RESPONSE_SCHEMA, which already describes the output format
+SCHEMA_PROMPT = """Extract all text in this image and classify the key information into the response fields.
+Read every word precisely, including Vietnamese and Japanese with proper diacritics, and keep the
+original line breaks in "text". Separate multiple values with commas; use "" for fields not found."""
+
+def _response_schema(template):
+    """Gemini response schema with the shape of an extraction result, every leaf a string"""
+    if isinstance(template, dict):
+        return {
+            'type': 'OBJECT',
+            'properties': {key: _response_schema(value) for key, value in template.items()},
+            'required': list(template)
+        }
+    return {'type': 'STRING'}
+
+RESPONSE_SCHEMA = _response_schema(EMPTY_RESULT.to_dict())
+
+def _create_gemini_policy():
+    bucket = None
+    if app.config['GEMINI_RPM'] > 0:
+        bucket = SharedTokenBucket(
+            app.config['GEMINI_RATE_LIMIT_DB'],
+            app.config['GEMINI_RPM'],
+            burst=app.config['GEMINI_BURST'] or None
+        )
+    return OutboundPolicy(
+        bucket=bucket,
+        concurrency=AdaptiveConcurrency(
+            initial=app.config['GEMINI_INITIAL_CONCURRENCY'],
+            maximum=app.config['GEMINI_MAX_CONCURRENCY'],
+            latency_target=app.config['GEMINI_LATENCY_TARGET']
+        ),
+        max_retries=app.config['GEMINI_MAX_RETRIES'],
+        acquire_timeout=app.config['GEMINI_ACQUIRE_TIMEOUT'],
+        hedge=app.config['GEMINI_HEDGE']
+    )
+
+def _create_gemini_client():
+    if not app.config['GEMINI_API_KEY']:
+        return None
+    breaker = None
+    if app.config['BREAKER_ENABLED']:
+        breaker = CircuitBreaker(
+            'gemini',
+            failure_rate=app.config['BREAKER_FAILURE_RATE'],
+            min_calls=app.config['BREAKER_MIN_CALLS'],
+            window_seconds=app.config['BREAKER_WINDOW_SECONDS'],
+            open_seconds=app.config['BREAKER_OPEN_SECONDS']
+        )
+    return GeminiClient(app.config['GEMINI_API_KEY'], GEMINI_MODEL_NAME,
+                        policy=_create_gemini_policy(), breaker=breaker)
+
+def _create_tesseract_engine():
+    return TesseractEngine(
+        processes=app.config['TESSERACT_PROCESSES'],
+        languages=app.config['TESSERACT_LANGUAGES']
+    )
+
+def create_app(config=None):
+    """Build the services from app.config and return the app.
+
+    Runs on import so `gunicorn app:app` keeps working. With `gunicorn --preload`
+    it runs once in the master and workers fork with everything imported;
+    per-process resources (database connections, pools, threads, API clients)
+    are still opened lazily after the fork. Passing config rebuilds the services
+    with those settings applied.
+    """
+    global preview_store, hybrid_policy, preprocess_options, result_cache
+    global near_duplicate_index, job_store, job_workers, result_store, profiler, _app_created
+    if _app_created and config is None:
+        return app
+    if config:
+        app.config.update(config)
+
+    SpoolingRequest.spool_max_bytes = app.config['UPLOAD_SPOOL_MAX_BYTES']
+
+    engines.register('gemini', _create_gemini_client)
+    engines.register('tesseract', _create_tesseract_engine)
+    if not app.config['GEMINI_API_KEY']:
+        print("WARNING: GEMINI_API_KEY is not set, Gemini extraction is disabled")
+
+    preview_store = None
+    if app.config['PREVIEW_MODE'] == 'url':
+        preview_store = PreviewStore(
+            app.config['PREVIEW_DIR'],
+            ttl=app.config['PREVIEW_TTL'],
+            max_side=app.config['PREVIEW_MAX_SIDE']
+        )
+
+    hybrid_policy = HybridPolicy(
+        min_confidence=app.config['AUTO_MIN_CONFIDENCE'],
+        max_low_confidence_ratio=app.config['AUTO_MAX_LOW_CONFIDENCE_RATIO'],
+        min_words=app.config['AUTO_MIN_WORDS'],
+        min_field_coverage=app.config['AUTO_MIN_FIELD_COVERAGE']
+    )
+
+    preprocess_options = PreprocessOptions(
+        max_side=app.config['PREPROCESS_MAX_SIDE'],
+        output_format=app.config['PREPROCESS_FORMAT'],
+        quality=app.config['PREPROCESS_QUALITY'],
+        grayscale=app.config['PREPROCESS_GRAYSCALE'],
+        skip_below_bytes=app.config['PREPROCESS_SKIP_BELOW_BYTES']
+    )
+
+    result_cache = ResultCache(
+        db_path=app.config['CACHE_DB_PATH'],
+        max_entries=app.config['CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['CACHE_MAX_BYTES'],
+        ttl=app.config['CACHE_TTL']
+    )
+
+    near_duplicate_index = None
+    if app.config['CACHE_ENABLED'] and app.config['NEAR_DUP_ENABLED']:
+        near_duplicate_index = NearDuplicateIndex(
+            max_distance=app.config['NEAR_DUP_MAX_DISTANCE'],
+            db_path=app.config['CACHE_DB_PATH'],
+            ttl=app.config['CACHE_TTL']
+        )
+
+    job_store = None
+    job_workers = None
+    if app.config['JOBS_ENABLED']:
+        job_store = JobStore(
+            app.config['JOBS_DB_PATH'],
+            lease_seconds=app.config['JOBS_LEASE_SECONDS'],
+            max_attempts=app.config['JOBS_MAX_ATTEMPTS'],
+            retention_seconds=app.config['JOBS_RETENTION_SECONDS'],
+            retry_delay=app.config['JOBS_RETRY_DELAY_SECONDS']
+        )
+        job_workers = JobWorkerPool(job_store, _run_job, num_threads=app.config['JOBS_WORKERS'])
+
+    result_store = None
+    if app.config['RESULT_STORE_ENABLED']:
+        result_store = ResultStore(
+            app.config['RESULT_STORE_DB_PATH'],
+            batch_size=app.config['RESULT_STORE_BATCH_SIZE'],
+            flush_interval=app.config['RESULT_STORE_FLUSH_SECONDS'],
+            max_queue=app.config['RESULT_STORE_QUEUE_SIZE'],
+            tokenizer=app.config['RESULT_STORE_TOKENIZER']
+        )
+
+    profiler = None
+    if app.config['PROFILE_ENABLED']:
+        profiler = Profiler(
+            app.config['PROFILE_DIR'],
+            sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+            max_files=app.config['PROFILE_MAX_FILES'],
+            max_age=app.config['PROFILE_MAX_AGE']
+        )
+
+    _app_created = True
+    return app
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+# Worker-wide thread pools by name, with the pid that created them
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _get_executor(name, max_workers):
+    """Return the worker-wide thread pool called name, creating it after fork if needed"""
+    with _executors_lock:
+        executor, pid = _executors.get(name, (None, None))
+        if executor is None or pid != os.getpid():
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+            _executors[name] = (executor, os.getpid())
+        return executor
+
+def get_batch_executor():
+    return _get_executor('extract', app.config['BATCH_MAX_WORKERS'])
+
+def get_page_executor():
+    # Separate from the batch pool: a batch item waiting on its pages must not starve them
+    return _get_executor('page', app.config['PAGE_MAX_WORKERS'])
+
+def get_tile_executor():
+    # Pages wait on their tiles, so tiles get a pool of their own too
+    return _get_executor('tile', app.config['TILE_MAX_WORKERS'])
+
+def get_offload_executor():
+    # Short blocking steps of async extractions; whole documents go to the batch pool
+    return _get_executor('offload', app.config['ASYNC_OFFLOAD_WORKERS'])
+
+def record_token_usage(response, stats=None):
+    """Copy the token counts of a Gemini response into stats and the process metrics"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    tokens = {
+        'prompt': usage.prompt_token_count,
+        'response': usage.candidates_token_count,
+        'total': usage.total_token_count
+    }
+    mode = app.config['GEMINI_OUTPUT_MODE']
+    metrics.increment('gemini_prompt_tokens', tokens['prompt'], mode=mode)
+    metrics.increment('gemini_response_tokens', tokens['response'], mode=mode)
+    if stats is not None:
+        stats['tokens'] = tokens
+
+def build_gemini_request(image_bytes, mime_type=None):
+    """Return the contents and generate_content options for one extraction call"""
+    # Load and prepare image
+    if mime_type:
+        image = {'mime_type': mime_type, 'data': bytes(image_bytes)}
+        metrics.increment('gemini_upload_bytes', len(image_bytes))
+    else:
+        with metrics.timed('extract_stage_seconds', stage='decode'):
+            image = Image.open(io.BytesIO(image_bytes))
+            image.load()
+
+    if app.config['GEMINI_OUTPUT_MODE'] == 'schema':
+        # Constrained decoding: the reply is always JSON in the shape of RESPONSE_SCHEMA
+        return [SCHEMA_PROMPT, image], {'generation_config': {
+            'response_mime_type': 'application/json',
+            'response_schema': RESPONSE_SCHEMA
+        }}
+    return [EXTRACTION_PROMPT, image], {}
+
+def parse_extraction_response(raw_text):
+    """Parse the model's JSON reply into an extraction result"""
+    with metrics.timed('extract_stage_seconds', stage='parse_response'):
+        return _parse_extraction_response(raw_text)
+
+def _parse_extraction_response(raw_text):
+    try:
+        # Clean the response text - remove markdown code blocks if present
+        response_text = raw_text.strip()
+        if response_text.startswith('```json'):
+            response_text = response_text.replace('```json', '').replace('```', '').strip()
+        elif response_text.startswith('```'):
+            response_text = response_text.replace('```', '').strip()
+        
+        result = json.loads(response_text)
+        
+        # Ensure result is a dictionary and has expected structure
+        if isinstance(result, dict) and 'text' in result:
+            return ExtractionResult.from_dict(result)
+        else:
+            # If not proper structure, create one with the response as text
+            metrics.increment('gemini_parse_failures', mode=app.config['GEMINI_OUTPUT_MODE'])
+            return empty_result(raw_text)
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        print(f"DEBUG: JSON parsing failed: {e}")
+        print(f"DEBUG: Raw response: {raw_text[:500]}...")
+        metrics.increment('gemini_parse_failures', mode=app.config['GEMINI_OUTPUT_MODE'])
+        # Fallback if response is not valid JSON
+        return empty_result(raw_text)
+
+def extract_text_gemini(image_bytes, mime_type=None, stats=None):
+    """Extract text using Google Gemini Vision API with comprehensive structured field extraction
+
+    With a mime_type the bytes are sent as-is, otherwise the SDK re-encodes the decoded image.
+    Token counts are recorded in stats['tokens'] when a stats dict is given.
+    """
+    try:
+        gemini_client = engines.get('gemini')
+        if gemini_client is None:
+            result = empty_result("Gemini API key not configured. Please set GEMINI_API_KEY in your .env file or environment variables")
+            result['error'] = "Gemini API key not configured"
+            return result
         
-        # Try to parse JSON response
+        contents, options = build_gemini_request(image_bytes, mime_type)
+        response = gemini_client.generate_content(contents, **options)
+        record_token_usage(response, stats)
+        return parse_extraction_response(response.text)
+    except (RateLimited, CircuitOpen) as e:
+        return retry_later_result(e)
+    except DeadlineExceeded as e:
+        return deadline_result(e)
+    except Exception as e:
+        result = empty_result(f"Error with Gemini Vision API: {str(e)}")
+        result['error'] = str(e)
+        return result
+
+def retry_later_result(error):
+    """Error result for a call refused by the outbound limits or an open circuit;
+    carries retry_after (seconds)"""
+    result = empty_result(f"Gemini API is unavailable, please retry in {max(1, round(error.retry_after))} s")
+    result['error'] = str(error)
+    result['retry_after'] = round(error.retry_after, 3)
+    return result
+
+def deadline_result(error):
+    """Error result for work cut short by the request deadline"""
+    result = empty_result(f"Request deadline exceeded: {str(error)}")
+    result['error'] = str(error)
+    result['timed_out'] = True
+    return result
+
+def prepare_gemini_payload(image_bytes, stats):
+    """Shrink the image when enabled, recording sizes in stats; returns (payload, mime_type)"""
+    if not app.config['PREPROCESS_ENABLED']:
+        return image_bytes, None
+    try:
+        with metrics.timed('extract_stage_seconds', stage='preprocess'):
+            payload, mime_type, stats['preprocess'] = preprocess_image(image_bytes, preprocess_options)
+    except Exception as e:
+        # Let the API see the original upload rather than failing on a decode quirk
+        print(f"DEBUG: Preprocessing failed: {e}")
+        return image_bytes, None
+    return payload, mime_type
+
+def extract_text_preprocessed(image_bytes, stats):
+    """Shrink the image (when enabled) and call extract_text_gemini, recording sizes in stats"""
+    payload, mime_type = prepare_gemini_payload(image_bytes, stats)
+    return extract_text_gemini(payload, mime_type, stats)
+
+def lookup_result(image_bytes, stats):
+    """Look an image up in the result cache, then the near-duplicate index, filling stats['cache'].
+
+    Returns (cached_result, key, image_hash). On a miss cached_result is None and the key and
+    perceptual hash are what store_result() needs; key is None when caching is disabled.
+    """
+    if not app.config['CACHE_ENABLED']:
+        return None, None, None
+
+    start = time.perf_counter()
+    preprocess_signature = preprocess_options.signature() if app.config['PREPROCESS_ENABLED'] else 'off'
+    key = make_cache_key(image_bytes, 'gemini', GEMINI_MODEL_NAME, PROMPT_VERSION,
+                         app.config['GEMINI_OUTPUT_MODE'], preprocess_signature)
+    cached, tier = result_cache.get(key)
+    lookup_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    if cached is not None:
+        stats['cache'] = {'hit': True, 'tier': tier, 'lookup_ms': lookup_ms}
+        record_cache_lookup(stats['cache'])
+        return ExtractionResult.from_dict(cached), key, None
+
+    image_hash = None
+    if near_duplicate_index is not None:
+        start = time.perf_counter()
         try:
-            import json
-            # Clean the response text - remove markdown code blocks if present
-            response_text = response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text.replace('```json', '').replace('```', '').strip()
-            elif response_text.startswith('```'):
-                response_text = response_text.replace('```', '').strip()
-            
-            result = json.loads(response_text)
-            
-            # Ensure result is a dictionary and has expected structure
-            if isinstance(result, dict) and 'text' in result:
-                return result
-            else:
-                # If not proper structure, create one with the response as text
-                return {
-                    "text": response.text,
-                    "personal_info": {
-                        "name": "",
-                        "phone": "",
-                        "email": "",
-                        "date_of_birth": "",
-                        "other_personal": ""
-                    },
-                    "transactional_info": {
-                        "invoice_number": "",
-                        "order_id": "",
-                        "total_amount": "",
-                        "payment_method": "",
-                        "other_transactional": ""
-                    },
-                    "dates": {
-                        "due_date": "",
-                        "issue_date": "",
-                        "other_dates": ""
-                    },
-                    "locations": {
-                        "addresses": "",
-                        "other_locations": ""
-                    },
-                    "other_data": ""
-                }
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
-            print(f"DEBUG: JSON parsing failed: {e}")
-            print(f"DEBUG: Raw response: {response.text[:500]}...")
-            # Fallback if response is not valid JSON
-            return {
-                "text": response.text,
-                "personal_info": {
-                    "name": "",
-                    "phone": "",
-                    "email": "",
-                    "date_of_birth": "",
-                    "other_personal": ""
-                },
-                "transactional_info": {
-                    "invoice_number": "",
-                    "order_id": "",
-                    "total_amount": "",
-                    "payment_method": "",
-                    "other_transactional": ""
-                },
-                "dates": {
-                    "due_date": "",
-                    "issue_date": "",
-                    "other_dates": ""
-                },
-                "locations": {
-                    "addresses": "",
-                    "other_locations": ""
-                },
-                "other_data": ""
-            }
+            image_hash = HASH_FUNCTIONS[app.config['NEAR_DUP_HASH']](Image.open(io.BytesIO(image_bytes)))
+        except Exception as e:
+            print(f"DEBUG: Perceptual hash failed: {e}")
+        if image_hash is not None:
+            for distance, match_key in near_duplicate_index.lookup(image_hash):
+                cached, _ = result_cache.get(match_key)
+                if cached is not None:
+                    lookup_ms += round((time.perf_counter() - start) * 1000, 3)
+                    stats['cache'] = {'hit': True, 'tier': 'near_duplicate', 'distance': distance,
+                                      'lookup_ms': lookup_ms}
+                    record_cache_lookup(stats['cache'])
+                    return ExtractionResult.from_dict(cached), key, None
+        lookup_ms += round((time.perf_counter() - start) * 1000, 3)
+
+    stats['cache']['lookup_ms'] = lookup_ms
+    record_cache_lookup(stats['cache'])
+    return None, key, image_hash
+
+def record_cache_lookup(cache_stats):
+    """Count a cache lookup by outcome and tier; the hit ratio is hits / all lookups"""
+    metrics.increment('cache_lookups', result='hit' if cache_stats['hit'] else 'miss',
+                      tier=cache_stats['tier'] or 'none')
+    metrics.observe('extract_stage_seconds', cache_stats['lookup_ms'] / 1000, stage='cache_lookup')
+
+def store_result(key, image_hash, extraction_result):
+    """Cache a fresh result under the key (and perceptual hash) from lookup_result()"""
+    # Never cache failures, the next request should retry the API
+    if key is None or extraction_result.get('error'):
+        return
+    result_cache.set(key, extraction_result)
+    if image_hash is not None:
+        near_duplicate_index.add(image_hash, key)
+
+def extract_text_cached(image_bytes):
+    """Run extract_text_gemini behind the result cache.
+
+    Returns the extraction result and a stats dict describing the cache lookup
+    and, when the API was called, the preprocessing.
+    """
+    stats = {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    cached, key, image_hash = lookup_result(image_bytes, stats)
+    if cached is not None:
+        return cached, stats
+    extraction_result = extract_text_preprocessed(image_bytes, stats)
+    store_result(key, image_hash, extraction_result)
+    return extraction_result, stats
+
+def stream_text_gemini(image_bytes):
+    """Streaming counterpart of extract_text_cached.
+
+    Yields ('field', path, value) for every field of the reply as soon as its JSON value is
+    complete, then ('result', extraction_result, stats). Cache hits yield all fields at once.
+    """
+    stats = {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    cached, key, image_hash = lookup_result(image_bytes, stats)
+    if cached is not None:
+        for path, value in iter_leaves(cached):
+            yield 'field', path, value
+        yield 'result', cached, stats
+        return
+
+    gemini_client = engines.get('gemini')
+    if gemini_client is None:
+        yield 'result', extract_text_gemini(image_bytes), stats
+        return
+
+    payload, mime_type = prepare_gemini_payload(image_bytes, stats)
+    contents, options = build_gemini_request(payload, mime_type)
+    parser = IncrementalJSONParser()
+    chunks = []
+    start = time.perf_counter()
+    try:
+        chunk = None
+        for chunk in gemini_client.generate_content_stream(contents, **options):
+            if not chunks:
+                stats['stream'] = {'model_ttfb_ms': round((time.perf_counter() - start) * 1000, 3)}
+            chunks.append(chunk.text)
+            for path, value in parser.feed(chunk.text):
+                yield 'field', path, value
+        # The last chunk carries the usage of the whole reply
+        record_token_usage(chunk, stats)
+        extraction_result = parse_extraction_response(''.join(chunks))
+    except (RateLimited, CircuitOpen) as e:
+        extraction_result = retry_later_result(e)
+    except DeadlineExceeded as e:
+        extraction_result = deadline_result(e)
     except Exception as e:
-        return {
-            "text": f"Error with Gemini Vision API: {str(e)}",
-            "personal_info": {
-                "name": "",
-                "phone": "",
-                "email": "",
-                "date_of_birth": "",
-                "other_personal": ""
-            },
-            "transactional_info": {
-                "invoice_number": "",
-                "order_id": "",
-                "total_amount": "",
-                "payment_method": "",
-                "other_transactional": ""
-            },
-            "dates": {
-                "due_date": "",
-                "issue_date": "",
-                "other_dates": ""
-            },
-            "locations": {
-                "addresses": "",
-                "other_locations": ""
-            },
-            "other_data": ""
-        }
+        extraction_result = empty_result(f"Error with Gemini Vision API: {str(e)}")
+        extraction_result['error'] = str(e)
+    store_result(key, image_hash, extraction_result)
+    yield 'result', extraction_result, stats
+
+def extract_text_tesseract(image_bytes, language):
+    """Extract text locally with Tesseract OCR and structured fields with the local field extractor"""
+    stats = {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    try:
+        with metrics.timed('extract_stage_seconds', stage='tesseract_ocr'):
+            ocr = engines.get('tesseract').recognize(image_bytes, language, timeout=deadlines.timeout())
+    except (DeadlineExceeded, FutureTimeout, TimeoutError) as e:
+        # Before Python 3.11 a future's timeout is not the builtin TimeoutError
+        return deadline_result(str(e) or 'Tesseract OCR timed out'), stats
+    except Exception as e:
+        result = empty_result(f"Error with Tesseract OCR: {str(e)}")
+        result['error'] = str(e)
+        return result, stats
+    stats['ocr'] = {key: value for key, value in ocr.items() if key != 'text'}
+    with metrics.timed('extract_stage_seconds', stage='field_extraction'):
+        return extract_fields(ocr['text'], language), stats
+
+def extract_text_auto(image_bytes, language):
+    """Try local OCR first and escalate to Gemini only when the local result is not good enough"""
+    start = time.perf_counter()
+    local_result, stats = extract_text_tesseract(image_bytes, language)
+    local_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    if local_result.get('error'):
+        escalate, reason, telemetry = True, 'local_error', {}
+    else:
+        escalate, reason, telemetry = hybrid_policy.decide({'text': local_result['text'], **stats['ocr']}, local_result)
+    telemetry.update({'reason': reason, 'local_ms': local_ms})
+
+    if not escalate:
+        telemetry['answered_by'] = 'tesseract'
+        stats['tier'] = telemetry
+        return local_result, stats
+
+    start = time.perf_counter()
+    extraction_result, gemini_stats = extract_text_cached(image_bytes)
+    telemetry['escalation_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    if extraction_result.get('error') and not local_result.get('error') and gemini_circuit_open():
+        # Gemini is down: the local result is better than none
+        telemetry.update({'answered_by': 'tesseract', 'reason': 'circuit_open'})
+        stats['tier'] = telemetry
+        return local_result, stats
+    telemetry['answered_by'] = 'gemini'
+    gemini_stats['ocr'] = stats.get('ocr')
+    gemini_stats['tier'] = telemetry
+    return extraction_result, gemini_stats
+
+def gemini_circuit_open():
+    """True while the Gemini circuit breaker refuses calls"""
+    gemini_client = engines.get('gemini')
+    return gemini_client is not None and gemini_client.breaker is not None and gemini_client.breaker.is_open()
+
+def extract_text_fallback(image_bytes, language, reason):
+    """Answer a gemini request with local OCR while the Gemini circuit is open"""
+    metrics.increment('engine_fallbacks', engine='gemini', fallback='tesseract')
+    extraction_result, stats = extract_text_tesseract(image_bytes, language)
+    stats['fallback'] = {'from': 'gemini', 'to': 'tesseract', 'reason': reason}
+    return extraction_result, stats
+
+def extract_by_method(image_bytes, method, language='eng'):
+    """Dispatch to the extraction engine selected by the method form field"""
+    if deadlines.expired():
+        return deadline_result('Request deadline exceeded before extraction started'), \
+            {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    if method == 'gemini':
+        extraction_result, stats = extract_text_cached(image_bytes)
+        if (extraction_result.get('error') and app.config['BREAKER_FALLBACK'] == 'tesseract'
+                and not deadlines.expired() and gemini_circuit_open()):
+            return extract_text_fallback(image_bytes, language, extraction_result['error'])
+        return extraction_result, stats
+    if method == 'tesseract':
+        return extract_text_tesseract(image_bytes, language)
+    if method == 'auto':
+        return extract_text_auto(image_bytes, language)
+    result = empty_result(f"Unsupported method: {method}")
+    result['error'] = f"Unsupported method: {method}"
+    return result, {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+
+def _extract_part(kind, number, image_bytes, method, language, extract):
+    """Extract one page or tile, never raising so one bad part cannot fail the rest"""
+    start = time.perf_counter()
+    try:
+        extraction_result, stats = extract(image_bytes, method, language)
+    except DeadlineExceeded as e:
+        extraction_result = deadline_result(e)
+        stats = {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    except Exception as e:
+        extraction_result = empty_result(f"Error: {str(e)}")
+        extraction_result['error'] = str(e)
+        stats = {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    elapsed = time.perf_counter() - start
+    metrics.observe(f'{kind}_extract_seconds', elapsed, method=method)
+    return number, extraction_result, {kind: number, 'elapsed_ms': round(elapsed * 1000, 3), **stats}
+
+def _iter_part_results(kind, parts, executor, window, method, language, extract):
+    """Extract (number, image_bytes) parts in parallel, yielding (number, result, stats) in
+    completion order. parts is consumed lazily, never more than window ahead of the extraction."""
+    pending = set()
+    for number, part_bytes in parts:
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(deadlines.submit(executor, _extract_part, kind, number, part_bytes, method, language, extract))
+        if deadlines.expired():
+            # Stop decoding further parts; the ones queued fail fast on the deadline
+            break
+    for future in as_completed(pending):
+        yield future.result()
+
+def iter_page_results(image_bytes, method, language):
+    """Extract the pages of a PDF or multi-frame image in parallel.
+
+    Yields (page_number, extraction_result, stats) in completion order. Pages are
+    rasterized lazily, never more than PAGE_MAX_WORKERS ahead of the extraction,
+    and oversized pages are tiled.
+    """
+    pages = iter_pages(image_bytes, dpi=app.config['PDF_DPI'], max_pages=app.config['PAGE_MAX_PAGES'])
+    return _iter_part_results('page', enumerate(pages, 1), get_page_executor(), app.config['PAGE_MAX_WORKERS'],
+                              method, language, extract_image)
+
+def iter_tile_results(image_bytes, boxes, method, language):
+    """Extract the tiles of an oversized image in parallel, yielding (tile_number, result, stats)
+    in completion order. The stats of each tile include its box in the full image."""
+    results = _iter_part_results('tile', iter_tiles(image_bytes, boxes), get_tile_executor(),
+                                 app.config['TILE_MAX_WORKERS'], method, language, extract_by_method)
+    for number, extraction_result, stats in results:
+        stats['box'] = list(boxes[number - 1])
+        yield number, extraction_result, stats
+
+def merge_part_results(kind, part_results, text=None):
+    """Combine (extraction_result, stats) pairs of pages or tiles, in order, into one result
+    and stats dict; text replaces the default page-by-page join of the texts"""
+    extraction_result = merge_results([result for result, _ in part_results], text)
+    errors = [result['error'] for result, _ in part_results if result.get('error')]
+    if errors and len(errors) == len(part_results):
+        extraction_result['error'] = errors[0]
+    if any(result.get('timed_out') for result, _ in part_results):
+        # Later parts were skipped, the merged text is incomplete
+        extraction_result['error'] = f"Request deadline exceeded after {len(part_results) - len(errors)} {kind}s"
+        extraction_result['timed_out'] = True
+
+    part_stats = []
+    for result, stats in part_results:
+        if result.get('error'):
+            stats = dict(stats, error=result['error'])
+        part_stats.append(stats)
+    caches = [stats['cache'] for stats in part_stats]
+    stats = {
+        'cache': {
+            'hit': all(cache['hit'] for cache in caches),
+            'tier': None,
+            'lookup_ms': round(sum(cache['lookup_ms'] for cache in caches), 3)
+        },
+        f'{kind}_count': len(part_stats),
+        f'{kind}_errors': len(errors),
+        f'{kind}s': part_stats
+    }
+    tokens = [part['tokens'] for part in part_stats if part.get('tokens')]
+    if tokens:
+        stats['tokens'] = {key: sum(t[key] for t in tokens) for key in ('prompt', 'response', 'total')}
+    return extraction_result, stats
+
+def merge_page_results(page_results):
+    return merge_part_results('page', page_results)
+
+def merge_tile_results(columns, tile_results):
+    """Merge tile results in reading order, stitching their texts across the overlaps"""
+    texts = ['' if result.get('error') else result.get('text', '') for result, _ in tile_results]
+    return merge_part_results('tile', tile_results, stitch_text(texts, columns))
+
+def _error_result(e):
+    result = empty_result(f"Error: {str(e)}")
+    result['error'] = str(e)
+    return result, {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+
+def _tile_layout(image_bytes):
+    return tile_layout(image_bytes, app.config['TILE_MIN_SIDE'], app.config['TILE_SIZE'],
+                       app.config['TILE_OVERLAP'])
+
+def extract_image(image_bytes, method, language='eng'):
+    """extract_by_method for one image, splitting it into overlapping tiles when its longest
+    side exceeds TILE_MIN_SIDE"""
+    layout = _tile_layout(image_bytes)
+    if layout is None:
+        return extract_by_method(image_bytes, method, language)
+    columns, boxes = layout
+    tile_results = {number: (result, stats)
+                    for number, result, stats in iter_tile_results(image_bytes, boxes, method, language)}
+    return merge_tile_results(columns, [tile_results[number] for number in sorted(tile_results)])
+
+def extract_document(image_bytes, method, language='eng'):
+    """extract_image for any upload: PDFs and multi-frame images are split into pages,
+    extracted in parallel and merged into one result"""
+    if not is_multi_page(image_bytes):
+        extraction_result, stats = extract_image(image_bytes, method, language)
+    else:
+        try:
+            page_results = {number: (result, stats)
+                            for number, result, stats in iter_page_results(image_bytes, method, language)}
+            extraction_result, stats = merge_page_results([page_results[number] for number in sorted(page_results)])
+        except PageError as e:
+            extraction_result, stats = _error_result(e)
+    metrics.increment('extractions', method=method, outcome=extraction_outcome(extraction_result))
+    return extraction_result, stats
+
+async def offload(executor, fn, *args):
+    """Await fn(*args) run on a thread pool with the caller's deadline and request timings"""
+    return await asyncio.wrap_future(deadlines.submit(executor, fn, *args))
+
+async def extract_text_gemini_async(image_bytes, mime_type=None, stats=None):
+    """extract_text_gemini for the event loop: the API call is awaited instead of holding a thread"""
+    gemini_client = engines.get('gemini')
+    if gemini_client is None:
+        return extract_text_gemini(image_bytes, mime_type, stats)
+    try:
+        if mime_type:
+            contents, options = build_gemini_request(image_bytes, mime_type)
+        else:
+            # The image has to be decoded first
+            contents, options = await offload(get_offload_executor(), build_gemini_request, image_bytes)
+        response = await gemini_client.generate_content_async(contents, **options)
+        record_token_usage(response, stats)
+        return parse_extraction_response(response.text)
+    except (RateLimited, CircuitOpen) as e:
+        return retry_later_result(e)
+    except DeadlineExceeded as e:
+        return deadline_result(e)
+    except Exception as e:
+        result = empty_result(f"Error with Gemini Vision API: {str(e)}")
+        result['error'] = str(e)
+        return result
+
+async def extract_text_cached_async(image_bytes):
+    """extract_text_cached for the event loop; cache and preprocessing run on the offload pool"""
+    stats = {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    executor = get_offload_executor()
+    cached, key, image_hash = await offload(executor, lookup_result, image_bytes, stats)
+    if cached is not None:
+        return cached, stats
+    payload, mime_type = await offload(executor, prepare_gemini_payload, image_bytes, stats)
+    extraction_result = await extract_text_gemini_async(payload, mime_type, stats)
+    await offload(executor, store_result, key, image_hash, extraction_result)
+    return extraction_result, stats
+
+def _is_single_image(image_bytes):
+    return not is_multi_page(image_bytes) and _tile_layout(image_bytes) is None
+
+async def extract_document_async(image_bytes, method, language='eng'):
+    """extract_document for the event loop. Single images with method=gemini await the API call;
+    other methods, multi-page documents and tiled scans run whole on the batch pool."""
+    if (method != 'gemini' or deadlines.expired()
+            or not await offload(get_offload_executor(), _is_single_image, image_bytes)):
+        return await offload(get_batch_executor(), extract_document, image_bytes, method, language)
+    extraction_result, stats = await extract_text_cached_async(image_bytes)
+    if (extraction_result.get('error') and app.config['BREAKER_FALLBACK'] == 'tesseract'
+            and not deadlines.expired() and gemini_circuit_open()):
+        extraction_result, stats = await offload(get_batch_executor(), extract_text_fallback, image_bytes,
+                                                 language, extraction_result['error'])
+    metrics.increment('extractions', method=method, outcome=extraction_outcome(extraction_result))
+    return extraction_result, stats
+
+def store_extraction(image_bytes, extraction_result, filename, method, language):
+    """Queue a successful extraction for /api/search when the result store is enabled"""
+    if result_store is not None and not extraction_result.get('error'):
+        result_store.add(image_bytes, extraction_result, filename, method, language)
+
+def extraction_outcome(extraction_result):
+    """'ok', or the kind of error of a failed extraction result"""
+    if not extraction_result.get('error'):
+        return 'ok'
+    if extraction_result.get('timed_out'):
+        return 'timed_out'
+    if 'retry_after' in extraction_result:
+        return 'unavailable'
+    return 'error'
+
+# Sections of format_extracted_info in display order: (section, heading, (field, label) pairs).
+# Sections without a heading are listed as plain lines, the others as bullet lists.
+FORMATTED_FIELDS = (
+    ('personal_info', None, (('name', 'Name'), ('phone', 'Phone'), ('email', 'Email'),
+                             ('date_of_birth', 'Date of Birth'), ('other_personal', 'Other Personal Info'))),
+    ('transactional_info', 'Transactional Information', (
+        ('invoice_number', 'Invoice'), ('order_id', 'Order ID'), ('total_amount', 'Total Amount'),
+        ('payment_method', 'Payment Method'), ('other_transactional', 'Other Transaction Info'))),
+    ('dates', 'Dates', (('due_date', 'Due Date'), ('issue_date', 'Issue Date'), ('other_dates', 'Other Dates'))),
+    ('locations', None, (('addresses', 'Address'), ('other_locations', 'Other Locations'))),
+)
 
 def format_extracted_info(extraction_result):
     """Format all extracted information into a single readable text"""
-    if not isinstance(extraction_result, dict):
+    if not isinstance(extraction_result, Mapping):
         return "No identifiable information found."
-    
+    extraction_result = ExtractionResult.from_dict(extraction_result)
+
     formatted_info = []
-    
-    # Personal Information
-    personal_info = extraction_result.get('personal_info', {})
-    if personal_info.get('name'):
-        formatted_info.append(f"Name: {personal_info['name']}")
-    if personal_info.get('phone'):
-        formatted_info.append(f"Phone: {personal_info['phone']}")
-    if personal_info.get('email'):
-        formatted_info.append(f"Email: {personal_info['email']}")
-    if personal_info.get('date_of_birth'):
-        formatted_info.append(f"Date of Birth: {personal_info['date_of_birth']}")
-    if personal_info.get('other_personal'):
-        formatted_info.append(f"Other Personal Info: {personal_info['other_personal']}")
-    
-    # Transactional Information
-    transactional_info = extraction_result.get('transactional_info', {})
-    trans_items = []
-    if transactional_info.get('invoice_number'):
-        trans_items.append(f"Invoice: {transactional_info['invoice_number']}")
-    if transactional_info.get('order_id'):
-        trans_items.append(f"Order ID: {transactional_info['order_id']}")
-    if transactional_info.get('total_amount'):
-        trans_items.append(f"Total Amount: {transactional_info['total_amount']}")
-    if transactional_info.get('payment_method'):
-        trans_items.append(f"Payment Method: {transactional_info['payment_method']}")
-    if transactional_info.get('other_transactional'):
-        trans_items.append(f"Other Transaction Info: {transactional_info['other_transactional']}")
-    
-    if trans_items:
-        formatted_info.append("Transactional Information:")
-        for item in trans_items:
-            formatted_info.append(f"  - {item}")
-    
-    # Dates
-    dates = extraction_result.get('dates', {})
-    date_items = []
-    if dates.get('due_date'):
-        date_items.append(f"Due Date: {dates['due_date']}")
-    if dates.get('issue_date'):
-        date_items.append(f"Issue Date: {dates['issue_date']}")
-    if dates.get('other_dates'):
-        date_items.append(f"Other Dates: {dates['other_dates']}")
-    
-    if date_items:
-        formatted_info.append("Dates:")
-        for item in date_items:
-            formatted_info.append(f"  - {item}")
-    
-    # Locations
-    locations = extraction_result.get('locations', {})
-    if locations.get('addresses'):
-        formatted_info.append(f"Address: {locations['addresses']}")
-    if locations.get('other_locations'):
-        formatted_info.append(f"Other Locations: {locations['other_locations']}")
-    
-    # Other Data
-    if extraction_result.get('other_data'):
-        formatted_info.append(f"Other Structured Data: {extraction_result['other_data']}")
-    
+    for section_name, heading, fields in FORMATTED_FIELDS:
+        section = extraction_result.section(section_name)
+        items = [f"{label}: {section[name]}" for name, label in fields if section[name]]
+        if heading is None:
+            formatted_info.extend(items)
+        elif items:
+            formatted_info.append(f"{heading}:")
+            formatted_info.extend(f"  - {item}" for item in items)
+
+    if extraction_result.other_data:
+        formatted_info.append(f"Other Structured Data: {extraction_result.other_data}")
+
     return '\n'.join(formatted_info) if formatted_info else "No identifiable information found."
 
+def build_preview(image_bytes, filename):
+    """Return the src for the result page image: a preview URL or an inline thumbnail,
+    None when there is nothing a browser can show"""
+    try:
+        if preview_store is not None:
+            return url_for('preview', preview_id=preview_store.put(first_page(image_bytes)))
+        return preview_data_url(make_preview(first_page(image_bytes), app.config['PREVIEW_MAX_SIDE']))
+    except Exception as e:
+        # Fall back to the original upload if Pillow cannot thumbnail it, unless it is not an image
+        print(f"DEBUG: Preview generation failed: {e}")
+        if is_pdf(image_bytes):
+            return None
+        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        return f"data:image/{filename.rsplit('.', 1)[-1].lower()};base64,{image_base64}"
+
+def warm_up():
+    """Prepare this worker process before it takes traffic (called from gunicorn.conf.py)"""
+    gemini_client = engines.get('gemini')
+    if gemini_client is not None:
+        gemini_client.warm_up()
+    if app.config['TESSERACT_PROCESSES'] > 0:
+        try:
+            engines.get('tesseract').warm()
+        except Exception as e:
+            print(f"Tesseract warm-up failed: {e}")
+    if job_workers is not None:
+        job_workers.ensure_started()
+
+def request_deadline():
+    """Deadline of the current request in seconds, from the X-Request-Deadline header or the
+    deadline form field, capped at REQUEST_MAX_DEADLINE_SECONDS. ValueError when malformed."""
+    value = request.headers.get('X-Request-Deadline') or request.values.get('deadline')
+    if not value:
+        return app.config['REQUEST_DEADLINE_SECONDS']
+    seconds = float(value)
+    if not seconds > 0:
+        raise ValueError(value)
+    return min(seconds, app.config['REQUEST_MAX_DEADLINE_SECONDS'])
+
+def with_deadline(view):
+    """Run the view (sync or async) under the request deadline; generators streamed after the
+    view returns must open their own deadline_scope"""
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                seconds = request_deadline()
+            except ValueError:
+                return jsonify({'error': 'deadline must be a positive number of seconds'}), 400
+            with deadline_scope(seconds):
+                return await view(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            seconds = request_deadline()
+        except ValueError:
+            return jsonify({'error': 'deadline must be a positive number of seconds'}), 400
+        with deadline_scope(seconds):
+            return view(*args, **kwargs)
+    return wrapper
+
+def error_status(extraction_result):
+    """HTTP status and headers for a failed extraction: 504 past the deadline, 503 with
+    Retry-After when Gemini refused the call, None otherwise"""
+    if extraction_result.get('timed_out'):
+        return 504, {}
+    if 'retry_after' in extraction_result:
+        return 503, {'Retry-After': str(max(1, round(extraction_result['retry_after'])))}
+    return None, {}
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/preview/<preview_id>')
+def preview(preview_id):
+    if preview_store is None:
+        abort(404)
+    path = preview_store.get_path(preview_id)
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype='image/webp', max_age=app.config['PREVIEW_TTL'], etag=preview_id)
+    # Previews are of user uploads, keep them out of shared caches; the id is content-addressed
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/upload', methods=['POST'])
+@with_deadline
 def upload_file():
     if 'file' not in request.files:
         flash('No file selected')
@@ -326,68 +1106,142 @@ def upload_file():
         return redirect(request.url)
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        with metrics.timed('extract_stage_seconds', stage='read_upload'):
+            image_bytes = read_upload(file)
         
-        # Convert image to base64 for display
-        with open(filepath, "rb") as image_file:
-            image_base64 = base64.b64encode(image_file.read()).decode('utf-8')
-            image_data_url = f"data:image/{filename.split('.')[-1].lower()};base64,{image_base64}"
+        # Downscaled preview for display instead of inlining the whole upload
+        with metrics.timed('extract_stage_seconds', stage='preview'):
+            image_data_url = build_preview(image_bytes, file.filename)
         
         # Extract text based on selected method
-        if method == 'gemini':
-            extraction_result = extract_text_gemini(filepath)
-        else:
-            extraction_result = {
-                "text": "Gemini API only",
-                "personal_info": {
-                    "name": "",
-                    "phone": "",
-                    "email": "",
-                    "date_of_birth": "",
-                    "other_personal": ""
-                },
-                "transactional_info": {
-                    "invoice_number": "",
-                    "order_id": "",
-                    "total_amount": "",
-                    "payment_method": "",
-                    "other_transactional": ""
-                },
-                "dates": {
-                    "due_date": "",
-                    "issue_date": "",
-                    "other_dates": ""
-                },
-                "locations": {
-                    "addresses": "",
-                    "other_locations": ""
-                },
-                "other_data": ""
-            }
-        
-        # Clean up uploaded file
-        os.remove(filepath)
+        with metrics.timed('extract_stage_seconds', stage='extract'):
+            extraction_result, stats = extract_document(image_bytes, method, language)
+        store_extraction(image_bytes, extraction_result, file.filename, method, language)
         
         # Get language name for display
         language_names = {'eng': 'English', 'jpn': 'Japanese'}
         language_display = language_names.get(language, language)
         
-        return render_template('result.html', 
-                             raw_text=extraction_result.get('text', ''),
-                             formatted_info=format_extracted_info(extraction_result),
-                             method=method.title(),
-                             language=language_display,
-                             filename=file.filename,
-                             image_data=image_data_url)
+        with metrics.timed('extract_stage_seconds', stage='format_fields'):
+            formatted_info = format_extracted_info(extraction_result)
+        with metrics.timed('extract_stage_seconds', stage='render'):
+            return render_template('result.html', 
+                                 raw_text=extraction_result.get('text', ''),
+                                 formatted_info=formatted_info,
+                                 method=method.title(),
+                                 language=language_display,
+                                 filename=file.filename,
+                                 image_data=image_data_url,
+                                 cache_info=stats['cache'],
+                                 page_count=stats.get('page_count'))
     else:
         flash('Invalid file type. Please upload an image file.')
         return redirect(request.url)
 
+def encode_event(event, payload, stream_format):
+    """One record of an sse or ndjson stream"""
+    data = dumps(payload).decode('utf-8')
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+def event_stream_response(generator, stream_format):
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    response = Response(generator, mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies such as nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _part_events(kind, results, merge):
+    """(kind, result, stats) for every page or tile as it finishes, then the merged ('result', result, stats)"""
+    part_results = {}
+    for number, part_result, part_stats in results:
+        part_results[number] = (part_result, part_stats)
+        yield kind, part_result, part_stats
+    extraction_result, stats = merge([part_results[number] for number in sorted(part_results)])
+    yield 'result', extraction_result, stats
+
+def _stream_extraction(image_bytes, method, language, filename, stream_format, deadline_seconds=None):
+    """Generator behind /api/extract?stream=true: one 'field' event per completed field, then 'done'.
+
+    Only the gemini method streams from the model; the other methods send all their
+    fields together once extraction has finished. Multi-page documents and tiled
+    images send one 'page' or 'tile' event per part as it finishes instead.
+    """
+    start = time.perf_counter()
+    first_event_ms = {}
+    extraction_result, stats = None, None
+    # The response body is generated after the view returned, outside its deadline scope
+    # and its request timings
+    with deadline_scope(deadline_seconds), metrics.collect_timings() as timings:
+        try:
+            multi_page = is_multi_page(image_bytes)
+            layout = None if multi_page else _tile_layout(image_bytes)
+            if multi_page:
+                events = _part_events('page', iter_page_results(image_bytes, method, language), merge_page_results)
+            elif layout is not None:
+                columns, boxes = layout
+                events = _part_events('tile', iter_tile_results(image_bytes, boxes, method, language),
+                                      lambda tile_results: merge_tile_results(columns, tile_results))
+            elif method == 'gemini':
+                events = stream_text_gemini(image_bytes)
+            else:
+                extraction_result, stats = extract_by_method(image_bytes, method, language)
+                events = [('field', path, value) for path, value in iter_leaves(extraction_result)]
+                events.append(('result', extraction_result, stats))
+            for kind, first, second in events:
+                if kind == 'result':
+                    extraction_result, stats = first, second
+                    continue
+                if kind not in first_event_ms:
+                    first_event_ms[kind] = round((time.perf_counter() - start) * 1000, 3)
+                    metrics.observe(f'extract_stream_first_{kind}_seconds', first_event_ms[kind] / 1000, method=method)
+                if kind in ('page', 'tile'):
+                    record = {'raw_text': first.get('text', ''), 'formatted_info': format_extracted_info(first), **second}
+                    if first.get('error'):
+                        record['error'] = first['error']
+                    yield encode_event(kind, record, stream_format)
+                else:
+                    yield encode_event('field', {'path': '.'.join(str(part) for part in first), 'value': second},
+                                       stream_format)
+        except Exception as e:
+            extraction_result = empty_result(f"Error: {str(e)}")
+            extraction_result['error'] = str(e)
+
+    total_ms = round((time.perf_counter() - start) * 1000, 3)
+    metrics.observe('extract_stream_total_seconds', total_ms / 1000, method=method)
+    metrics.increment('extractions', method=method, outcome=extraction_outcome(extraction_result))
+    store_extraction(image_bytes, extraction_result, filename, method, language)
+    stats = stats or {'cache': {'hit': False, 'tier': None, 'lookup_ms': 0.0}}
+    stream_stats = dict(stats.get('stream') or {}, first_field_ms=first_event_ms.get('field'))
+    for kind in ('page', 'tile'):
+        if kind in first_event_ms:
+            stream_stats[f'first_{kind}_ms'] = first_event_ms[kind]
+    stream_stats['total_ms'] = total_ms
+    done = {
+        'done': True,
+        'raw_text': extraction_result.get('text', ''),
+        'formatted_info': format_extracted_info(extraction_result),
+        'method': method,
+        'language': language,
+        'filename': filename,
+        **stats,
+        'stream': stream_stats,
+        'timings': timings.as_dict()
+    }
+    if extraction_result.get('error'):
+        done['error'] = extraction_result['error']
+    yield encode_event('done', done, stream_format)
+
 @app.route('/api/extract', methods=['POST'])
+@with_deadline
 def api_extract():
-    """API endpoint for text extraction"""
+    """API endpoint for text extraction.
+
+    With stream=true (or Accept: text/event-stream) the fields are sent as they
+    are completed, as format=sse (default) or format=ndjson events.
+    """
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -397,56 +1251,377 @@ def api_extract():
     
     if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type'}), 400
-    
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+
+    if wants_stream():
+        stream_format = request.values.get('format') or 'sse'
+        if stream_format not in ('ndjson', 'sse'):
+            return jsonify({'error': 'format must be ndjson or sse'}), 400
+        generator = _stream_extraction(read_upload(file), method, language, file.filename, stream_format,
+                                       deadlines.remaining())
+        return event_stream_response(generator, stream_format)
     
     try:
-        if method == 'gemini':
-            extraction_result = extract_text_gemini(filepath)
-        else:
-            extraction_result = {
-                "text": "Gemini API only",
-                "personal_info": {
-                    "name": "",
-                    "phone": "",
-                    "email": "",
-                    "date_of_birth": "",
-                    "other_personal": ""
-                },
-                "transactional_info": {
-                    "invoice_number": "",
-                    "order_id": "",
-                    "total_amount": "",
-                    "payment_method": "",
-                    "other_transactional": ""
-                },
-                "dates": {
-                    "due_date": "",
-                    "issue_date": "",
-                    "other_dates": ""
-                },
-                "locations": {
-                    "addresses": "",
-                    "other_locations": ""
-                },
-                "other_data": ""
-            }
-        
-        os.remove(filepath)
-        
-        return jsonify({
+        with metrics.timed('extract_stage_seconds', stage='read_upload'):
+            image_bytes = read_upload(file)
+        with metrics.timed('extract_stage_seconds', stage='extract'):
+            extraction_result, stats = extract_document(image_bytes, method, language)
+        store_extraction(image_bytes, extraction_result, file.filename, method, language)
+        return extraction_response(extraction_result, stats, method, language, file.filename)
+    except Exception as e:
+        metrics.increment('extractions', method=method, outcome='exception')
+        return jsonify({'error': str(e)}), 500
+
+@with_deadline
+async def api_extract_async():
+    """/api/extract as served by the ASGI app (asgi.py): same request and response, with the
+    extraction awaited on the event loop. Streamed extractions are left to api_extract."""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+
+    file = request.files['file']
+    method = request.form.get('method', 'gemini')
+    language = request.form.get('language', 'eng')
+
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    try:
+        with metrics.timed('extract_stage_seconds', stage='read_upload'):
+            image_bytes = read_upload(file)
+        with metrics.timed('extract_stage_seconds', stage='extract'):
+            extraction_result, stats = await extract_document_async(image_bytes, method, language)
+        store_extraction(image_bytes, extraction_result, file.filename, method, language)
+        return extraction_response(extraction_result, stats, method, language, file.filename)
+    except Exception as e:
+        metrics.increment('extractions', method=method, outcome='exception')
+        return jsonify({'error': str(e)}), 500
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+def wants_stream():
+    """True when an /api/extract request asks for a streamed response"""
+    return (request.values.get('stream', '').lower() == 'true'
+            or 'text/event-stream' in request.headers.get('Accept', ''))
+
+def serialized_response(payload):
+    """jsonify(payload), or MessagePack for clients that prefer it (Accept: application/msgpack)
+    when msgpack is installed"""
+    if request.accept_mimetypes.best_match(['application/json', MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE:
+        body = packb(payload)
+        if body is not None:
+            return Response(body, mimetype=MSGPACK_MIMETYPE)
+    return jsonify(payload)
+
+def extraction_response(extraction_result, stats, method, language, filename):
+    """The /api/extract JSON response (and error status) for a finished extraction"""
+    with metrics.timed('extract_stage_seconds', stage='format_fields'):
+        formatted_info = format_extracted_info(extraction_result)
+    payload = {
+        'raw_text': extraction_result.get('text', ''),
+        'formatted_info': formatted_info,
+        'method': method,
+        'language': language,
+        'filename': filename,
+        **stats
+    }
+    if extraction_result.get('error'):
+        payload['error'] = extraction_result['error']
+    payload['timings'] = g.request_timings.as_dict()
+    status, headers = error_status(extraction_result)
+    with metrics.timed('extract_stage_seconds', stage='serialize'):
+        response = serialized_response(payload)
+    if status is not None:
+        return response, status, headers
+    return response
+
+def _extract_batch_item(index, filename, image_bytes, method, language):
+    """Extract one file of a batch, never raising so one bad file cannot fail the batch"""
+    start = time.perf_counter()
+    try:
+        extraction_result, stats = extract_document(image_bytes, method, language)
+        store_extraction(image_bytes, extraction_result, filename, method, language)
+        item = {
+            'index': index,
+            'filename': filename,
             'raw_text': extraction_result.get('text', ''),
             'formatted_info': format_extracted_info(extraction_result),
-            'method': method,
-            'language': language,
-            'filename': file.filename
-        })
+            **stats
+        }
+        if extraction_result.get('error'):
+            item['error'] = extraction_result['error']
     except Exception as e:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        return jsonify({'error': str(e)}), 500
+        item = {'index': index, 'filename': filename, 'error': str(e)}
+    item['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return item
+
+def _submit_batch(files, method, language):
+    """Queue every file of a batch on the worker pool.
+
+    Returns the items rejected up front and the futures of the accepted ones.
+    """
+    rejected = []
+    futures = []
+    for index, file in enumerate(files):
+        if not allowed_file(file.filename):
+            rejected.append({'index': index, 'filename': file.filename,
+                             'error': 'Invalid file type', 'elapsed_ms': 0.0})
+            continue
+        futures.append(deadlines.submit(
+            get_batch_executor(), _extract_batch_item, index, file.filename, read_upload(file), method, language
+        ))
+    return rejected, futures
+
+def _validate_batch(files):
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    if len(files) > app.config['BATCH_MAX_FILES']:
+        return jsonify({'error': f"Too many files, the limit is {app.config['BATCH_MAX_FILES']}"}), 400
+    return None
+
+@app.route('/api/extract/batch', methods=['POST'])
+@with_deadline
+def api_extract_batch():
+    """API endpoint for extracting text from many files in one request"""
+    files = request.files.getlist('files') or request.files.getlist('file')
+    method = request.form.get('method', 'gemini')
+    language = request.form.get('language', 'eng')
+
+    error_response = _validate_batch(files)
+    if error_response:
+        return error_response
+
+    start = time.perf_counter()
+    results = [None] * len(files)
+    rejected, futures = _submit_batch(files, method, language)
+    for item in rejected:
+        results[item['index']] = item
+    for future in futures:
+        item = future.result()
+        results[item['index']] = item
+
+    return serialized_response({
+        'results': results,
+        'method': method,
+        'language': language,
+        'count': len(results),
+        'errors': sum(1 for item in results if 'error' in item),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+    })
+
+@app.route('/api/extract/stream', methods=['POST'])
+@with_deadline
+def api_extract_stream():
+    """API endpoint that streams one record per file as soon as it is extracted.
+
+    Records arrive in completion order and carry the input index. Use format=ndjson
+    (default) or format=sse, or send Accept: text/event-stream.
+    """
+    files = request.files.getlist('files') or request.files.getlist('file')
+    method = request.form.get('method', 'gemini')
+    language = request.form.get('language', 'eng')
+    stream_format = request.values.get('format')
+    if not stream_format:
+        stream_format = 'sse' if 'text/event-stream' in request.headers.get('Accept', '') else 'ndjson'
+    if stream_format not in ('ndjson', 'sse'):
+        return jsonify({'error': 'format must be ndjson or sse'}), 400
+
+    error_response = _validate_batch(files)
+    if error_response:
+        return error_response
+
+    start = time.perf_counter()
+    count = len(files)
+    rejected, futures = _submit_batch(files, method, language)
+
+    def generate():
+        errors = 0
+        for item in rejected:
+            errors += 1
+            yield encode_event('result', item, stream_format)
+        for future in as_completed(futures):
+            item = future.result()
+            if 'error' in item:
+                errors += 1
+            yield encode_event('result', item, stream_format)
+        summary = {
+            'done': True,
+            'count': count,
+            'errors': errors,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+        }
+        yield encode_event('done', summary, stream_format)
+
+    return event_stream_response(generate(), stream_format)
+
+def _run_job(job):
+    """Job handler: extract one queued image and return the API response payload"""
+    # Finish (or give up) before the lease runs out and another worker claims the job
+    with deadline_scope(app.config['JOBS_LEASE_SECONDS'] * 0.9):
+        extraction_result, stats = extract_document(job['image'], job['method'], job['language'])
+    store_extraction(job['image'], extraction_result, job['filename'], job['method'], job['language'])
+    result = {
+        'raw_text': extraction_result.get('text', ''),
+        'formatted_info': format_extracted_info(extraction_result),
+        **stats
+    }
+    if extraction_result.get('error'):
+        result['error'] = extraction_result['error']
+    return result
+
+@app.before_request
+def start_job_workers():
+    # Started lazily so each gunicorn worker gets its own threads after fork,
+    # and jobs persisted before a restart resume with the first request
+    if job_workers is not None:
+        job_workers.ensure_started()
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """API endpoint for queueing an extraction and returning immediately"""
+    if job_store is None:
+        return jsonify({'error': 'Asynchronous jobs are disabled'}), 404
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+
+    file = request.files['file']
+    method = request.form.get('method', 'gemini')
+    language = request.form.get('language', 'eng')
+
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    job_id = job_store.submit(read_upload(file), file.filename, method, language)
+    job_workers.notify()
+
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('api_get_job', job_id=job_id)
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_get_job(job_id):
+    """API endpoint for polling the status and result of a queued extraction"""
+    if job_store is None:
+        return jsonify({'error': 'Asynchronous jobs are disabled'}), 404
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = request.endpoint or 'unmatched'
+    metrics.add_in_flight('http_requests_in_flight', 1, endpoint=g.metrics_endpoint)
+    g.request_timings, g.request_timings_token = metrics.begin_request_timings()
+    # cProfile follows one thread, which on the ASGI app interleaves many requests
+    if (profiler is not None and g.metrics_endpoint in PROFILED_ENDPOINTS
+            and not request.environ.get('ocr_app.async')):
+        requested = request.headers.get('X-Profile', '').lower() == 'true'
+        if profiler.should_profile(requested):
+            g.profile = profiler.start()
+
+def finish_profile():
+    """Stop the request's profile, if any, and return the name of the written file"""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return None
+    elapsed_ms = (time.perf_counter() - g.metrics_start) * 1000
+    return profiler.stop(profile, g.metrics_endpoint, elapsed_ms)
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = g.get('metrics_endpoint', 'unmatched')
+    profile_name = finish_profile()
+    if profile_name:
+        response.headers['X-Profile-Id'] = profile_name
+    # A streamed body is produced after this; its stages are in the stream's done event
+    if 'request_timings' in g and not response.is_streamed:
+        response.headers['Server-Timing'] = g.request_timings.server_timing()
+    metrics.increment('http_requests', endpoint=endpoint, status=str(response.status_code))
+    metrics.increment('http_request_bytes', request.content_length or 0, endpoint=endpoint)
+    # Streamed bodies have no length up front; their events are counted by the stream metrics
+    if not response.is_streamed:
+        metrics.increment('http_response_bytes', response.calculate_content_length() or 0, endpoint=endpoint)
+    if 'metrics_start' in g:
+        metrics.observe('http_request_seconds', time.perf_counter() - g.metrics_start, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # Also runs when a view raised, so the gauge cannot drift upwards
+    if 'metrics_start' in g:
+        metrics.add_in_flight('http_requests_in_flight', -1, endpoint=g.metrics_endpoint)
+    if 'request_timings_token' in g:
+        metrics.end_request_timings(g.pop('request_timings_token'))
+    finish_profile()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format metrics of every worker process"""
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    rendered = metrics.render_prometheus()
+    if rendered is None:
+        return jsonify({'error': 'Prometheus metrics require prometheus_client (pip install prometheus-client)'}), 501
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
+def _iso_date(value):
+    """YYYY-MM-DD of a date query parameter, None when absent; ValueError when malformed"""
+    return datetime.date.fromisoformat(value).isoformat() if value else None
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    """Search stored extractions, newest first.
+
+    Criteria, all optional and combined: q (words of the text or fields, word* for a prefix),
+    invoice_number, order_id, email, phone, and date_from / date_to (YYYY-MM-DD) matching any
+    date of the document. Pages hold limit results; pass next_cursor back as cursor for the next.
+    """
+    if result_store is None:
+        return jsonify({'error': 'The result store is disabled'}), 404
+    try:
+        limit = int(request.args.get('limit', '20'))
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+        date_from = _iso_date(request.args.get('date_from'))
+        date_to = _iso_date(request.args.get('date_to'))
+    except ValueError:
+        return jsonify({'error': 'limit and cursor must be integers and dates YYYY-MM-DD'}), 400
+    if not 1 <= limit <= app.config['SEARCH_MAX_LIMIT']:
+        return jsonify({'error': f"limit must be between 1 and {app.config['SEARCH_MAX_LIMIT']}"}), 400
+
+    with metrics.timed('search_seconds'):
+        documents, next_cursor = result_store.search(
+            text=request.args.get('q'),
+            invoice_number=request.args.get('invoice_number'),
+            order_id=request.args.get('order_id'),
+            email=request.args.get('email'),
+            phone=request.args.get('phone'),
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            cursor=cursor
+        )
+    for document in documents:
+        document['formatted_info'] = format_extracted_info(document['result'])
+    return serialized_response({'results': documents, 'count': len(documents), 'next_cursor': next_cursor})
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    """Per-process latency and counter metrics (e.g. cold vs warm Gemini calls)"""
+    stats = {'pid': os.getpid(), 'engines_loaded': engines.loaded(), **metrics.snapshot()}
+    gemini_client = engines.get('gemini') if 'gemini' in stats['engines_loaded'] else None
+    if gemini_client is not None:
+        stats['gemini_limits'] = gemini_client.policy.snapshot()
+        if gemini_client.breaker is not None:
+            stats['gemini_circuit'] = gemini_client.breaker.snapshot()
+    if result_store is not None:
+        stats['result_store'] = result_store.snapshot()
+    return jsonify(stats)
+
+create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
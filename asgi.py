@@ -0,0 +1,157 @@
+"""
+ASGI entry point for the async serving mode.
+
+    uvicorn asgi:application --workers 2
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker -w 2 asgi:application
+
+POST /api/extract runs on the event loop (api_extract_async): the Gemini call
+is awaited, so one worker process holds as many extractions in flight as the
+outbound limits allow instead of one per thread. Every other route, and
+streamed extractions, are served by the Flask app through asgiref's WSGI
+adapter, which runs them on a thread pool as before.
+
+Needs uvicorn and asgiref, both pinned in requirements.txt.
+"""
+
+import io
+import os
+import sys
+import asyncio
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import RequestEntityTooLarge
+from app import app, api_extract_async, wants_stream, warm_up
+
+wsgi_application = WsgiToAsgi(app)
+
+
+def build_environ(scope, body):
+    """WSGI environ of an ASGI http scope with its complete body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        # Served on the event loop (see start_request_metrics)
+        'ocr_app.async': True,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            continue
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+async def read_body(receive, limit):
+    """The complete request body, or None when it exceeds limit bytes"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionResetError("Client disconnected")
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit and size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def replay(body):
+    """ASGI receive() handing out an already read body"""
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+    return receive
+
+
+async def send_response(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.items()]
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+async def extract(scope, receive, send):
+    """POST /api/extract: the Flask request cycle around the async view"""
+    try:
+        body = await read_body(receive, app.config['MAX_CONTENT_LENGTH'])
+    except ConnectionResetError:
+        return
+    if body is None:
+        await send_response(send, RequestEntityTooLarge().get_response())
+        return
+
+    context = app.request_context(build_environ(scope, body))
+    context.push()
+    if wants_stream():
+        # The event stream is produced by a sync generator; let the WSGI app serve it
+        context.pop()
+        await wsgi_application(scope, replay(body), send)
+        return
+
+    error = None
+    try:
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await api_extract_async()
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        response = app.finalize_request(rv)
+    except Exception as e:
+        error = e
+        response = app.handle_exception(e)
+    finally:
+        context.pop(error)
+    await send_response(send, response)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if os.getenv('WARM_UP_ON_START', 'true').lower() == 'true':
+                try:
+                    await asyncio.to_thread(warm_up)
+                except Exception as e:
+                    print(f"DEBUG: Warm-up failed: {e}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/api/extract':
+        await extract(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
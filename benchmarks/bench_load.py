@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Benchmark: throughput and latency under load, without the Gemini API
+
+Generates a synthetic multilingual corpus (English, Vietnamese and Japanese
+receipts, scans and phone photos) with Pillow, starts the app with
+benchmarks/gemini_stub standing in for the Gemini SDK, and drives /api/extract
+and /upload at each requested concurrency. Reports throughput, p50/p95/p99
+latency, errors and the peak RSS of the server processes.
+
+Results are compared with the saved baseline (benchmarks/baselines/bench_load.json
+by default) and the script exits with status 1 when a scenario got slower, or
+used more memory, by more than the tolerance. Save a new baseline with
+--save-baseline; baselines are only comparable on the same machine and settings.
+
+--server picks how the app is served: gunicorn (sync workers with --threads
+threads, using gunicorn.conf.py), werkzeug (one threaded process), uvicorn (the
+async ASGI app in asgi.py with --workers processes) or auto, which is gunicorn
+when installed and werkzeug otherwise. The result cache is off so every request
+reaches the (stub) engine; pass --cache to measure with it.
+
+Usage: python benchmarks/bench_load.py [--concurrency 1,8,32] [--requests 200]
+                                        [--endpoints api,upload] [--server auto]
+                                        [--workers 2] [--threads 8]
+                                        [--latency-median 1.5] [--latency-sigma 0.5]
+                                        [--save-baseline] [--tolerance 0.15]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_PATH = os.path.join(ROOT, 'benchmarks', 'gemini_stub')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'bench_load.json')
+
+ENDPOINTS = {'api': '/api/extract', 'upload': '/upload'}
+
+LINES = {
+    'eng': [
+        "SUPERMARKET RECEIPT   Invoice INV-2024-0042",
+        "Date: 12/03/2024   Cashier: 07   Till: 3",
+        "Milk 2 x 1.99          3.98",
+        "Total: 6.47 USD   Paid by card **** 4421",
+        "123 Main Street, Springfield   +1 555 0134",
+    ],
+    'vie': [
+        "HÓA ĐƠN GIÁ TRỊ GIA TĂNG   Số: 0012345",
+        "Khách hàng: Nguyễn Văn A   ĐT: 0901 234 567",
+        "Địa chỉ: 1 Phạm Văn Bạch, Cầu Giấy, Hà Nội",
+        "Tổng cộng: 1.234.000 VND",
+        "Hình thức thanh toán: Chuyển khoản",
+    ],
+    'jpn': [
+        "領収書   注文番号 ORD-88231",
+        "株式会社サンプル商事 御中",
+        "発行日 2024年4月1日",
+        "合計金額 ¥12,800 (税込)",
+        "東京都千代田区丸の内1-1-1   03-1234-5678",
+    ],
+}
+
+# Fonts covering each script, when installed; Pillow's built-in font only has Latin-1
+FONT_CANDIDATES = {
+    'latin': ['DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+              '/Library/Fonts/Arial Unicode.ttf', 'C:\\Windows\\Fonts\\arial.ttf'],
+    'jpn': ['/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+            '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+            '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc', 'C:\\Windows\\Fonts\\msgothic.ttc'],
+}
+
+
+def load_font(language, size):
+    for path in FONT_CANDIDATES['jpn' if language == 'jpn' else 'latin']:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def draw_document(width, height, language, rng):
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    size = max(height // 70, 14)
+    font = load_font(language, size)
+    for y in range(size, height - 2 * size, int(size * 1.6)):
+        draw.text((width // 20, y), rng.choice(LINES[language]), fill='black', font=font)
+    return image
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def make_photo(width, height, language, rng):
+    """Document photographed on a desk with sensor noise, as a phone JPEG"""
+    background = Image.blend(Image.new('RGB', (width, height), (150, 110, 70)),
+                             Image.effect_noise((width, height), 25).convert('RGB'), 0.3)
+    page = draw_document(int(width * 0.8), int(height * 0.8), language, rng)
+    background.paste(page.rotate(rng.uniform(-3, 3), fillcolor='white'), (width // 10, height // 10))
+    return encode(background.filter(ImageFilter.GaussianBlur(0.6)), 'JPEG', quality=92)
+
+
+def build_corpus(count, seed=42):
+    """(name, filename, bytes) of count distinct images cycling through the document kinds"""
+    rng = random.Random(seed)
+    kinds = [
+        ('receipt', lambda lang: encode(draw_document(600, 1400, lang, rng), 'PNG'), 'png'),
+        ('scan', lambda lang: encode(draw_document(1240, 1754, lang, rng), 'PNG'), 'png'),
+        ('photo', lambda lang: make_photo(2048, 1536, lang, rng), 'jpg'),
+        ('id card', lambda lang: encode(draw_document(1012, 638, lang, rng), 'JPEG', quality=90), 'jpg'),
+    ]
+    corpus = []
+    for index in range(count):
+        language = list(LINES)[index % len(LINES)]
+        kind, make, extension = kinds[(index // len(LINES)) % len(kinds)]
+        corpus.append((f"{kind} {language}", f"doc{index}.{extension}", make(language)))
+    return corpus
+
+
+def multipart(fields, filename, data):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port, data_dir):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': os.pathsep.join(filter(None, [STUB_PATH, ROOT, env.get('PYTHONPATH')])),
+        'GEMINI_API_KEY': 'benchmark',
+        'GEMINI_STUB_LATENCY_MEDIAN': str(args.latency_median),
+        'GEMINI_STUB_LATENCY_SIGMA': str(args.latency_sigma),
+        'GEMINI_STUB_ERROR_RATE': str(args.error_rate),
+        'CACHE_ENABLED': 'true' if args.cache else 'false',
+        'CACHE_DB_PATH': os.path.join(data_dir, 'results.sqlite3'),
+        'JOBS_ENABLED': 'false',
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(data_dir, 'metrics'),
+        'REQUEST_DEADLINE_SECONDS': '120',
+    })
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    server = args.server
+    if server == 'auto':
+        server = 'gunicorn' if importlib.util.find_spec('gunicorn') is not None else 'werkzeug'
+    if server == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(args.workers), '--no-access-log']
+    elif server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(args.workers), '--threads', str(args.threads), '--timeout', '120', 'app:app']
+    else:
+        command = [sys.executable, '-c', 'from werkzeug.serving import run_simple; import app; '
+                   f'run_simple("127.0.0.1", {port}, app.app, threaded=True)']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return process, server
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{server} did not start within 60 s")
+
+
+def process_tree(pid):
+    pids = [pid]
+    for parent in pids:
+        try:
+            with open(f'/proc/{parent}/task/{parent}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def tree_rss(pid):
+    """Resident memory of a process and its children in bytes (Linux), None elsewhere"""
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            if member == pid:
+                return None
+    return total
+
+
+class RSSSampler:
+    """Samples the server's total RSS in the background and keeps the peak"""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = tree_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def send(port, path, corpus, index, timeout):
+    _, filename, data = corpus[index % len(corpus)]
+    body, content_type = multipart({'method': 'gemini', 'language': 'eng'}, filename, data)
+    start = time.perf_counter()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        connection.request('POST', path, body, {'Content-Type': content_type})
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        status = response.status
+    except OSError:
+        status = None
+    return time.perf_counter() - start, status
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(port, server_pid, path, corpus, concurrency, requests, timeout):
+    # A few unmeasured requests so every worker has its client and pools up
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(lambda i: send(port, path, corpus, i, timeout), range(min(concurrency, 4))))
+
+    with RSSSampler(server_pid) as sampler, ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda i: send(port, path, corpus, i, timeout), range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, status in results if status == 200)
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status in results if status != 200),
+        'throughput_rps': round(len(latencies) / elapsed, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'peak_rss_mb': round(sampler.peak / 1024 / 1024, 1) if sampler.peak else None,
+    }
+
+
+# Metric -> True when higher is better
+COMPARED = {'throughput_rps': True, 'p95_ms': False, 'p99_ms': False, 'peak_rss_mb': False}
+
+
+def compare(result, baseline, tolerance):
+    """Names of the metrics of result that regressed against baseline by more than tolerance"""
+    regressions = []
+    for metric, higher_is_better in COMPARED.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{metric} {old:g} -> {new:g} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', default='1,8,32', help='comma separated client concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--endpoints', default='api,upload', help='comma separated: api, upload')
+    parser.add_argument('--images', type=int, default=24, help='distinct images in the corpus')
+    parser.add_argument('--server', default='auto', choices=['auto', 'gunicorn', 'werkzeug', 'uvicorn'])
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn or uvicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--latency-median', type=float, default=1.5, help='stub Gemini median latency (s)')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='stub Gemini log-normal sigma')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of stub calls failing with 429')
+    parser.add_argument('--cache', action='store_true', help='keep the result cache on')
+    parser.add_argument('--timeout', type=float, default=120.0, help='client timeout per request (s)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    args = parser.parse_args()
+
+    print("Generating corpus...")
+    corpus = build_corpus(args.images)
+    print(f"{len(corpus)} images, {sum(len(data) for _, _, data in corpus) / 1024 / 1024:.1f} MB")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('scenarios', {})
+
+    data_dir = tempfile.mkdtemp(prefix='bench_load_')
+    port = free_port()
+    process, server = start_server(args, port, data_dir)
+    print(f"Server: {server} on port {port}, stub latency median {args.latency_median:g} s "
+          f"sigma {args.latency_sigma:g}\n")
+
+    header = (f"{'scenario':<16} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | "
+              f"{'errors':>6} | {'peak RSS MB':>11} | vs baseline")
+    print(header)
+    print('-' * len(header))
+    scenarios = {}
+    regressed = False
+    try:
+        for endpoint in args.endpoints.split(','):
+            for concurrency in (int(level) for level in args.concurrency.split(',')):
+                name = f"{endpoint}@c{concurrency}"
+                result = run_scenario(port, process.pid, ENDPOINTS[endpoint], corpus, concurrency,
+                                      args.requests, args.timeout)
+                scenarios[name] = result
+                regressions = compare(result, baseline[name], args.tolerance) if name in baseline else None
+                regressed = regressed or bool(regressions)
+                verdict = '-' if regressions is None else ('; '.join(regressions) or 'ok')
+                rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else 'n/a'
+                print(f"{name:<16} | {result['throughput_rps']:>7.2f} | {result['p50_ms']:>8.1f} | "
+                      f"{result['p95_ms']:>8.1f} | {result['p99_ms']:>8.1f} | {result['errors']:>6} | "
+                      f"{rss:>11} | {verdict}")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'server': server, 'settings': {key: value for key, value in vars(args).items()
+                                                      if key not in ('baseline', 'save_baseline')},
+                       'scenarios': scenarios}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+    if regressed:
+        print(f"\nRegression beyond {args.tolerance:.0%} against the baseline.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark: payload reduction from image preprocessing
+
+Generates a synthetic corpus (scanned documents, phone photos, screenshots) with
+Pillow, runs preprocess_image over it and reports preprocessing latency, bytes
+before/after and the upload time saved at a given bandwidth.
+
+Usage: python benchmarks/bench_preprocess.py [--max-side 2048] [--format jpeg] [--quality 85]
+                                              [--skip-below-kb 256] [--bandwidth-mbps 20] [--repeat 3]
+"""
+
+import os
+import io
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter
+from preprocess import PreprocessOptions, preprocess_image
+
+LINES = [
+    "HOA DON GIA TRI GIA TANG  So: 0012345",
+    "Invoice INV-2024-0042   Date: 12/03/2024",
+    "Total amount: 1,234,000 VND   Payment: Card",
+    "Customer: Nguyen Van A   Phone: 0901 234 567",
+    "Address: 1 Pham Van Bach, Cau Giay, Ha Noi",
+]
+
+
+def draw_document(width, height, rng):
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    step = max(height // 60, 14)
+    for y in range(step, height - step, step):
+        draw.text((width // 20, y), rng.choice(LINES), fill='black')
+    return image
+
+
+def make_scan(width, height, rng):
+    """Clean black-on-white document saved as PNG, like a flatbed scan"""
+    buffer = io.BytesIO()
+    draw_document(width, height, rng).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_photo(width, height, rng):
+    """Document photographed on a coloured desk with sensor noise, saved as high quality JPEG"""
+    background = Image.new('RGB', (width, height), (150, 110, 70))
+    noise = Image.effect_noise((width, height), 25).convert('RGB')
+    background = Image.blend(background, noise, 0.3)
+    page = draw_document(int(width * 0.8), int(height * 0.8), rng).rotate(2, expand=False, fillcolor='white')
+    background.paste(page, (width // 10, height // 10))
+    background = background.filter(ImageFilter.GaussianBlur(0.6))
+    buffer = io.BytesIO()
+    background.save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def make_screenshot(width, height, rng):
+    """UI screenshot with coloured header, saved as PNG"""
+    image = draw_document(width, height, rng)
+    ImageDraw.Draw(image).rectangle((0, 0, width, height // 10), fill=(30, 90, 200))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def build_corpus(seed=42):
+    rng = random.Random(seed)
+    return [
+        ('scan A4 150dpi', make_scan(1240, 1754, rng)),
+        ('scan A4 300dpi', make_scan(2480, 3508, rng)),
+        ('photo 12MP', make_photo(4000, 3000, rng)),
+        ('photo 3MP', make_photo(2048, 1536, rng)),
+        ('screenshot', make_screenshot(1920, 1080, rng)),
+        ('small receipt', make_scan(600, 1400, rng)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-side', type=int, default=2048)
+    parser.add_argument('--format', default='jpeg', choices=['jpeg', 'webp'])
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--grayscale', default='auto', choices=['auto', 'always', 'never'])
+    parser.add_argument('--skip-below-kb', type=int, default=256)
+    parser.add_argument('--bandwidth-mbps', type=float, default=20.0,
+                        help='upstream bandwidth used to estimate upload time')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    options = PreprocessOptions(args.max_side, args.format, args.quality, args.grayscale,
+                                skip_below_bytes=args.skip_below_kb * 1024)
+    bytes_per_ms = args.bandwidth_mbps * 1_000_000 / 8 / 1000
+
+    print("Generating corpus...")
+    corpus = build_corpus()
+
+    header = f"{'image':<16} | {'before':>9} | {'after':>9} | {'ratio':>6} | {'gray':>4} | {'prep ms':>8} | {'upload saved ms':>15}"
+    print(header)
+    print('-' * len(header))
+
+    total_before = total_after = 0
+    total_prep = total_saved = 0.0
+    for name, data in corpus:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            payload, _, info = preprocess_image(data, options)
+            timings.append((time.perf_counter() - start) * 1000)
+        prep_ms = statistics.median(timings)
+        saved_ms = (len(data) - len(payload)) / bytes_per_ms - prep_ms
+
+        total_before += len(data)
+        total_after += len(payload)
+        total_prep += prep_ms
+        total_saved += saved_ms
+        print(f"{name:<16} | {len(data) / 1024:>6,.0f} KB | {len(payload) / 1024:>6,.0f} KB | "
+              f"{len(payload) / len(data):>6.2f} | {'yes' if info['grayscale'] else 'no':>4} | "
+              f"{prep_ms:>8.1f} | {saved_ms:>15.0f}")
+
+    print('-' * len(header))
+    print(f"{'total':<16} | {total_before / 1024:>6,.0f} KB | {total_after / 1024:>6,.0f} KB | "
+          f"{total_after / total_before:>6.2f} | {'':>4} | {total_prep:>8.1f} | {total_saved:>15.0f}")
+    print(f"\nUpload saved = transfer time saved at {args.bandwidth_mbps:g} Mbps minus preprocessing time.")
+
+
+if __name__ == '__main__':
+    main()
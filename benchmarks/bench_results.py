@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory per extraction result and serialization throughput
+
+Builds extraction results for a synthetic mix of English, Vietnamese and
+Japanese documents (the corpus of bench_fields.py, run through the local field
+extractor) and compares the slots-based ExtractionResult with the nested dicts
+it replaced: bytes held per result, then results per second serialized with
+json (as jsonify did, ASCII-escaped with sorted keys), results.dumps (orjson
+when installed) and results.packb (when msgpack is installed), one result at a
+time and as one batch payload. Also times loading a cached result back.
+
+Usage: python benchmarks/bench_results.py [--results 50000] [--repeat 3]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import results
+from results import ExtractionResult, dumps, loads, packb
+from field_extractor import extract_fields
+from benchmarks.bench_fields import make_corpus
+
+
+def held_bytes(build):
+    """Bytes still allocated after build() returns the objects it made"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held, objects
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--results', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(min(args.results, 3000))
+    extracted = [extract_fields(text, language) for text, language, _, _, _ in corpus]
+    # Every third result failed: an empty result with an error, as the engines return them
+    for index in range(0, len(extracted), 3):
+        failed = results.empty_result("Error with Gemini Vision API: 503 Service Unavailable")
+        failed['error'] = "503 Service Unavailable"
+        extracted[index] = failed
+    plain = [result.to_dict() for result in extracted]
+    count = args.results
+    print(f"{count} results, JSON serializer: {'orjson' if results.orjson else 'json'}, "
+          f"msgpack: {'yes' if results.msgpack else 'not installed'}\n")
+
+    # Both variants reference the same string objects, so only the containers are measured
+    dict_bytes, held_dicts = held_bytes(lambda: [_copy_containers(plain[i % len(plain)]) for i in range(count)])
+    del held_dicts
+    slot_bytes, held_results = held_bytes(lambda: [ExtractionResult.from_dict(plain[i % len(plain)])
+                                                   for i in range(count)])
+    del held_results
+    text_bytes = sum(sys.getsizeof(value) for data in plain for value in _strings(data) if value) / len(plain)
+    print(f"{'memory per result':>28} | {'bytes':>8}")
+    print('-' * 40)
+    print(f"{'nested dicts':>28} | {dict_bytes / count:>8,.0f}")
+    print(f"{'ExtractionResult':>28} | {slot_bytes / count:>8,.0f}")
+    print(f"{'(field strings, either way)':>28} | {text_bytes:>8,.0f}\n")
+
+    objects = [extracted[i % len(extracted)] for i in range(count)]
+    dicts = [plain[i % len(plain)] for i in range(count)]
+    cases = [
+        ('json, dicts (jsonify)', lambda: [json.dumps(d, sort_keys=True) for d in dicts]),
+        ('results.dumps', lambda: [dumps(r) for r in objects]),
+        ('results.dumps, sorted', lambda: [dumps(r, sort_keys=True) for r in objects]),
+        ('json batch, dicts', lambda: json.dumps({'results': dicts}, sort_keys=True)),
+        ('results.dumps batch', lambda: dumps({'results': objects}, sort_keys=True)),
+    ]
+    if results.msgpack is not None:
+        cases += [('results.packb', lambda: [packb(r) for r in objects]),
+                  ('results.packb batch', lambda: packb({'results': objects}))]
+    encoded = [dumps(r).decode('utf-8') for r in objects]
+    cases += [('load cached, json + dict', lambda: [json.loads(value) for value in encoded]),
+              ('load cached, results', lambda: [ExtractionResult.from_dict(loads(value)) for value in encoded])]
+
+    print(f"{'serialization':>28} | {'results/s':>11} | {'us/result':>9}")
+    print('-' * 56)
+    for name, fn in cases:
+        seconds = best_of(args.repeat, fn)
+        print(f"{name:>28} | {count / seconds:>11,.0f} | {seconds / count * 1e6:>9.2f}")
+
+
+def _copy_containers(data):
+    return {key: dict(value) if isinstance(value, dict) else value for key, value in data.items()}
+
+
+def _strings(data):
+    for value in data.values():
+        if isinstance(value, dict):
+            yield from value.values()
+        else:
+            yield value
+
+
+if __name__ == '__main__':
+    main()
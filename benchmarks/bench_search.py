@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: result store write throughput and /api/search query latency
+
+Fills a fresh result store with extraction results for a synthetic mix of
+English, Vietnamese and Japanese documents (the corpus of bench_fields.py, run
+through the local field extractor), reporting documents written per second and
+the size of the database. Then times each kind of query the search endpoint
+runs: exact invoice number and phone lookups, full-text words (common, rare,
+prefix), narrow and wide date ranges, combinations, and paging deep into a
+broad result set.
+
+Usage: python benchmarks/bench_search.py [--documents 200000] [--repeat 20] [--db PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_store import ResultStore
+from results import ExtractionResult
+from field_extractor import extract_fields
+from benchmarks.bench_fields import make_corpus
+
+# Distinct documents extracted; larger stores repeat them with unique invoice numbers
+DISTINCT_DOCUMENTS = 20000
+
+
+def fill(store, count):
+    corpus = make_corpus(min(count, DISTINCT_DOCUMENTS))
+    extracted = [(extract_fields(text, language), language, text) for text, language, _, _, _ in corpus]
+    start = time.perf_counter()
+    for index in range(count):
+        result, language, text = extracted[index % len(extracted)]
+        if index >= len(extracted):
+            result = ExtractionResult.from_dict(result.to_dict())
+            result['transactional_info']['invoice_number'] = f"R{index:08d}"
+        # Through the background writer as in the app, without overrunning its queue
+        while not store.add(f"{index}:{text}".encode('utf-8'), result, f"scan-{index}.png", 'local', language):
+            time.sleep(0.01)
+    store.flush()
+    return time.perf_counter() - start
+
+
+def timed(repeat, fn):
+    """Median milliseconds of fn() and what it returned"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, value
+
+
+def walk(store, pages, **criteria):
+    """Follow the cursor through up to pages pages; the documents seen"""
+    cursor, seen = None, 0
+    for _ in range(pages):
+        documents, cursor = store.search(cursor=cursor, **criteria)
+        seen += len(documents)
+        if cursor is None:
+            break
+    return [None] * seen, cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', help='database file (default: a temporary one)')
+    args = parser.parse_args()
+
+    directory = None
+    db_path = args.db
+    if db_path is None:
+        directory = tempfile.TemporaryDirectory()
+        db_path = os.path.join(directory.name, 'results.sqlite3')
+    store = ResultStore(db_path, batch_size=500)
+    conn = store._connection()
+    if not conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone():
+        seconds = fill(store, args.documents)
+        print(f"wrote {args.documents} documents in {seconds:.1f} s ({args.documents / seconds:,.0f}/s)")
+    documents = conn.execute("SELECT count(*) FROM documents").fetchone()[0]
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = os.path.getsize(db_path)
+    print(f"{documents} documents, {size / 1024 / 1024:,.0f} MB ({size / documents:,.0f} B per document)\n")
+
+    invoice = conn.execute("SELECT value FROM document_keys WHERE kind = 'invoice' AND value LIKE 'INV-%'"
+                           " ORDER BY document_id LIMIT 1 OFFSET 100").fetchone()[0]
+    phone = conn.execute("SELECT value FROM document_keys WHERE kind = 'phone'"
+                         " ORDER BY document_id LIMIT 1 OFFSET 100").fetchone()[0]
+    cases = [
+        ('invoice number', dict(invoice_number=invoice)),
+        ('phone', dict(phone=phone)),
+        ('word, common', dict(text='Total')),
+        ('word, rare', dict(text='Springfield Khan')),
+        ('word prefix', dict(text='Nguy*')),
+        ('Japanese phrase', dict(text='株式会社サンプル')),
+        ('dates, one day', dict(date_from='2023-03-14', date_to='2023-03-14')),
+        ('dates, one year', dict(date_from='2023-01-01', date_to='2023-12-31')),
+        ('word + one week', dict(text='Coffee', date_from='2023-03-01', date_to='2023-03-07')),
+        ('word + one year', dict(text='Coffee', date_from='2023-01-01', date_to='2023-12-31')),
+        ('invoice + word', dict(invoice_number=invoice, text='Total')),
+        ('no criteria', dict()),
+    ]
+    print(f"{'query (20 per page)':>24} | {'ms':>8} | {'results':>7} | more")
+    print('-' * 52)
+    for name, criteria in cases:
+        ms, (found, cursor) = timed(args.repeat, lambda: store.search(limit=20, **criteria))
+        print(f"{name:>24} | {ms:>8.2f} | {len(found):>7} | {'yes' if cursor else 'no'}")
+    for pages in (10, 100):
+        ms, (found, cursor) = timed(max(1, args.repeat // 5), lambda: walk(store, pages, text='Total', limit=20))
+        print(f"{f'word, {pages} pages':>24} | {ms:>8.2f} | {len(found):>7} | {'yes' if cursor else 'no'}")
+
+    if directory is not None:
+        directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: worker start-up time
+
+Starts fresh interpreters and measures how long `import app` takes and how long
+until the first request (GET / through the test client) has been answered.
+The 'eager' mode imports the engine SDKs up front (openai, google.generativeai,
+pytesseract, when installed), like app.py did before engines were loaded on
+first use; 'lazy' is the current behaviour.
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--importtime]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER_MODULES = ['openai', 'google.generativeai', 'pytesseract']
+
+CHILD = """
+import time, json, importlib
+start = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+sdk_done = time.perf_counter()
+import app
+import_done = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/')
+first_done = time.perf_counter()
+print(json.dumps({{
+    'sdk_ms': (sdk_done - start) * 1000,
+    'import_ms': (import_done - start) * 1000,
+    'first_request_ms': (first_done - start) * 1000,
+    'status': response.status_code,
+    'engines_loaded': app.engines.loaded()
+}}))
+"""
+
+
+def installed(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def child_env(data_dir):
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'benchmark')
+    env['CACHE_DB_PATH'] = os.path.join(data_dir, 'results.sqlite3')
+    env['JOBS_DB_PATH'] = os.path.join(data_dir, 'jobs.sqlite3')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    return env
+
+
+def run_once(modules, env):
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD.format(modules=modules)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def top_imports(env, count):
+    """Slowest modules by cumulative import time, from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='bench_startup_')
+    env = child_env(data_dir)
+    eager = [name for name in EAGER_MODULES if installed(name)]
+    print(f"SDKs imported in eager mode: {', '.join(eager) or 'none installed'}\n")
+
+    print(f"{'mode':>6} | {'SDK ms':>8} | {'import ms':>9} | {'first request ms':>16} | engines loaded")
+    print('-' * 70)
+    for mode, modules in (('eager', eager), ('lazy', [])):
+        runs = [run_once(modules, env) for _ in range(args.runs)]
+        sdk_ms = statistics.median(r['sdk_ms'] for r in runs)
+        import_ms = statistics.median(r['import_ms'] for r in runs)
+        first_ms = statistics.median(r['first_request_ms'] for r in runs)
+        loaded = ', '.join(runs[-1]['engines_loaded']) or '-'
+        print(f"{mode:>6} | {sdk_ms:>8.1f} | {import_ms:>9.1f} | {first_ms:>16.1f} | {loaded}")
+
+    if args.importtime:
+        print("\nSlowest imports (lazy, cumulative ms):")
+        for cumulative, name in top_imports(env, 15):
+            print(f"{cumulative / 1000:>9.1f}  {name}")
+
+    print(f"\nMedians over {args.runs} fresh interpreters; times include interpreter start-up of the snippet only.")
+
+
+if __name__ == '__main__':
+    main()
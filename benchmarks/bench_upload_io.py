@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: disk-based vs in-memory upload handling
+
+Compares the old request path (werkzeug spooling, file.save, Image.open(path),
+re-reading the file for base64, os.remove) with the in-memory path used by the
+app (SpoolingRequest + read_upload), for a few upload sizes.
+
+Usage: python benchmarks/bench_upload_io.py [--iterations 30]
+"""
+
+import os
+import io
+import sys
+import time
+import base64
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from flask import Request
+from werkzeug.test import EnvironBuilder
+from upload_buffer import SpoolingRequest, read_upload
+
+
+def make_image(width, height, quality):
+    """Draw a noisy document-like JPEG so it does not compress to nothing"""
+    image = Image.effect_noise((width, height), 40).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for y in range(20, height, 30):
+        draw.text((20, y), "Invoice INV-2024-0042  Total 1,234,000 VND", fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def build_environ(data):
+    builder = EnvironBuilder(method='POST', data={'file': (io.BytesIO(data), 'scan.jpg')})
+    try:
+        environ = builder.get_environ()
+        # Serve the body from memory, like a socket buffer, so only the handler's own I/O is counted
+        environ['wsgi.input'] = io.BytesIO(environ['wsgi.input'].read())
+        return environ
+    finally:
+        builder.close()
+
+
+def read_io_counters():
+    """Bytes moved through read/write syscalls by this process (Linux only)"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def disk_path(environ, upload_dir):
+    file = Request(environ).files['file']
+    filepath = os.path.join(upload_dir, 'scan.jpg')
+    file.save(filepath)
+    with open(filepath, 'rb') as image_file:
+        base64.b64encode(image_file.read())
+    Image.open(filepath).load()
+    os.remove(filepath)
+
+
+def memory_path(environ, upload_dir):
+    file = SpoolingRequest(environ).files['file']
+    image_bytes = read_upload(file)
+    base64.b64encode(image_bytes)
+    Image.open(io.BytesIO(image_bytes)).load()
+
+
+def run(handler, data, iterations, upload_dir):
+    environs = [build_environ(data) for _ in range(iterations)]
+    timings = []
+    before = read_io_counters()
+    for environ in environs:
+        start = time.perf_counter()
+        handler(environ, upload_dir)
+        timings.append((time.perf_counter() - start) * 1000)
+    after = read_io_counters()
+    io_per_request = None
+    if before and after:
+        io_per_request = sum(b - a for a, b in zip(before, after)) / iterations
+    return statistics.median(timings), io_per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=30)
+    args = parser.parse_args()
+
+    sizes = [(800, 600, 85), (2000, 1500, 90), (4000, 3000, 95)]
+    upload_dir = tempfile.mkdtemp(prefix='bench_upload_')
+
+    print(f"{'upload':>10} | {'disk ms':>9} | {'memory ms':>9} | {'disk I/O':>12} | {'memory I/O':>12}")
+    print('-' * 64)
+    for width, height, quality in sizes:
+        data = make_image(width, height, quality)
+        disk_ms, disk_io = run(disk_path, data, args.iterations, upload_dir)
+        memory_ms, memory_io = run(memory_path, data, args.iterations, upload_dir)
+
+        def fmt(value):
+            return f"{value / 1024:,.0f} KB" if value is not None else 'n/a'
+
+        print(f"{len(data) / 1024:>7,.0f} KB | {disk_ms:>9.2f} | {memory_ms:>9.2f} | "
+              f"{fmt(disk_io):>12} | {fmt(memory_io):>12}")
+
+    os.rmdir(upload_dir)
+    print("\nI/O is file bytes read and written per request (rchar + wchar from /proc/self/io).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Local stand-in for the google.generativeai SDK, used by benchmarks/bench_load.py.
+
+Put benchmarks/gemini_stub first on PYTHONPATH and the app's GeminiClient talks
+to this module instead of the API: no network, no quota. generate_content()
+(and its async variant) sleeps for a latency drawn from a log-normal
+distribution and returns a canned extraction reply in the JSON shape the app
+asks for, with token usage.
+Both are derived from a hash of the image, so the same corpus produces the
+same latencies on every run and results stay comparable with a baseline.
+
+Tuned with environment variables:
+    GEMINI_STUB_LATENCY_MEDIAN  median call latency in seconds (default 1.5)
+    GEMINI_STUB_LATENCY_SIGMA   log-normal sigma, the spread of the tail (default 0.5)
+    GEMINI_STUB_TTFB_SHARE      share of the latency before the first streamed chunk (default 0.4)
+    GEMINI_STUB_ERROR_RATE      share of calls failing with a 429 (default 0)
+"""
+
+import os
+import io
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+LATENCY_MEDIAN = float(os.getenv('GEMINI_STUB_LATENCY_MEDIAN', '1.5'))
+LATENCY_SIGMA = float(os.getenv('GEMINI_STUB_LATENCY_SIGMA', '0.5'))
+TTFB_SHARE = float(os.getenv('GEMINI_STUB_TTFB_SHARE', '0.4'))
+ERROR_RATE = float(os.getenv('GEMINI_STUB_ERROR_RATE', '0'))
+
+# Characters per streamed chunk, about what the API sends
+CHUNK_CHARS = 48
+
+_errors = random.Random()
+_errors_lock = threading.Lock()
+
+REPLIES = [
+    {
+        "text": "SUPERMARKET RECEIPT\nInvoice INV-2024-0042\nDate: 12/03/2024\nMilk 2 x 1.99\nBread 2.49\n"
+                "Total: 6.47 USD\nPaid by card **** 4421\n123 Main Street, Springfield",
+        "personal_info": {"name": "", "phone": "+1 555 0134", "email": "", "date_of_birth": "",
+                          "other_personal": ""},
+        "transactional_info": {"invoice_number": "INV-2024-0042", "order_id": "", "total_amount": "6.47 USD",
+                               "payment_method": "Card", "other_transactional": "Milk 2 x 1.99, Bread 2.49"},
+        "dates": {"due_date": "", "issue_date": "12/03/2024", "other_dates": ""},
+        "locations": {"addresses": "123 Main Street, Springfield", "other_locations": "Springfield"},
+        "other_data": ""
+    },
+    {
+        "text": "HÓA ĐƠN GIÁ TRỊ GIA TĂNG\nSố: 0012345\nNgày 05 tháng 06 năm 2024\nKhách hàng: Nguyễn Văn A\n"
+                "Điện thoại: 0901 234 567\nĐịa chỉ: 1 Phạm Văn Bạch, Cầu Giấy, Hà Nội\n"
+                "Tổng cộng: 1.234.000 VND\nHình thức thanh toán: Chuyển khoản",
+        "personal_info": {"name": "Nguyễn Văn A", "phone": "0901 234 567", "email": "", "date_of_birth": "",
+                          "other_personal": ""},
+        "transactional_info": {"invoice_number": "0012345", "order_id": "", "total_amount": "1.234.000 VND",
+                               "payment_method": "Chuyển khoản", "other_transactional": ""},
+        "dates": {"due_date": "", "issue_date": "05/06/2024", "other_dates": ""},
+        "locations": {"addresses": "1 Phạm Văn Bạch, Cầu Giấy, Hà Nội", "other_locations": "Hà Nội"},
+        "other_data": ""
+    },
+    {
+        "text": "領収書\n株式会社サンプル商事 御中\n発行日 2024年4月1日\n注文番号 ORD-88231\n"
+                "合計金額 ¥12,800 (税込)\nお支払い方法 クレジットカード\n東京都千代田区丸の内1-1-1\n"
+                "電話 03-1234-5678",
+        "personal_info": {"name": "", "phone": "03-1234-5678", "email": "", "date_of_birth": "",
+                          "other_personal": ""},
+        "transactional_info": {"invoice_number": "", "order_id": "ORD-88231", "total_amount": "¥12,800",
+                               "payment_method": "クレジットカード", "other_transactional": "税込"},
+        "dates": {"due_date": "", "issue_date": "2024年4月1日", "other_dates": ""},
+        "locations": {"addresses": "東京都千代田区丸の内1-1-1", "other_locations": "東京都"},
+        "other_data": "株式会社サンプル商事"
+    },
+]
+
+
+class ResourceExhausted(Exception):
+    code = 429
+
+
+def configure(**kwargs):
+    pass
+
+
+class _Usage:
+    def __init__(self, prompt, response):
+        self.prompt_token_count = prompt
+        self.candidates_token_count = response
+        self.total_token_count = prompt + response
+
+
+class _Response:
+    def __init__(self, text, prompt_tokens, response_tokens):
+        self.text = text
+        self.usage_metadata = _Usage(prompt_tokens, response_tokens)
+
+
+def _image_digest(contents):
+    """Hash of the image part: raw bytes, or the pixels of a PIL image"""
+    digest = hashlib.sha256()
+    for part in contents:
+        if isinstance(part, dict):
+            digest.update(part.get('data', b''))
+        elif hasattr(part, 'tobytes'):
+            buffer = io.BytesIO()
+            part.save(buffer, 'PNG')
+            digest.update(buffer.getvalue())
+    return digest.digest()
+
+
+def _plan(contents, kwargs):
+    """(latency seconds, reply text, prompt tokens, response tokens) for one call"""
+    rng = random.Random(_image_digest(contents))
+    latency = rng.lognormvariate(math.log(LATENCY_MEDIAN), LATENCY_SIGMA) if LATENCY_MEDIAN > 0 else 0.0
+    text = json.dumps(rng.choice(REPLIES), ensure_ascii=False)
+    if 'generation_config' not in kwargs:
+        # Prompt mode: the model tends to wrap its JSON in a code block
+        text = '```json\n' + text + '\n```'
+    prompt_tokens = 258 + (40 if 'generation_config' in kwargs else 900)
+    return latency, text, prompt_tokens, len(text) // 3
+
+
+def _maybe_fail():
+    with _errors_lock:
+        failed = ERROR_RATE > 0 and _errors.random() < ERROR_RATE
+    if failed:
+        raise ResourceExhausted('429 Resource has been exhausted (e.g. check quota).')
+
+
+class GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        latency, text, prompt_tokens, response_tokens = _plan(contents, kwargs)
+        timeout = (kwargs.get('request_options') or {}).get('timeout')
+        _maybe_fail()
+        if stream:
+            return self._stream(latency, text, prompt_tokens, response_tokens, timeout)
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError('504 Deadline Exceeded')
+        time.sleep(latency)
+        return _Response(text, prompt_tokens, response_tokens)
+
+    async def generate_content_async(self, contents, **kwargs):
+        latency, text, prompt_tokens, response_tokens = _plan(contents, kwargs)
+        timeout = (kwargs.get('request_options') or {}).get('timeout')
+        _maybe_fail()
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError('504 Deadline Exceeded')
+        await asyncio.sleep(latency)
+        return _Response(text, prompt_tokens, response_tokens)
+
+    def _stream(self, latency, text, prompt_tokens, response_tokens, timeout):
+        chunks = [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+        gap = latency * (1 - TTFB_SHARE) / len(chunks)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        time.sleep(latency * TTFB_SHARE)
+        for chunk in chunks:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError('504 Deadline Exceeded')
+            yield _Response(chunk, prompt_tokens, response_tokens)
+            time.sleep(gap)
+
+    def count_tokens(self, contents):
+        time.sleep(0.02)
+        return _Usage(len(str(contents)) // 4, 0)
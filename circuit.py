@@ -0,0 +1,109 @@
+"""
+Circuit breaker for upstream engine calls.
+
+When the share of failed calls within the last window_seconds crosses
+failure_rate (and at least min_calls were made), the circuit opens: calls fail
+immediately with CircuitOpen for open_seconds instead of piling up behind a
+failing upstream, and callers can route the work to a local engine. After that
+one probe call is let through (half-open); its success closes the circuit, a
+failure opens it again. State is kept per worker process.
+"""
+
+import time
+import threading
+from collections import deque
+import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """The circuit is open; retry_after is the time until the next probe (seconds)"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over a sliding time window"""
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window_seconds=30.0, open_seconds=30.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # (monotonic time, succeeded) of recent calls
+        self._outcomes = deque()
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            print(f"DEBUG: Circuit {self.name} {self.state} -> {state}")
+            metrics.increment('circuit_transitions', circuit=self.name, state=state)
+            self.state = state
+
+    def retry_after(self):
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def is_open(self):
+        """True while calls would be refused, without taking the half-open probe"""
+        with self._lock:
+            if self.state == OPEN:
+                return self.retry_after() > 0
+            return self.state == HALF_OPEN and self._probe_in_flight
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go ahead now; returns True for the half-open probe"""
+        with self._lock:
+            if self.state == OPEN and self.retry_after() <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            metrics.increment('circuit_rejected', circuit=self.name)
+            raise CircuitOpen(f"{self.name} circuit is open after repeated upstream errors",
+                              retry_after=max(1.0, self.retry_after()))
+
+    def record(self, succeeded, probe=False):
+        """Report the outcome of a call allowed by before_call(), passing back its probe flag"""
+        now = time.monotonic()
+        with self._lock:
+            if probe:
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                if succeeded:
+                    self._set_state(CLOSED)
+                else:
+                    self._opened_at = now
+                    self._set_state(OPEN)
+                return
+            self._outcomes.append((now, succeeded))
+            while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+                self._outcomes.popleft()
+            if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if failures / len(self._outcomes) >= self.failure_rate:
+                self._opened_at = now
+                self._set_state(OPEN)
+
+    def cancel(self, probe=False):
+        """Forget a call allowed by before_call() that was cancelled before it had an outcome"""
+        if probe:
+            with self._lock:
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {'state': self.state, 'calls': len(self._outcomes), 'failures': failures,
+                    'retry_after': round(self.retry_after(), 3) if self.state == OPEN else None}
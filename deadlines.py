@@ -0,0 +1,62 @@
+"""
+Per-request deadlines.
+
+A deadline is set once per request with deadline_scope() and consulted wherever
+work starts: engine calls get the remaining time as their timeout, retries stop
+once it has passed, and queued pages, tiles or batch files are skipped. It is
+kept in a ContextVar, so work handed to a thread pool must go through submit()
+to carry the deadline along.
+"""
+
+import time
+import contextvars
+from contextlib import contextmanager
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time"""
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Run the block with a deadline seconds from now; None or 0 means no deadline"""
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline (may be negative), None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(what='Request'):
+    """Raise DeadlineExceeded once the current deadline has passed"""
+    if expired():
+        raise DeadlineExceeded(f"{what} deadline exceeded")
+
+
+def timeout(default=None):
+    """Timeout for a blocking call: the time left, capped at default; raises when none is left"""
+    check()
+    left = remaining()
+    if left is None:
+        return default
+    return left if default is None else min(left, default)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit() running fn with the caller's deadline"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,45 @@
+"""
+Registry of extraction engines.
+
+Engines are registered with a factory and only built, together with the SDK
+they import, the first time a request needs them. Worker boot therefore does
+not pay for SDKs that a deployment never uses.
+"""
+
+import time
+import threading
+import metrics
+
+
+class EngineRegistry:
+    """Named engines created on first use"""
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Register (or replace) an engine factory; drops any instance already built"""
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name):
+        """Return the engine, building it on first use; None when the factory returns None"""
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown engine: {name}")
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                metrics.observe('engine_load_seconds', time.perf_counter() - start, engine=name)
+            return self._instances[name]
+
+    def loaded(self):
+        """Names of the engines built so far in this process"""
+        return sorted(self._instances)
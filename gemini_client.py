@@ -0,0 +1,220 @@
+"""
+Process-wide Gemini client.
+
+The SDK is configured and the GenerativeModel created once per worker process
+and reused by every request, so the underlying connection to the API stays
+open between calls. After a fork (gunicorn workers) the client is rebuilt in
+the child, since a connection inherited from the parent cannot be shared.
+warm_up() opens the connection ahead of the first request.
+
+The SDK itself is only imported when the first model is created.
+
+Call latency is recorded as 'cold' for the first call of a process, or after
+the connection has been idle long enough to have been dropped, and 'warm'
+otherwise.
+
+With an OutboundPolicy (rate_limit.py) every call waits for a rate and
+concurrency slot, and failed calls are retried or hedged by the policy. A
+CircuitBreaker (circuit.py) refuses calls while the API keeps failing, and the
+current request deadline (deadlines.py) becomes the timeout of each call.
+
+generate_content_async() is the same call for the ASGI app (asgi.py): it awaits
+the SDK's async client, so the event loop serves other requests meanwhile.
+"""
+
+import os
+import time
+import threading
+import metrics
+import deadlines
+from rate_limit import is_transient
+
+
+# A call that timed out with less time than this says more about the client's deadline
+# than about the API, so it is not counted against the circuit breaker
+BREAKER_MIN_TIMEOUT = 5.0
+
+
+def _upstream_failure(error):
+    """True when an error says the API is unhealthy, rather than the request or a local limit"""
+    return is_transient(error) or (error.__cause__ is not None and is_transient(error.__cause__))
+
+
+def _timed_out(error):
+    return isinstance(error, (deadlines.DeadlineExceeded, TimeoutError)) or type(error).__name__ == 'DeadlineExceeded'
+
+
+class GeminiClient:
+    """Lazily created, per-process GenerativeModel with cold/warm latency tracking"""
+
+    def __init__(self, api_key, model_name, idle_cold_after=60.0, policy=None, breaker=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.idle_cold_after = idle_cold_after
+        self.policy = policy
+        self.breaker = breaker
+        self._model = None
+        self._pid = None
+        self._last_call = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        """Return the GenerativeModel of this process, creating it on first use"""
+        if self._pid == os.getpid():
+            return self._model
+        with self._lock:
+            if self._pid != os.getpid():
+                start = time.perf_counter()
+                # Imported on first use, the SDK (gRPC, protobuf) is slow to import
+                import google.generativeai as genai
+                # configure() drops any client inherited from the parent process
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+                self._last_call = None
+                self._pid = os.getpid()
+                metrics.observe('gemini_client_init_seconds', time.perf_counter() - start)
+        return self._model
+
+    def _state(self):
+        if self._last_call is None:
+            return 'cold'
+        if time.monotonic() - self._last_call > self.idle_cold_after:
+            return 'cold'
+        return 'warm'
+
+    def _before_call(self):
+        """Check the circuit; returns (probe, short_deadline) for _after_call()"""
+        left = deadlines.remaining()
+        short_deadline = left is not None and left < BREAKER_MIN_TIMEOUT
+        return (self.breaker.before_call() if self.breaker is not None else False), short_deadline
+
+    def _after_call(self, call, error=None):
+        if self.breaker is None:
+            return
+        probe, short_deadline = call
+        failed = error is not None and _upstream_failure(error)
+        if failed and short_deadline and _timed_out(error):
+            failed = False
+        self.breaker.record(not failed, probe)
+
+    def generate_content(self, contents, **kwargs):
+        call = self._before_call()
+        try:
+            if self.policy is None:
+                response = self._generate_content(contents, **kwargs)
+            else:
+                response = self.policy.call(self._generate_content, contents, **kwargs)
+        except Exception as e:
+            self._after_call(call, e)
+            raise
+        self._after_call(call)
+        return response
+
+    async def generate_content_async(self, contents, **kwargs):
+        call = self._before_call()
+        try:
+            if self.policy is None:
+                response = await self._generate_content_async(contents, **kwargs)
+            else:
+                response = await self.policy.call_async(self._generate_content_async, contents, **kwargs)
+        except Exception as e:
+            self._after_call(call, e)
+            raise
+        except BaseException:
+            # Cancelled: release a half-open probe without counting the call either way
+            if self.breaker is not None:
+                self.breaker.cancel(call[0])
+            raise
+        self._after_call(call)
+        return response
+
+    def _with_deadline(self, kwargs):
+        timeout = deadlines.timeout()
+        if timeout is not None:
+            kwargs['request_options'] = dict(kwargs.get('request_options') or {}, timeout=timeout)
+        return kwargs
+
+    def _generate_content(self, contents, **kwargs):
+        kwargs = self._with_deadline(kwargs)
+        model = self.model()
+        state = self._state()
+        start = time.perf_counter()
+        metrics.add_in_flight('gemini_calls_in_flight', 1)
+        try:
+            return model.generate_content(contents, **kwargs)
+        except Exception as e:
+            metrics.increment('gemini_errors', type=type(e).__name__)
+            raise
+        finally:
+            metrics.add_in_flight('gemini_calls_in_flight', -1)
+            metrics.observe('gemini_call_seconds', time.perf_counter() - start, state=state)
+            self._last_call = time.monotonic()
+
+    async def _generate_content_async(self, contents, **kwargs):
+        kwargs = self._with_deadline(kwargs)
+        model = self.model()
+        state = self._state()
+        start = time.perf_counter()
+        metrics.add_in_flight('gemini_calls_in_flight', 1)
+        try:
+            return await model.generate_content_async(contents, **kwargs)
+        except Exception as e:
+            metrics.increment('gemini_errors', type=type(e).__name__)
+            raise
+        finally:
+            metrics.add_in_flight('gemini_calls_in_flight', -1)
+            metrics.observe('gemini_call_seconds', time.perf_counter() - start, state=state)
+            self._last_call = time.monotonic()
+
+    def generate_content_stream(self, contents, **kwargs):
+        """Yield response chunks as they arrive; holds a policy slot but is never retried"""
+        call = self._before_call()
+        error = None
+        try:
+            if self.policy is None:
+                yield from self._generate_content_stream(contents, **kwargs)
+            else:
+                with self.policy.slot():
+                    yield from self._generate_content_stream(contents, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also runs when the consumer stops reading early, so a half-open probe is never stuck
+            self._after_call(call, error)
+
+    def _generate_content_stream(self, contents, **kwargs):
+        """Yield response chunks as they arrive, recording the time to the first chunk"""
+        kwargs = self._with_deadline(kwargs)
+        model = self.model()
+        state = self._state()
+        start = time.perf_counter()
+        first_chunk = True
+        metrics.add_in_flight('gemini_calls_in_flight', 1)
+        try:
+            for chunk in model.generate_content(contents, stream=True, **kwargs):
+                if first_chunk:
+                    metrics.observe('gemini_stream_ttfb_seconds', time.perf_counter() - start, state=state)
+                    first_chunk = False
+                yield chunk
+        except Exception as e:
+            metrics.increment('gemini_errors', type=type(e).__name__)
+            raise
+        finally:
+            metrics.add_in_flight('gemini_calls_in_flight', -1)
+            metrics.observe('gemini_call_seconds', time.perf_counter() - start, state=state)
+            self._last_call = time.monotonic()
+
+    def warm_up(self):
+        """Open the API connection with a free count_tokens call"""
+        model = self.model()
+        start = time.perf_counter()
+        try:
+            model.count_tokens('warm-up')
+        except Exception as e:
+            print(f"Gemini warm-up failed: {e}")
+            return False
+        finally:
+            metrics.observe('gemini_warmup_seconds', time.perf_counter() - start)
+        self._last_call = time.monotonic()
+        return True
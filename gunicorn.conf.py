@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration, loaded automatically when gunicorn starts from the project directory.
+
+The app is imported once in the master (preload) so workers fork with every
+module already loaded; set GUNICORN_PRELOAD=false to import it in each worker
+instead. Each worker then warms its Gemini connection and OCR pool before
+taking traffic. Set WARM_UP_ON_START=false to skip it.
+
+Prometheus metrics are written by every worker to PROMETHEUS_MULTIPROC_DIR so
+/metrics reports the whole server; the metric files of a previous run are
+removed at start-up, and nothing else in the directory is touched.
+"""
+
+import os
+import glob
+import tempfile
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Set before the app (and prometheus_client) is imported, which preload does right after
+# this file is read. The values of a previous run are dropped by deleting only the *.db
+# files prometheus_client writes, since an operator may point this at a shared directory
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'ocr-app-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def post_worker_init(worker):
+    """Runs in each worker after fork, once the app is loaded"""
+    if os.getenv('WARM_UP_ON_START', 'true').lower() != 'true':
+        return
+    if 'Uvicorn' in type(worker).__name__:
+        # asgi.py warms up in its lifespan start-up instead
+        return
+    from app import warm_up
+    try:
+        warm_up()
+    except Exception as e:
+        worker.log.warning(f"Warm-up failed: {e}")
+
+
+def child_exit(server, worker):
+    """Runs in the master when a worker exits"""
+    import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,55 @@
+"""
+Escalation policy for method=auto.
+
+A fast local OCR pass runs first. Its answer is kept when Tesseract was
+confident about the words it read and the text contains the kinds of
+structured data we expect from a document; otherwise the request escalates
+to Gemini.
+"""
+
+from field_extractor import FIELD_KINDS, extract_fields, field_kinds
+
+
+def field_coverage(fields):
+    """Return (coverage, kinds) for an extraction result, kinds being the FIELD_KINDS found"""
+    kinds = field_kinds(fields)
+    return len(kinds) / len(FIELD_KINDS), kinds
+
+
+class HybridPolicy:
+    """Thresholds deciding whether a local OCR result is good enough to return"""
+
+    def __init__(self, min_confidence=80.0, max_low_confidence_ratio=0.15, min_words=5,
+                 min_field_coverage=0.2):
+        self.min_confidence = min_confidence
+        self.max_low_confidence_ratio = max_low_confidence_ratio
+        self.min_words = min_words
+        self.min_field_coverage = min_field_coverage
+
+    def decide(self, ocr, fields=None):
+        """Return (escalate, reason, telemetry) for a tesseract_engine.recognize() result.
+
+        fields is the local extraction result for the OCR text, extracted here when not given.
+        """
+        if fields is None:
+            fields = extract_fields(ocr['text'])
+        coverage, kinds = field_coverage(fields)
+        word_count = ocr['word_count']
+        low_ratio = ocr['low_confidence_words'] / word_count if word_count else 1.0
+        telemetry = {
+            'local_confidence': ocr['confidence'],
+            'local_word_count': word_count,
+            'low_confidence_ratio': round(low_ratio, 3),
+            'field_coverage': round(coverage, 3),
+            'fields_found': kinds
+        }
+
+        if word_count < self.min_words:
+            return True, 'too_few_words', telemetry
+        if ocr['confidence'] < self.min_confidence:
+            return True, 'low_confidence', telemetry
+        if low_ratio > self.max_low_confidence_ratio:
+            return True, 'too_many_low_confidence_words', telemetry
+        if coverage < self.min_field_coverage:
+            return True, 'low_field_coverage', telemetry
+        return False, 'local_ok', telemetry
@@ -0,0 +1,255 @@
+"""
+Persistent job queue for asynchronous extraction.
+
+Jobs are stored in a local SQLite file so they survive restarts and can be
+claimed by worker threads in any gunicorn worker process. A claimed job holds
+a lease; if the process dies or the job hangs past the lease it is picked up
+again, up to max_attempts. A failed attempt is retried after a delay that doubles
+each time. Only the worker holding the current lease can finish a job. Finished jobs
+are deleted after a retention period.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from results import dumps, loads
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class JobStore:
+    """SQLite-backed storage for extraction jobs"""
+
+    def __init__(self, db_path, lease_seconds=300, max_attempts=3, retention_seconds=24 * 3600,
+                 retry_delay=10):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " method TEXT NOT NULL,"
+            " language TEXT NOT NULL,"
+            " filename TEXT NOT NULL,"
+            " image BLOB,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " lease_expires_at REAL,"
+            " available_at REAL,"
+            " finished_at REAL)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if 'available_at' not in columns:
+            # Job files created before retries were delayed
+            conn.execute("ALTER TABLE jobs ADD COLUMN available_at REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def submit(self, image_bytes, filename, method, language):
+        """Queue a new job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (id, status, method, language, filename, image, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, STATUS_QUEUED, method, language, filename, image_bytes, now, now)
+        )
+        return job_id
+
+    def claim(self):
+        """Lease the oldest runnable job, returning a dict or None when the queue is empty.
+
+        Runnable means queued and past its retry delay, or running with an expired lease
+        (the worker that held it crashed or hung). The returned attempts number identifies
+        the lease: complete() and fail() only apply while it is still the current one.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, method, language, filename, image, attempts FROM jobs"
+                " WHERE ((status = ? AND (available_at IS NULL OR available_at <= ?))"
+                " OR (status = ? AND lease_expires_at < ?)) AND attempts < ?"
+                " ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED, now, STATUS_RUNNING, now, self.max_attempts)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job_id, method, language, filename, image, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (STATUS_RUNNING, attempts + 1, now + self.lease_seconds, now, job_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {
+            'id': job_id,
+            'method': method,
+            'language': language,
+            'filename': filename,
+            'image': image,
+            'attempts': attempts + 1
+        }
+
+    def complete(self, job_id, result, attempts):
+        """Store the result of a job; False when the lease of this attempt was lost"""
+        now = time.time()
+        return self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, image = NULL,"
+            " lease_expires_at = NULL, updated_at = ?, finished_at = ?"
+            " WHERE id = ? AND status = ? AND attempts = ?",
+            (STATUS_DONE, dumps(result).decode('utf-8'), now, now, job_id, STATUS_RUNNING, attempts)
+        ).rowcount == 1
+
+    def fail(self, job_id, error, attempts):
+        """Record a failed attempt and requeue it with a delay unless attempts are exhausted;
+        False when the lease of this attempt was lost"""
+        now = time.time()
+        if attempts < self.max_attempts:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, available_at = ?,"
+                " updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+                (STATUS_QUEUED, error, now + self.retry_delay * 2 ** (attempts - 1), now,
+                 job_id, STATUS_RUNNING, attempts)
+            )
+        else:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET status = ?, error = ?, image = NULL, lease_expires_at = NULL,"
+                " updated_at = ?, finished_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+                (STATUS_FAILED, error, now, now, job_id, STATUS_RUNNING, attempts)
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id):
+        row = self._connection().execute(
+            "SELECT id, status, method, language, filename, result, error, attempts,"
+            " created_at, updated_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'status', 'method', 'language', 'filename', 'result', 'error', 'attempts',
+                'created_at', 'updated_at', 'finished_at')
+        job = dict(zip(keys, row))
+        job['result'] = loads(job['result']) if job['result'] else None
+        return job
+
+    def sweep(self):
+        """Fail stuck jobs that ran out of attempts and delete expired finished jobs"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = COALESCE(error, 'Job lease expired'), image = NULL,"
+            " lease_expires_at = NULL, updated_at = ?, finished_at = ?"
+            " WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+            (STATUS_FAILED, now, now, STATUS_RUNNING, now, self.max_attempts)
+        )
+        deleted = conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (STATUS_DONE, STATUS_FAILED, now - self.retention_seconds)
+        ).rowcount
+        return deleted
+
+
+class JobWorkerPool:
+    """Background threads that claim jobs from a JobStore and run them through a handler"""
+
+    def __init__(self, store, handler, num_threads=2, poll_interval=0.5, sweep_interval=60):
+        self.store = store
+        self.handler = handler
+        self.num_threads = num_threads
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_sweep = 0.0
+
+    def ensure_started(self):
+        """Start the worker threads once per process (threads do not survive a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            for i in range(self.num_threads):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+
+    def notify(self):
+        """Wake idle workers after a job has been submitted"""
+        self._wakeup.set()
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        try:
+            self.store.sweep()
+        except sqlite3.Error as e:
+            print(f"DEBUG: Job sweep failed: {e}")
+
+    def _run(self):
+        while True:
+            self._maybe_sweep()
+            try:
+                job = self.store.claim()
+            except sqlite3.Error as e:
+                print(f"DEBUG: Job claim failed: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                result = {'error': str(e) or type(e).__name__}
+
+            # A failed write leaves the job running; its lease expires and it is claimed again
+            try:
+                if result.get('error'):
+                    finished = self.store.fail(job['id'], result['error'], job['attempts'])
+                else:
+                    finished = self.store.complete(job['id'], result, job['attempts'])
+            except Exception as e:
+                print(f"DEBUG: Job {job['id']} could not be finished: {e}")
+                continue
+            if not finished:
+                print(f"DEBUG: Job {job['id']} lease was lost, attempt {job['attempts']} discarded")
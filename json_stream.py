@@ -0,0 +1,100 @@
+"""
+Incremental JSON parsing for streamed model replies.
+
+IncrementalJSONParser is fed the reply text chunk by chunk and reports every
+scalar value (with its path) as soon as the value is complete, so the fields
+of an extraction result can be forwarded to the client before the whole reply
+has arrived. Anything before the first '{' or '[' (such as a markdown fence)
+and after the closing bracket is ignored.
+"""
+
+import json
+from collections.abc import Mapping
+
+WHITESPACE = ' \t\r\n'
+
+
+class IncrementalJSONParser:
+    """Push parser yielding (path, value) for each completed scalar"""
+
+    def __init__(self):
+        # One frame per open container: [is_object, key or index, expecting_key]
+        self._stack = []
+        self._started = False
+        self.done = False
+        self._string = None
+        self._escape = False
+        self._literal = None
+
+    def feed(self, chunk):
+        """Consume a chunk of text, returning the (path, value) pairs completed by it"""
+        events = []
+        for char in chunk:
+            if self.done:
+                break
+            if not self._started:
+                if char in '{[':
+                    self._started = True
+                    self._open(char)
+                continue
+            if self._string is not None:
+                self._string.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    value = json.loads(''.join(self._string))
+                    self._string = None
+                    self._scalar(value, events)
+                continue
+            if self._literal is not None:
+                if char not in ',}]:' and char not in WHITESPACE:
+                    self._literal.append(char)
+                    continue
+                value = json.loads(''.join(self._literal))
+                self._literal = None
+                self._scalar(value, events)
+            if char == '"':
+                self._string = [char]
+            elif char in '{[':
+                self._open(char)
+            elif char in '}]':
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+            elif char == ':':
+                self._stack[-1][2] = False
+            elif char == ',':
+                frame = self._stack[-1]
+                if frame[0]:
+                    frame[2] = True
+                else:
+                    frame[1] += 1
+            elif char not in WHITESPACE:
+                self._literal = [char]
+        return events
+
+    def _open(self, char):
+        is_object = char == '{'
+        self._stack.append([is_object, None if is_object else 0, is_object])
+
+    def _scalar(self, value, events):
+        frame = self._stack[-1]
+        if frame[0] and frame[2]:
+            frame[1] = value
+            return
+        events.append((tuple(f[1] for f in self._stack), value))
+
+
+def iter_leaves(value, path=()):
+    """(path, value) for every scalar of an already parsed JSON value (or extraction result),
+    in document order"""
+    if isinstance(value, Mapping):
+        for key, item in value.items():
+            yield from iter_leaves(item, path + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from iter_leaves(item, path + (index,))
+    else:
+        yield path, value
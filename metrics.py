@@ -0,0 +1,241 @@
+"""
+Lightweight in-process metrics.
+
+Timings are kept per metric name and label set: count, sum, min, max and a
+bounded window of recent samples for percentiles. Values are per worker
+process; snapshot() is what /api/stats returns.
+
+When prometheus_client is installed every timing, counter and in-flight gauge
+is mirrored into a Prometheus histogram, counter or gauge of the same name, and
+render_prometheus() produces the /metrics page. With PROMETHEUS_MULTIPROC_DIR
+set (gunicorn.conf.py does it) each worker writes its values there and the
+page aggregates all workers, whichever one serves the scrape.
+
+Within a request, collect_timings() also gathers every timing recorded by the
+request (and the pool threads it hands work to) into a RequestTimings, which
+becomes the Server-Timing header and the timings object of the response.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+WINDOW = 1024
+
+# Histogram buckets (seconds), from cache lookups up to slow Gemini calls
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_timings = {}
+_counters = {}
+_gauges = {}
+_prometheus = {}
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Durations of the stages of one request, summed per stage.
+
+    Parts handled in parallel (pages, tiles) add up, so a stage can exceed the total.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self):
+        """Stage durations in milliseconds, in the order they were first recorded, plus the total"""
+        with self._lock:
+            timings = {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        timings['total'] = round((time.perf_counter() - self.start) * 1000, 3)
+        return timings
+
+    def server_timing(self):
+        """Value of a Server-Timing header"""
+        return ', '.join(f"{stage};dur={duration}" for stage, duration in self.as_dict().items())
+
+
+def _stage_name(name, labels):
+    return labels.get('stage') or (name[:-len('_seconds')] if name.endswith('_seconds') else name)
+
+
+def begin_request_timings():
+    """Start collecting the timings of the current request; returns (timings, token)"""
+    timings = RequestTimings()
+    return timings, _request_timings.set(timings)
+
+
+def end_request_timings(token):
+    _request_timings.reset(token)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the timings recorded in the block into the RequestTimings it yields"""
+    timings, token = begin_request_timings()
+    try:
+        yield timings
+    finally:
+        end_request_timings(token)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _prometheus_child(kind, name, labels):
+    """The Prometheus metric for name with these label values, None without prometheus_client.
+
+    Metrics are created on first use with the label names of that call; a later call with
+    other label names is not mirrored.
+    """
+    if prometheus_client is None:
+        return None
+    with _lock:
+        entry = _prometheus.get(name)
+        if entry is None:
+            description = name.replace('_', ' ')
+            labelnames = tuple(sorted(labels))
+            if kind == 'histogram':
+                metric = prometheus_client.Histogram(name, description, labelnames, buckets=BUCKETS)
+            elif kind == 'gauge':
+                # livesum: the sum over the worker processes that are still alive
+                metric = prometheus_client.Gauge(name, description, labelnames, multiprocess_mode='livesum')
+            else:
+                metric = prometheus_client.Counter(name, description, labelnames)
+            entry = _prometheus[name] = (metric, labelnames)
+    metric, labelnames = entry
+    if tuple(sorted(labels)) != labelnames:
+        return None
+    return metric.labels(**labels) if labels else metric
+
+
+def observe(name, value, **labels):
+    """Record one timing sample (seconds)"""
+    key = _key(name, labels)
+    histogram = _prometheus_child('histogram', name, labels)
+    if histogram is not None:
+        histogram.observe(value)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(_stage_name(name, labels), value)
+    with _lock:
+        entry = _timings.get(key)
+        if entry is None:
+            entry = _timings[key] = {'count': 0, 'sum': 0.0, 'min': value, 'max': value,
+                                     'samples': deque(maxlen=WINDOW)}
+        entry['count'] += 1
+        entry['sum'] += value
+        entry['min'] = min(entry['min'], value)
+        entry['max'] = max(entry['max'], value)
+        entry['samples'].append(value)
+
+
+def increment(name, amount=1, **labels):
+    key = _key(name, labels)
+    counter = _prometheus_child('counter', name, labels)
+    if counter is not None:
+        counter.inc(amount)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the duration of the block under name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def add_in_flight(name, amount, **labels):
+    """Move an in-flight gauge up or down by amount"""
+    key = _key(name, labels)
+    gauge = _prometheus_child('gauge', name, labels)
+    if gauge is not None:
+        gauge.inc(amount)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + amount
+
+
+@contextmanager
+def in_flight(name, **labels):
+    """Count the block in an in-flight gauge while it runs"""
+    add_in_flight(name, 1, **labels)
+    try:
+        yield
+    finally:
+        add_in_flight(name, -1, **labels)
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _label_string(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+def snapshot():
+    """Return all metrics of this process as plain dicts (timings in milliseconds)"""
+    with _lock:
+        timings = {}
+        for (name, labels), entry in _timings.items():
+            ordered = sorted(entry['samples'])
+            timings[_label_string(name, labels)] = {
+                'count': entry['count'],
+                'mean_ms': round(entry['sum'] / entry['count'] * 1000, 3),
+                'min_ms': round(entry['min'] * 1000, 3),
+                'max_ms': round(entry['max'] * 1000, 3),
+                'p50_ms': round(_percentile(ordered, 0.5) * 1000, 3),
+                'p95_ms': round(_percentile(ordered, 0.95) * 1000, 3)
+            }
+        counters = {_label_string(name, labels): value for (name, labels), value in _counters.items()}
+        gauges = {_label_string(name, labels): value for (name, labels), value in _gauges.items()}
+    return {'timings': timings, 'counters': counters, 'in_flight': gauges}
+
+
+def multiprocess_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or None
+
+
+def render_prometheus():
+    """Return (body, content_type) of the Prometheus text format, None without prometheus_client.
+
+    In multiprocess mode the values of every worker process are aggregated from
+    PROMETHEUS_MULTIPROC_DIR, otherwise only this process is reported.
+    """
+    if prometheus_client is None:
+        return None
+    if multiprocess_dir():
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of an exited worker (called from gunicorn's child_exit hook)"""
+    if prometheus_client is not None and multiprocess_dir():
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,152 @@
+"""
+Page iteration for multi-page uploads.
+
+Multi-frame TIFF and GIF files and PDFs are split into pages, each encoded as
+a standalone PNG that the extraction engines handle like any single image.
+PDFs are rasterized locally with pypdfium2 (in requirements.txt); where it is
+missing, PDF uploads are rejected with a clear error. Pages are produced one at a time
+so a long document never has every page decoded in memory at once.
+"""
+
+import io
+from collections.abc import Mapping
+from PIL import Image
+from results import empty_result
+
+_pdfium = None
+
+# Formats whose extra frames are pages. MPO (phone JPEGs with a depth map) and
+# animated WebP/PNG also report several frames but are single documents.
+MULTI_PAGE_FORMATS = ('TIFF', 'GIF')
+
+# zlib level for page PNGs; they are re-encoded or decoded right away, so speed matters more than size
+PNG_COMPRESS_LEVEL = 1
+
+
+class PageError(ValueError):
+    """The document cannot be split into pages (unsupported, too long or unreadable)"""
+
+
+def _load_pdfium():
+    """Import pypdfium2 on first use, False when not installed"""
+    global _pdfium
+    if _pdfium is None:
+        try:
+            import pypdfium2
+            _pdfium = pypdfium2
+        except ImportError:
+            _pdfium = False
+    return _pdfium
+
+
+def is_pdf(data):
+    return bytes(data[:5]) == b'%PDF-'
+
+
+def _open_pdf(data):
+    pdfium = _load_pdfium()
+    if not pdfium:
+        raise PageError("PDF support requires pypdfium2 (pip install pypdfium2)")
+    try:
+        return pdfium.PdfDocument(bytes(data))
+    except Exception as e:
+        raise PageError(f"Cannot open PDF: {e}")
+
+
+def page_count(data):
+    """Number of pages in an upload; 1 for ordinary images"""
+    if is_pdf(data):
+        document = _open_pdf(data)
+        try:
+            return len(document)
+        finally:
+            document.close()
+    image = Image.open(io.BytesIO(data))
+    if image.format not in MULTI_PAGE_FORMATS:
+        return 1
+    return getattr(image, 'n_frames', 1)
+
+
+def is_multi_page(data):
+    """True for PDFs and multi-frame images, which are extracted page by page"""
+    if is_pdf(data):
+        return True
+    try:
+        return page_count(data) > 1
+    except Exception:
+        # Not an image Pillow can read; the engine reports that
+        return False
+
+
+def encode_png(image):
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+
+def iter_pages(data, dpi=200, max_pages=None):
+    """Yield every page of a PDF or multi-frame image as PNG bytes, in order"""
+    count = page_count(data)
+    if max_pages and count > max_pages:
+        raise PageError(f"Document has {count} pages, the limit is {max_pages}")
+
+    if is_pdf(data):
+        document = _open_pdf(data)
+        try:
+            for index in range(count):
+                page = document[index]
+                try:
+                    image = page.render(scale=dpi / 72).to_pil()
+                finally:
+                    page.close()
+                yield encode_png(image)
+        finally:
+            document.close()
+        return
+
+    image = Image.open(io.BytesIO(data))
+    for index in range(count):
+        image.seek(index)
+        yield encode_png(image)
+
+
+def first_page(data, dpi=72):
+    """The first page as PNG bytes (for previews), or the upload itself for ordinary images"""
+    if not is_pdf(data):
+        return data
+    return next(iter_pages(data, dpi=dpi))
+
+
+def merge_results(page_results, text=None):
+    """Merge per-page extraction results, in page order, into one document.
+
+    Texts are joined under page headers unless the merged text is given; every structured
+    field keeps the distinct non-empty values of all pages, comma separated. Failed pages
+    are skipped.
+    """
+    pages = [(number, result) for number, result in enumerate(page_results, 1)
+             if not result.get('error')]
+    if text is None:
+        text = '\n\n'.join(f"--- Page {number} ---\n{result.get('text', '')}" for number, result in pages)
+    merged = empty_result(text)
+    for _, result in pages:
+        _merge_fields(merged, result)
+    return merged
+
+
+def _merge_fields(target, source):
+    for key, value in source.items():
+        if key in ('text', 'error'):
+            continue
+        if isinstance(value, Mapping):
+            _merge_fields(target.setdefault(key, {}), value)
+        elif isinstance(value, str) and value:
+            current = target.get(key)
+            if not current:
+                target[key] = value
+            elif value not in current.split(', '):
+                target[key] = f"{current}, {value}"
+        else:
+            target.setdefault(key, value)
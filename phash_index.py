@@ -0,0 +1,254 @@
+"""
+Perceptual hashing and a near-duplicate index for re-scanned documents.
+
+Hashes are 64-bit integers computed with Pillow (dHash or pHash). The index uses
+multi-index hashing: each hash is split into (max_distance + 1) bands and, by the
+pigeonhole principle, any hash within max_distance bits of the query matches the
+query exactly in at least one band. Lookups therefore only compare against the
+entries that share a band value instead of scanning everything.
+
+Entries older than the TTL are skipped by lookups and pruned, from memory and
+from the SQLite table, at most every PRUNE_INTERVAL seconds.
+"""
+
+import os
+import math
+import bisect
+import time
+import sqlite3
+import threading
+from PIL import Image
+
+HASH_BITS = 64
+
+# One band per distance bit plus one; bands narrower than 4 bits match almost everything,
+# so larger distances cannot keep the pigeonhole guarantee and are clamped
+MAX_DISTANCE = 15
+
+PRUNE_INTERVAL = 60.0
+
+_popcount = getattr(int, 'bit_count', None) or (lambda value: bin(value).count('1'))
+
+
+def _prepare(image, size):
+    """Convert an image to a small grayscale thumbnail for hashing"""
+    if image.format == 'JPEG':
+        # Let the JPEG decoder downscale while decoding, much cheaper than a full decode
+        image.draft('L', (size[0] * 8, size[1] * 8))
+    return image.convert('L').resize(size, Image.LANCZOS)
+
+
+def dhash(image):
+    """Difference hash: compare each pixel with its right neighbour on a 9x8 thumbnail"""
+    pixels = list(_prepare(image, (9, 8)).getdata())
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+_DCT_SIZE = 32
+_DCT_COS = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+    for u in range(8)
+]
+
+
+def phash(image):
+    """DCT hash: compare the low-frequency 8x8 DCT coefficients with their median"""
+    pixels = list(_prepare(image, (_DCT_SIZE, _DCT_SIZE)).getdata())
+    rows = [pixels[i * _DCT_SIZE:(i + 1) * _DCT_SIZE] for i in range(_DCT_SIZE)]
+
+    # Separable DCT restricted to the 8 lowest frequencies in each direction
+    row_dct = [[sum(c * p for c, p in zip(_DCT_COS[u], row)) for u in range(8)] for row in rows]
+    coefficients = []
+    for v in range(8):
+        cos_v = _DCT_COS[v]
+        for u in range(8):
+            coefficients.append(sum(cos_v[y] * row_dct[y][u] for y in range(_DCT_SIZE)))
+
+    # Skip the DC term when computing the median, it only encodes overall brightness
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+HASH_FUNCTIONS = {
+    'dhash': dhash,
+    'phash': phash,
+}
+
+
+def hamming_distance(a, b):
+    return _popcount(a ^ b)
+
+
+def _to_signed(value):
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << HASH_BITS) if value >= (1 << (HASH_BITS - 1)) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class NearDuplicateIndex:
+    """Multi-index hash table mapping perceptual hashes to result cache keys"""
+
+    def __init__(self, max_distance=4, db_path=None, ttl=None, refresh_interval=2.0):
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            clamped = min(max(max_distance, 0), MAX_DISTANCE)
+            print(f"DEBUG: Near-duplicate max distance {max_distance} is outside 0-{MAX_DISTANCE}, "
+                  f"using {clamped}")
+            max_distance = clamped
+        self.max_distance = max_distance
+        self.db_path = db_path
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+
+        band_count = max_distance + 1
+        width, extra = divmod(HASH_BITS, band_count)
+        self._bands = []
+        shift = 0
+        for i in range(band_count):
+            bits = width + (1 if i < extra else 0)
+            self._bands.append((shift, (1 << bits) - 1))
+            shift += bits
+
+        self._hashes = []
+        self._keys = []
+        self._created = []
+        self._tables = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_row_id = 0
+        self._last_refresh = 0.0
+        self._last_prune = 0.0
+
+        if self.db_path:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicates ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " hash INTEGER NOT NULL,"
+                " cache_key TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self.refresh(force=True)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _insert_local(self, value, key, created_at):
+        """Add an entry to the in-memory tables, caller must hold the lock"""
+        entry_id = len(self._hashes)
+        self._hashes.append(value)
+        self._keys.append(key)
+        self._created.append(created_at)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table.setdefault((value >> shift) & mask, []).append(entry_id)
+
+    def _min_created(self, now):
+        return now - self.ttl if self.ttl else 0
+
+    def prune(self):
+        """Drop expired entries from memory and from the table, at most every PRUNE_INTERVAL"""
+        now = time.time()
+        if not self.ttl or now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        min_created = self._min_created(now)
+        if self.db_path:
+            try:
+                self._connection().execute("DELETE FROM near_duplicates WHERE created_at <= ?", (min_created,))
+            except sqlite3.Error as e:
+                print(f"DEBUG: Near-duplicate index prune failed: {e}")
+        with self._lock:
+            # Entries are added in time order, so the expired ones come first
+            expired = bisect.bisect_right(self._created, min_created)
+            if not expired:
+                return
+            entries = list(zip(self._hashes[expired:], self._keys[expired:], self._created[expired:]))
+            self._hashes, self._keys, self._created = [], [], []
+            self._tables = [{} for _ in self._bands]
+            for value, key, created_at in entries:
+                self._insert_local(value, key, created_at)
+
+    def refresh(self, force=False):
+        """Pull entries added by other worker processes since the last refresh"""
+        self.prune()
+        if not self.db_path:
+            return
+        now = time.time()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+
+        try:
+            rows = self._connection().execute(
+                "SELECT id, hash, cache_key, created_at FROM near_duplicates"
+                " WHERE id > ? AND created_at > ? ORDER BY id",
+                (self._last_row_id, self._min_created(now))
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"DEBUG: Near-duplicate index refresh failed: {e}")
+            return
+
+        with self._lock:
+            for row_id, value, key, created_at in rows:
+                if row_id > self._last_row_id:
+                    self._insert_local(_to_unsigned(value), key, created_at)
+                    self._last_row_id = row_id
+
+    def add(self, value, key):
+        """Record that an image with this hash produced the result stored under key"""
+        if self.db_path:
+            try:
+                self._connection().execute(
+                    "INSERT INTO near_duplicates (hash, cache_key, created_at) VALUES (?, ?, ?)",
+                    (_to_signed(value), key, time.time())
+                )
+            except sqlite3.Error as e:
+                print(f"DEBUG: Near-duplicate index write failed: {e}")
+            # The row comes back through refresh(), which keeps row ids in order
+            self.refresh(force=True)
+        else:
+            self.prune()
+            with self._lock:
+                self._insert_local(value, key, time.time())
+
+    def lookup(self, value):
+        """Return [(distance, key), ...] for entries within max_distance, closest first"""
+        self.refresh()
+        min_created = self._min_created(time.time())
+        matches = {}
+        seen = set()
+        with self._lock:
+            for table, (shift, mask) in zip(self._tables, self._bands):
+                for entry_id in table.get((value >> shift) & mask, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    if self._created[entry_id] <= min_created:
+                        continue
+                    distance = _popcount(value ^ self._hashes[entry_id])
+                    if distance <= self.max_distance:
+                        matches[entry_id] = distance
+            results = [(distance, self._keys[entry_id]) for entry_id, distance in matches.items()]
+        results.sort()
+        return results
@@ -0,0 +1,104 @@
+"""
+Downscaled preview images for the result page.
+
+Instead of inlining the full upload as base64, the result page shows a small
+WebP thumbnail. It is either inlined (a few tens of KB) or written to a shared
+directory and served from a content-addressed /preview/<id> URL.
+"""
+
+import io
+import os
+import time
+import base64
+import hashlib
+import tempfile
+from PIL import Image, ImageOps
+from preprocess import EXIF_FORMATS, ORIENTATION_TAG
+
+
+def make_preview(image_bytes, max_side=480, quality=70):
+    """Return WebP bytes of the image scaled to fit within max_side"""
+    image = Image.open(io.BytesIO(image_bytes))
+    orientation = image.getexif().get(ORIENTATION_TAG, 1) if image.format in EXIF_FORMATS else 1
+    # thumbnail() lets the JPEG decoder downscale while decoding
+    image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+    if orientation != 1:
+        image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def preview_data_url(preview_bytes):
+    return f"data:image/webp;base64,{base64.b64encode(preview_bytes).decode('ascii')}"
+
+
+class PreviewStore:
+    """Directory of content-addressed previews shared by all worker processes"""
+
+    def __init__(self, directory, ttl=3600, max_side=480, quality=70):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_side = max_side
+        self.quality = quality
+        self._writes = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def preview_id(self, image_bytes):
+        digest = hashlib.sha256(image_bytes)
+        digest.update(f"{self.max_side}:{self.quality}".encode('ascii'))
+        return digest.hexdigest()[:32]
+
+    def path(self, preview_id):
+        return os.path.join(self.directory, f"{preview_id}.webp")
+
+    def put(self, image_bytes):
+        """Create the preview if it does not exist yet and return its id"""
+        preview_id = self.preview_id(image_bytes)
+        path = self.path(preview_id)
+        if os.path.exists(path):
+            # Refresh the mtime so a re-uploaded image is not swept while in use
+            os.utime(path)
+            return preview_id
+
+        data = make_preview(image_bytes, self.max_side, self.quality)
+        # Write then rename so a concurrent reader never sees a partial file; the temporary
+        # name is unique per write, as threads and processes may store the same preview at once
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{preview_id}.", suffix='.tmp',
+                                         delete=False) as f:
+            f.write(data)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            raise
+
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self.sweep()
+        return preview_id
+
+    def get_path(self, preview_id):
+        """Return the file path of a live preview, or None when missing or expired"""
+        if not all(c in '0123456789abcdef' for c in preview_id) or len(preview_id) != 32:
+            return None
+        path = self.path(preview_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+        except OSError:
+            return None
+        return path
+
+    def sweep(self):
+        """Delete expired previews"""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,70 @@
+"""
+Opt-in request profiling.
+
+A sampled share of requests (or one that asks for it with an X-Profile header)
+runs under cProfile and its stats are written to a local directory as a .prof
+file, to be read with pstats or a viewer such as snakeviz. Only the thread
+handling the request is profiled; work it hands to page, tile or batch pools
+shows up as time spent waiting. The directory keeps at most max_files profiles
+no older than max_age seconds, oldest removed first.
+"""
+
+import os
+import time
+import uuid
+import random
+import cProfile
+
+
+class Profiler:
+    """Decides which requests to profile and stores their profiles with bounded retention"""
+
+    def __init__(self, directory, sample_rate=0.0, max_files=100, max_age=7 * 24 * 3600):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.max_age = max_age
+
+    def should_profile(self, requested=False):
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self):
+        """Start profiling the current thread; None when another profiler is already active"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None
+        return profile
+
+    def stop(self, profile, label, elapsed_ms):
+        """Stop the profile and write it; returns the file name, or None when it could not be written"""
+        profile.disable()
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{label}-{round(elapsed_ms)}ms-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, name))
+        except OSError as e:
+            print(f"DEBUG: Writing profile failed: {e}")
+            return None
+        self.prune()
+        return name
+
+    def prune(self):
+        """Remove profiles beyond max_files or older than max_age"""
+        profiles = []
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.prof'):
+                    profiles.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            # Another worker removed a file while listing; the next prune catches up
+            return
+        profiles.sort(reverse=True)
+        cutoff = time.time() - self.max_age
+        for index, (modified, path) in enumerate(profiles):
+            if index >= self.max_files or modified < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
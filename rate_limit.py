@@ -0,0 +1,447 @@
+"""
+Outbound limits for Gemini API calls.
+
+Bursts of uploads used to turn into bursts of quota errors. Every call now
+goes through an OutboundPolicy combining:
+- SharedTokenBucket: a requests-per-minute budget kept in a SQLite file, so
+  all worker processes on the host draw from the same quota
+- AdaptiveConcurrency: an AIMD limit on the calls in flight in this process,
+  grown while calls succeed and cut on 429s or when latency climbs
+- retries with full-jitter exponential backoff on throttling and transient
+  server errors
+- optional hedging: when a call is slower than the recent p95, a duplicate is
+  sent (if a slot is free) and whichever answers first is used
+
+Waiting for a slot and retrying both stop at the current request deadline.
+call_async() applies the same limits and retries (without hedging) to
+coroutines, polling for a slot instead of blocking the event loop.
+"""
+
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import metrics
+import deadlines
+
+THROTTLE_CODES = (429,)
+TRANSIENT_CODES = (500, 502, 503, 504)
+# google.api_core exception names, matched by name so the SDK is not imported here
+THROTTLE_ERRORS = ('ResourceExhausted', 'TooManyRequests')
+TRANSIENT_ERRORS = ('ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'BadGateway',
+                    'GatewayTimeout')
+
+# Recent call latencies kept for the adaptive latency target and the hedging delay
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+# Poll interval bounds (seconds) of call_async() while waiting for a slot
+ASYNC_POLL_MIN = 0.005
+ASYNC_POLL_MAX = 0.1
+
+
+class RateLimited(Exception):
+    """No request slot became free in time, or the API kept throttling after the retries"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _status_code(error):
+    code = getattr(error, 'code', None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(error):
+    return _status_code(error) in THROTTLE_CODES or type(error).__name__ in THROTTLE_ERRORS
+
+
+def is_transient(error):
+    """True for errors worth retrying: throttling, 5xx, timeouts and dropped connections"""
+    if is_throttled(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return _status_code(error) in TRANSIENT_CODES or type(error).__name__ in TRANSIENT_ERRORS
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class SharedTokenBucket:
+    """Token bucket stored in SQLite so every worker process shares one request rate"""
+
+    def __init__(self, db_path, rate_per_minute, burst=None, name='gemini'):
+        self.db_path = db_path
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst or max(1, rate_per_minute // 10)
+        self.name = name
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        """Return a SQLite connection owned by the current thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, change):
+        """Refill the bucket, apply change(tokens) -> (tokens, result) atomically and return result"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+            tokens, result = change(tokens)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (self.name, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _take(self, tokens):
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+    def _take_or_wait(self):
+        """Seconds to wait for a token, 0.0 once one is taken"""
+        try:
+            return self._update(self._take)
+        except sqlite3.Error as e:
+            # Fail open: a locked or broken database must not stop all extraction
+            print(f"DEBUG: Rate limit bucket unavailable: {e}")
+            return 0.0
+
+    def try_acquire(self):
+        return self._take_or_wait() == 0.0
+
+    def acquire(self, timeout=None):
+        """Take a token, sleeping until the refill up to timeout seconds; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self._take_or_wait()
+            if delay == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + delay > deadline:
+                return False
+            # Jitter so the waiting workers do not all retry in the same instant
+            time.sleep(delay * random.uniform(1.0, 1.2))
+
+    def penalize(self, seconds):
+        """Empty the bucket for the next seconds, pausing every worker after a 429"""
+        try:
+            self._update(lambda tokens: (min(tokens, 0.0) - seconds * self.rate, None))
+        except sqlite3.Error as e:
+            print(f"DEBUG: Rate limit bucket unavailable: {e}")
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the concurrent calls of this process.
+
+    The limit grows by about one per round of successful calls and is cut by
+    decrease_factor on throttling, or by 10% when a call is slower than the
+    latency target (twice the recent median when latency_target is 0). Cuts are
+    at most once per cooldown seconds so one burst of failures counts once.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=32, decrease_factor=0.5, latency_target=0.0,
+                 cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._in_flight < int(self.limit), timeout):
+                return False
+            self._in_flight += 1
+            return True
+
+    def _decrease(self, factor):
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * factor)
+            self._last_decrease = now
+
+    def _target(self):
+        if self.latency_target:
+            return self.latency_target
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return 2 * _percentile(self._latencies, 0.5)
+
+    def release(self, latency=None, throttled=False):
+        """Free a slot; latency (seconds) of a successful call, or throttled=True after a 429"""
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._decrease(self.decrease_factor)
+            elif latency is not None:
+                target = self._target()
+                self._latencies.append(latency)
+                if target is not None and latency > target:
+                    self._decrease(0.9)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return {'limit': round(self.limit, 2), 'in_flight': self._in_flight}
+
+
+class OutboundPolicy:
+    """Rate limit, concurrency limit, retries and hedging around one kind of API call"""
+
+    def __init__(self, bucket=None, concurrency=None, max_retries=3, backoff_base=0.5, backoff_cap=10.0,
+                 acquire_timeout=30.0, hedge=False, hedge_min_samples=MIN_LATENCY_SAMPLES):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.acquire_timeout = acquire_timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _backoff(self, attempt):
+        """Full jitter: uniform between 0 and the capped exponential delay"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _acquire(self, block=True):
+        """Take a concurrency slot, then a rate token. The slot comes first: a call that gives up
+        waiting for a slot would otherwise have used up a token of the shared rate."""
+        timeout = deadlines.timeout(self.acquire_timeout) if block else 0
+        give_up = time.monotonic() + timeout if timeout is not None else None
+        if self.concurrency is not None and not self.concurrency.acquire(timeout):
+            return False
+        if self.bucket is not None:
+            if block:
+                has_token = self.bucket.acquire(None if give_up is None else max(0.0, give_up - time.monotonic()))
+            else:
+                has_token = self.bucket.try_acquire()
+            if not has_token:
+                if self.concurrency is not None:
+                    self.concurrency.release()
+                return False
+        return True
+
+    def _acquire_or_raise(self):
+        if not self._acquire():
+            metrics.increment('gemini_rate_limited')
+            raise RateLimited("No Gemini request slot became free in time",
+                              retry_after=self._backoff(self.max_retries))
+
+    def _failed(self, error):
+        """Free the slot of a failed call; a 429 also pauses the shared bucket"""
+        throttled = is_throttled(error)
+        if throttled:
+            metrics.increment('gemini_throttled')
+            if self.bucket is not None:
+                self.bucket.penalize(self.backoff_base)
+        if self.concurrency is not None:
+            self.concurrency.release(throttled=throttled)
+
+    def _timed_call(self, fn, args, kwargs):
+        """Run fn holding an acquired slot, feeding the outcome to the concurrency limit"""
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._failed(e)
+            raise
+        latency = time.perf_counter() - start
+        if self.concurrency is not None:
+            self.concurrency.release(latency=latency)
+        return result
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                workers = self.concurrency.maximum * 2 if self.concurrency is not None else 32
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _hedged_call(self, fn, args, kwargs, hedge_after):
+        """Send a duplicate when the first call is slower than hedge_after; first success wins"""
+        executor = self._get_executor()
+        first = deadlines.submit(executor, self._timed_call, fn, args, kwargs)
+        pending = {first}
+        done, _ = wait(pending, timeout=hedge_after)
+        if not done and self._acquire(block=False):
+            metrics.increment('gemini_hedged')
+            pending.add(deadlines.submit(executor, self._timed_call, fn, args, kwargs))
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        metrics.increment('gemini_hedge_wins')
+                    # The slower call keeps running and frees its own slot when it ends
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _attempt(self, fn, args, kwargs):
+        self._acquire_or_raise()
+        start = time.perf_counter()
+        if self.hedge and len(self._latencies) >= self.hedge_min_samples:
+            result = self._hedged_call(fn, args, kwargs, _percentile(self._latencies, 0.95))
+        else:
+            result = self._timed_call(fn, args, kwargs)
+        # The latency the caller saw, so a hedged call's slow loser does not raise the hedging delay
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def _retry_delay(self, error, attempt):
+        """Backoff before retrying a failed attempt; raises when it must not be retried"""
+        if deadlines.expired():
+            raise deadlines.DeadlineExceeded(f"Request deadline exceeded: {error}") from error
+        if not is_transient(error) or attempt >= self.max_retries:
+            if is_throttled(error):
+                raise RateLimited(f"Gemini quota exceeded: {error}",
+                                  retry_after=self._backoff(attempt + 1)) from error
+            raise error
+        delay = self._backoff(attempt)
+        left = deadlines.remaining()
+        if left is not None and left <= delay:
+            raise deadlines.DeadlineExceeded(f"Request deadline exceeded: {error}") from error
+        metrics.increment('gemini_retries', reason='throttled' if is_throttled(error) else 'transient')
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) within the limits, retrying throttled and transient failures"""
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(fn, args, kwargs)
+            except (RateLimited, deadlines.DeadlineExceeded):
+                raise
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    async def _acquire_async(self):
+        """_acquire() for the event loop: polls instead of blocking. The concurrency slot is
+        taken first so a waiting call does not hold a rate token. The bucket is a SQLite
+        transaction that may wait on a lock, so it is polled from a thread."""
+        timeout = deadlines.timeout(self.acquire_timeout)
+        give_up = time.monotonic() + timeout if timeout is not None else None
+        delay = ASYNC_POLL_MIN
+        has_slot = self.concurrency is None or self.concurrency.acquire(0)
+        try:
+            while not (has_slot and (self.bucket is None or await asyncio.to_thread(self.bucket.try_acquire))):
+                if give_up is not None and time.monotonic() + delay > give_up:
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, ASYNC_POLL_MAX)
+                has_slot = has_slot or self.concurrency.acquire(0)
+            else:
+                return True
+        except BaseException:
+            # Cancelled while waiting for a rate token
+            if has_slot and self.concurrency is not None:
+                self.concurrency.release()
+            raise
+        if has_slot and self.concurrency is not None:
+            self.concurrency.release()
+        return False
+
+    async def _attempt_async(self, fn, args, kwargs):
+        if not await self._acquire_async():
+            metrics.increment('gemini_rate_limited')
+            raise RateLimited("No Gemini request slot became free in time",
+                              retry_after=self._backoff(self.max_retries))
+        start = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self._failed(e)
+            raise
+        except BaseException:
+            # Cancelled, e.g. the client went away; says nothing about the API
+            if self.concurrency is not None:
+                self.concurrency.release()
+            raise
+        latency = time.perf_counter() - start
+        if self.concurrency is not None:
+            self.concurrency.release(latency=latency)
+        self._latencies.append(latency)
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) within the limits, retrying like call(); never hedged"""
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt_async(fn, args, kwargs)
+            except (RateLimited, deadlines.DeadlineExceeded):
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    @contextmanager
+    def slot(self):
+        """Hold one slot without retries or hedging, for streamed calls"""
+        self._acquire_or_raise()
+        failed = False
+        try:
+            yield
+        except Exception as e:
+            failed = True
+            self._failed(e)
+            raise
+        finally:
+            # Also when the stream is abandoned part way (GeneratorExit)
+            if not failed and self.concurrency is not None:
+                self.concurrency.release()
+
+    def snapshot(self):
+        """Current limits, for /api/stats"""
+        snapshot = {'concurrency': self.concurrency.snapshot() if self.concurrency is not None else None}
+        if self._latencies:
+            snapshot['p95_ms'] = round(_percentile(self._latencies, 0.95) * 1000, 3)
+        return snapshot
@@ -0,0 +1,156 @@
+"""
+Content-addressed cache for extraction results.
+
+Two tiers are used:
+- an in-memory LRU per worker process, bounded by entry count, total size and TTL
+- a SQLite file on local disk that every gunicorn worker can share
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from results import dumps, loads
+
+
+def make_cache_key(image_bytes, *parts):
+    """Build a cache key from the image content and everything that affects the output
+    (engine, model, prompt version, preprocessing settings...)"""
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory + SQLite) cache of extraction results keyed by content hash"""
+
+    def __init__(self, db_path=None, max_entries=1024, max_bytes=64 * 1024 * 1024,
+                 ttl=7 * 24 * 3600, disk_max_entries=100000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+
+        if self.db_path:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._connection().execute(
+                "CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)"
+            )
+
+    def _connection(self):
+        """Return a SQLite connection owned by the current thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return (result, tier) where tier is 'memory', 'disk' or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value, size = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return loads(value), 'memory'
+                del self._memory[key]
+                self._memory_bytes -= size
+
+        if not self.db_path:
+            return None, None
+
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM results WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"DEBUG: Result cache read failed: {e}")
+            return None, None
+
+        if row is None:
+            return None, None
+
+        value, expires_at = row
+        self._remember(key, value, expires_at)
+        return loads(value), 'disk'
+
+    def set(self, key, result):
+        """Store a result in both tiers"""
+        value = dumps(result).decode('utf-8')
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, value, expires_at)
+
+        if not self.db_path:
+            return
+
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, expires_at)
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict_disk(conn, now)
+        except sqlite3.Error as e:
+            print(f"DEBUG: Result cache write failed: {e}")
+
+    def _remember(self, key, value, expires_at):
+        """Insert into the memory tier and evict least recently used entries"""
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old[2]
+            self._memory[key] = (expires_at, value, size)
+            self._memory_bytes += size
+            while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def _evict_disk(self, conn, now):
+        """Drop expired rows and trim the disk tier to its maximum size"""
+        conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,)
+        )
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.db_path:
+            self._connection().execute("DELETE FROM results")
@@ -0,0 +1,340 @@
+"""
+Searchable store of extraction results.
+
+Successful extractions are kept in a local SQLite file:
+- documents: one row per upload (deduplicated by the SHA-256 of its bytes) with the full result
+- documents_fts: a contentless FTS5 index over the text and the structured field values
+- document_keys: normalized invoice and order numbers, emails, phone numbers and dates, for
+  exact lookups and date ranges
+
+add() only queues a result. A background thread in each process writes the queue in batched
+transactions, so storing never adds to extraction latency; when the queue is full new results
+are dropped and counted instead of waited for. Queued results are written at a normal exit;
+a killed process loses them.
+
+search() pages newest first with a cursor (the last document id) rather than an offset, and
+each query is driven by its most selective part: an exact key, the full-text match, a narrow
+date range, or otherwise the documents in id order. Every page is then a short index walk,
+however many documents are stored.
+"""
+
+import os
+import re
+import time
+import queue
+import atexit
+import hashlib
+import sqlite3
+import threading
+import metrics
+from field_extractor import parse_dates, text_language
+from results import ExtractionResult, dumps, loads
+
+# Exact-match keys and the result fields they are read from
+KEY_FIELDS = {
+    'invoice': ('transactional_info', 'invoice_number'),
+    'order': ('transactional_info', 'order_id'),
+    'email': ('personal_info', 'email'),
+    'phone': ('personal_info', 'phone'),
+}
+DATE_FIELDS = (('dates', 'issue_date'), ('dates', 'due_date'), ('dates', 'other_dates'))
+
+# A date range matching fewer keys than this is read from the key index and sorted; a wider
+# one is applied as a filter while walking the documents newest first
+RANGE_SORT_LIMIT = 5000
+
+NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_key(kind, value):
+    """The form a key is stored and looked up in; '' when value is not a usable key"""
+    value = value.strip()
+    if kind == 'email':
+        return value.lower()
+    if kind == 'phone':
+        digits = NON_DIGITS.sub('', value)
+        return digits if len(digits) >= 6 else ''
+    return value.upper()
+
+
+def fts_query(text):
+    """FTS5 query matching documents that contain every word of text (a trailing * matches
+    a prefix). Words are quoted so that FTS5 operators in user input are taken literally."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*') and len(word) > 1
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+class ResultStore:
+    """SQLite result store with a full-text index and batched background writes"""
+
+    def __init__(self, db_path, batch_size=200, flush_interval=1.0, max_queue=10000,
+                 tokenizer='unicode61 remove_diacritics 2'):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(max_queue)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pid = None
+        self._counts = {'stored': 0, 'duplicate': 0, 'dropped': 0, 'failed': 0}
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY,"
+            " digest TEXT NOT NULL UNIQUE,"
+            " created_at REAL NOT NULL,"
+            " filename TEXT NOT NULL,"
+            " method TEXT NOT NULL,"
+            " language TEXT NOT NULL,"
+            " result TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS document_keys ("
+            " kind TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " document_id INTEGER NOT NULL,"
+            " PRIMARY KEY (kind, value, document_id)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS document_keys_document ON document_keys (document_id, kind, value)")
+        tokenize = tokenizer.replace("'", "''")
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5("
+            f"text, fields, content='', tokenize='{tokenize}')"
+        )
+
+    def _connection(self):
+        """Return a SQLite connection owned by the current thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, image_bytes, extraction_result, filename, method, language):
+        """Queue a successful extraction for storage; False when the queue was full"""
+        self._ensure_started()
+        record = (hashlib.sha256(image_bytes).hexdigest(), time.time(), filename or '', method,
+                  language, extraction_result)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        return True
+
+    def _ensure_started(self):
+        """Start the writer thread once per process (threads do not survive a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Records queued by the parent before the fork are the parent's to write
+            self._queue = queue.Queue(self._queue.maxsize)
+            threading.Thread(target=self._run, name='result-store-writer', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(records) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    records.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write_done(records)
+
+    def flush(self):
+        """Write everything queued so far, and wait for the batch the writer thread holds"""
+        if self._pid != os.getpid():
+            # Nothing queued in this process (a forked child inherits the parent's queue)
+            return
+        records = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(records) == self.batch_size:
+                self._write_done(records)
+                records = []
+        if records:
+            self._write_done(records)
+        self._queue.join()
+
+    def _write_done(self, records):
+        try:
+            self._write(records)
+        finally:
+            for _ in records:
+                self._queue.task_done()
+
+    def _write(self, records):
+        start = time.perf_counter()
+        stored = 0
+        # One writer per process at a time; other processes wait on SQLite's busy timeout
+        with self._write_lock:
+            conn = self._connection()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for digest, created_at, filename, method, language, extraction_result in records:
+                    stored += self._insert(conn, digest, created_at, filename, method, language,
+                                           ExtractionResult.from_dict(extraction_result))
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                print(f"DEBUG: Result store write failed: {e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                self._count('failed', len(records))
+                return
+        self._count('stored', stored)
+        self._count('duplicate', len(records) - stored)
+        metrics.observe('result_store_write_seconds', time.perf_counter() - start)
+
+    def _insert(self, conn, digest, created_at, filename, method, language, extraction_result):
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO documents (digest, created_at, filename, method, language, result)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (digest, created_at, filename, method, language, dumps(extraction_result).decode('utf-8'))
+        )
+        if cursor.rowcount == 0:
+            return 0
+        document_id = cursor.lastrowid
+        fields = [value for name in ('personal_info', 'transactional_info', 'dates', 'locations')
+                  for value in extraction_result.section(name).values() if isinstance(value, str) and value]
+        if isinstance(extraction_result.other_data, str) and extraction_result.other_data:
+            fields.append(extraction_result.other_data)
+        conn.execute(
+            "INSERT INTO documents_fts (rowid, text, fields) VALUES (?, ?, ?)",
+            (document_id, str(extraction_result.text or ''), '\n'.join(fields))
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO document_keys (kind, value, document_id) VALUES (?, ?, ?)",
+            [(kind, value, document_id) for kind, value in self._keys(extraction_result, language)]
+        )
+        return 1
+
+    def _keys(self, extraction_result, language):
+        keys = set()
+        for kind, (section, field) in KEY_FIELDS.items():
+            value = extraction_result.section(section)[field]
+            if isinstance(value, str):
+                for part in value.split(', '):
+                    key = normalize_key(kind, part)
+                    if key:
+                        keys.add((kind, key))
+        # Numeric dates are read in the order of the document's language, as extract_fields() does
+        language = text_language(str(extraction_result.text or ''), language)
+        for section, field in DATE_FIELDS:
+            value = extraction_result.section(section)[field]
+            if isinstance(value, str) and value:
+                for date in parse_dates(value, language):
+                    keys.add(('date', date.isoformat()))
+        return keys
+
+    def search(self, text=None, invoice_number=None, order_id=None, email=None, phone=None,
+               date_from=None, date_to=None, limit=20, cursor=None):
+        """Return (documents, next_cursor) for documents matching every given criterion,
+        newest first. Dates are ISO strings (YYYY-MM-DD); next_cursor is None on the last page."""
+        exact = []
+        for kind, value in (('invoice', invoice_number), ('order', order_id), ('email', email),
+                            ('phone', phone)):
+            if value:
+                key = normalize_key(kind, value)
+                if not key:
+                    return [], None
+                exact.append((kind, key))
+        match = fts_query(text) if text else None
+        if text and not match:
+            return [], None
+        date_range = None
+        if date_from or date_to:
+            date_range = (date_from or '0000-00-00', date_to or '9999-99-99')
+
+        conn = self._connection()
+        filters, params = [], []
+        if exact:
+            kind, key = exact.pop(0)
+            source = "document_keys k JOIN documents d ON d.id = k.document_id"
+            filters.append("k.kind = ? AND k.value = ?")
+            params += [kind, key]
+            id_column = "k.document_id"
+        elif match:
+            source = "documents_fts f JOIN documents d ON d.id = f.rowid"
+            filters.append("documents_fts MATCH ?")
+            params.append(match)
+            id_column = "f.rowid"
+            match = None
+        elif date_range and self._narrow(conn, date_range):
+            source = "(SELECT DISTINCT document_id FROM document_keys WHERE kind = 'date'" \
+                     " AND value BETWEEN ? AND ?) k JOIN documents d ON d.id = k.document_id"
+            params += list(date_range)
+            id_column = "k.document_id"
+            date_range = None
+        else:
+            source = "documents d"
+            id_column = "d.id"
+
+        if cursor is not None:
+            filters.append(f"{id_column} < ?")
+            params.append(cursor)
+        for kind, key in exact:
+            filters.append("EXISTS (SELECT 1 FROM document_keys WHERE kind = ? AND value = ? AND document_id = d.id)")
+            params += [kind, key]
+        if match:
+            filters.append("EXISTS (SELECT 1 FROM documents_fts WHERE documents_fts MATCH ? AND rowid = d.id)")
+            params.append(match)
+        if date_range:
+            filters.append("EXISTS (SELECT 1 FROM document_keys WHERE document_id = d.id AND kind = 'date'"
+                           " AND value BETWEEN ? AND ?)")
+            params += list(date_range)
+
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        rows = conn.execute(
+            f"SELECT d.id, d.created_at, d.filename, d.method, d.language, d.result FROM {source} {where}"
+            f" ORDER BY {id_column} DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        # One row past the page tells whether there is another page
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        documents = [{'id': row[0], 'created_at': row[1], 'filename': row[2], 'method': row[3],
+                      'language': row[4], 'result': loads(row[5])} for row in rows[:limit]]
+        return documents, next_cursor
+
+    def _narrow(self, conn, date_range):
+        """True when the date range matches few enough keys to read them all and sort"""
+        count = conn.execute(
+            "SELECT count(*) FROM (SELECT 1 FROM document_keys WHERE kind = 'date' AND value BETWEEN ? AND ?"
+            " LIMIT ?)",
+            (*date_range, RANGE_SORT_LIMIT)
+        ).fetchone()[0]
+        return count < RANGE_SORT_LIMIT
+
+    def _count(self, outcome, amount=1):
+        if amount:
+            with self._lock:
+                self._counts[outcome] += amount
+            metrics.increment('result_store_documents', amount, outcome=outcome)
+
+    def snapshot(self):
+        """Counts of this process's queued, stored, duplicate, dropped and failed documents"""
+        with self._lock:
+            return {'queued': self._queue.qsize(), **self._counts}
@@ -0,0 +1,314 @@
+"""
+Extraction result type and its serialization.
+
+An extraction result is the structure every engine returns: the text, four
+sections of structured fields and other_data, plus error, retry_after and
+timed_out on failures. ExtractionResult and its sections keep their fields in
+__slots__ instead of nested dicts, and a section with no values is not stored
+at all: it reads as a shared, read-only empty section until something writes to
+it. Both types behave as mappings (result['personal_info']['name'], get, items,
+'error' in result), so code written against the plain dict keeps working.
+
+dumps() serializes results, and anything containing them, to JSON with orjson
+when it is installed (the json module otherwise); packb() to MessagePack when
+msgpack is installed. ResultJSONProvider puts jsonify() on the same path.
+"""
+
+import json
+import decimal
+from collections.abc import Mapping, MutableMapping
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Section(MutableMapping):
+    """A group of string fields of an extraction result"""
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, values=None):
+        get = values.get if values else _no_value
+        for name in self.FIELDS:
+            setattr(self, name, get(name, ''))
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(f"{type(self).__name__} has no field {key!r}")
+        if self is _EMPTY_SECTIONS.get(type(self)):
+            raise TypeError("The shared empty section is read-only")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        self[key] = ''
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def is_empty(self):
+        return not any(getattr(self, name) for name in self.FIELDS)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _no_value(name, default):
+    return default
+
+
+class PersonalInfo(Section):
+    FIELDS = ('name', 'phone', 'email', 'date_of_birth', 'other_personal')
+    __slots__ = FIELDS
+
+
+class TransactionalInfo(Section):
+    FIELDS = ('invoice_number', 'order_id', 'total_amount', 'payment_method', 'other_transactional')
+    __slots__ = FIELDS
+
+
+class Dates(Section):
+    FIELDS = ('due_date', 'issue_date', 'other_dates')
+    __slots__ = FIELDS
+
+
+class Locations(Section):
+    FIELDS = ('addresses', 'other_locations')
+    __slots__ = FIELDS
+
+
+SECTIONS = {
+    'personal_info': PersonalInfo,
+    'transactional_info': TransactionalInfo,
+    'dates': Dates,
+    'locations': Locations,
+}
+
+_EMPTY_SECTIONS = {section_type: section_type() for section_type in SECTIONS.values()}
+_EMPTY_DICTS = {name: section_type().to_dict() for name, section_type in SECTIONS.items()}
+
+# Keys of a result in serialization order; OPTIONAL ones are left out while None
+FIELDS = ('text', 'personal_info', 'transactional_info', 'dates', 'locations', 'other_data')
+OPTIONAL = ('error', 'retry_after', 'timed_out')
+
+
+class ExtractionResult(MutableMapping):
+    """Compact extraction result. Keys other than FIELDS and OPTIONAL (a model reply may
+    carry some) are kept in a dict of their own, created only when needed."""
+
+    __slots__ = FIELDS + OPTIONAL + ('extra',)
+
+    def __init__(self, text='', other_data=''):
+        self.text = text
+        self.personal_info = None
+        self.transactional_info = None
+        self.dates = None
+        self.locations = None
+        self.other_data = other_data
+        self.error = None
+        self.retry_after = None
+        self.timed_out = None
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Result from a parsed JSON object (a model reply, a cache entry); results pass through"""
+        if isinstance(data, ExtractionResult):
+            return data
+        result = cls(data.get('text', ''), data.get('other_data', ''))
+        for key, value in data.items():
+            if key in SECTIONS:
+                result._set_section(key, value)
+            elif key != 'text' and key != 'other_data':
+                result[key] = value
+        return result
+
+    def _set_section(self, key, value):
+        section_type = SECTIONS[key]
+        if type(value) is section_type:
+            if value.is_empty():
+                value = None
+        elif (isinstance(value, dict) or isinstance(value, Mapping)) and any(value.values()):
+            value = section_type(value)
+        else:
+            value = None
+        setattr(self, key, value)
+
+    def section(self, name):
+        """The named section for reading; the shared empty one when it has no values"""
+        section = getattr(self, name)
+        return section if section is not None else _EMPTY_SECTIONS[SECTIONS[name]]
+
+    def __getitem__(self, key):
+        section_type = SECTIONS.get(key)
+        if section_type is not None:
+            # Handed out for writing too, so an empty section is materialized here
+            section = getattr(self, key)
+            if section is None:
+                section = section_type()
+                setattr(self, key, section)
+            return section
+        if key in FIELDS:
+            return getattr(self, key)
+        if key in OPTIONAL:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in SECTIONS:
+            self._set_section(key, value)
+        elif key in FIELDS or key in OPTIONAL:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in OPTIONAL and getattr(self, key) is not None:
+            setattr(self, key, None)
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield from FIELDS
+        for key in OPTIONAL:
+            if getattr(self, key) is not None:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key in FIELDS:
+            return True
+        if key in OPTIONAL:
+            return getattr(self, key) is not None
+        return self.extra is not None and key in self.extra
+
+    def get(self, key, default=None):
+        if key in SECTIONS or key in FIELDS:
+            return self[key]
+        if key in OPTIONAL:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def items(self):
+        """(key, value) pairs; empty sections are the shared read-only one"""
+        return [(key, self.section(key) if key in SECTIONS else self[key]) for key in self]
+
+    def to_dict(self, share_empty=False):
+        """The result as plain nested dicts. With share_empty, empty sections are one shared
+        dict each: only for serializers, which never modify them."""
+        data = {'text': self.text}
+        for name in SECTIONS:
+            section = getattr(self, name)
+            if section is not None:
+                data[name] = section.to_dict()
+            else:
+                data[name] = _EMPTY_DICTS[name] if share_empty else dict(_EMPTY_DICTS[name])
+        data['other_data'] = self.other_data
+        if self.error is not None:
+            data['error'] = self.error
+        if self.retry_after is not None:
+            data['retry_after'] = self.retry_after
+        if self.timed_out is not None:
+            data['timed_out'] = self.timed_out
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return f"ExtractionResult({self.to_dict()!r})"
+
+
+# Never modified: a template for schemas and a stand-in where no result exists
+EMPTY_RESULT = ExtractionResult()
+
+
+def empty_result(text=''):
+    """Extraction result with the given text and every structured field empty"""
+    return ExtractionResult(text)
+
+
+def _default(value):
+    if isinstance(value, ExtractionResult):
+        return value.to_dict(share_empty=True)
+    if isinstance(value, Section):
+        return value.to_dict()
+    if isinstance(value, float):
+        # Subclasses such as numpy.float64, which orjson does not take as floats
+        return float(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value, sort_keys=False, indent=False):
+    """UTF-8 JSON bytes of value, which may contain extraction results"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(value, default=_default, option=option)
+    return json.dumps(value, default=_default, ensure_ascii=False, sort_keys=sort_keys,
+                      indent=2 if indent else None, separators=None if indent else (',', ':')).encode('utf-8')
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def packb(value):
+    """MessagePack bytes of value, None without msgpack"""
+    if msgpack is None:
+        return None
+    return msgpack.packb(value, default=_default, use_bin_type=True)
+
+
+class ResultJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider for jsonify() and request.json that goes through dumps() and loads()"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys),
+                     indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
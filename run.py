@@ -5,6 +5,8 @@ Quick start script for the Image Text Recognition Web App
 
 import os
 import sys
+import shutil
+import importlib.util
 import subprocess
 
 def check_dependencies():
@@ -17,21 +19,18 @@ def check_dependencies():
         return False
     
     # Check if requirements are installed
-    try:
-        import flask
-        import PIL
-        import pytesseract
-        print("✅ Core dependencies found")
-    except ImportError as e:
-        print(f"❌ Missing dependency: {e}")
+    # Only look the packages up, importing them here would slow down every start
+    missing = [name for name in ('flask', 'PIL') if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"❌ Missing dependency: {', '.join(missing)}")
         print("💡 Please run: pip install -r requirements.txt")
         return False
+    print("✅ Core dependencies found")
     
-    # Check Tesseract
-    try:
-        pytesseract.get_tesseract_version()
+    # Check Tesseract (optional, used by method=tesseract and method=auto)
+    if shutil.which('tesseract'):
         print("✅ Tesseract OCR found")
-    except Exception:
+    else:
         print("⚠️  Tesseract OCR not found - OCR functionality will be limited")
         print("💡 Install Tesseract: https://github.com/tesseract-ocr/tesseract")
     
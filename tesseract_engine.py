@@ -0,0 +1,194 @@
+"""
+Local Tesseract OCR engine.
+
+Recognition runs in a pool of worker processes so it scales across cores and
+never holds the GIL of the web worker. Each pool process keeps one warm
+Tesseract instance per language through the tesserocr API binding, so the
+language data is loaded once per process instead of once per request. When
+tesserocr is not installed the pytesseract CLI wrapper is used instead, which
+spawns a tesseract subprocess per call.
+"""
+
+import io
+import os
+import re
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+
+_tesserocr = None
+
+LANGUAGE_PATTERN = re.compile(r'^[a-z_]+(\+[a-z_]+)*$')
+
+# Words recognised with a confidence below this are counted as low confidence
+LOW_CONFIDENCE = 60
+
+# Warm tesserocr instances of the current pool process, keyed by language
+_apis = {}
+
+
+def _load_tesserocr():
+    """Import tesserocr on first use (inside pool processes), False when not installed"""
+    global _tesserocr
+    if _tesserocr is None:
+        try:
+            import tesserocr
+            _tesserocr = tesserocr
+        except ImportError:
+            _tesserocr = False
+    return _tesserocr
+
+
+def backend_name():
+    return 'tesserocr' if _load_tesserocr() else 'pytesseract'
+
+
+def _get_api(language):
+    api = _apis.get(language)
+    if api is None:
+        kwargs = {'lang': language}
+        tessdata = os.environ.get('TESSDATA_PREFIX')
+        if tessdata:
+            kwargs['path'] = tessdata
+        api = _load_tesserocr().PyTessBaseAPI(**kwargs)
+        _apis[language] = api
+    return api
+
+
+def _init_worker(warm_languages):
+    """Pool initializer: load language data before the first request arrives"""
+    if not _load_tesserocr():
+        return
+    for language in warm_languages:
+        try:
+            _get_api(language)
+        except Exception as e:
+            print(f"DEBUG: Could not warm Tesseract for {language}: {e}")
+
+
+def _recognize_tesserocr(image, language):
+    api = _get_api(language)
+    api.SetImage(image)
+    text = api.GetUTF8Text()
+    confidences = list(api.AllWordConfidences())
+    api.Clear()
+    return text, confidences
+
+
+def _recognize_pytesseract(image, language):
+    import pytesseract
+    data = pytesseract.image_to_data(image, lang=language, output_type=pytesseract.Output.DICT)
+
+    # Rebuild the text from the word boxes so only one tesseract process is spawned
+    lines = []
+    confidences = []
+    current_line = None
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if conf < 0:
+            continue
+        line_id = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        if line_id != current_line:
+            if current_line is not None and line_id[:2] != current_line[:2]:
+                lines.append('')
+            lines.append(word)
+            current_line = line_id
+        else:
+            lines[-1] += ' ' + word
+        confidences.append(conf)
+    return '\n'.join(lines), confidences
+
+
+def recognize(image_bytes, language='eng'):
+    """Run OCR over one encoded image, executed inside a pool process"""
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    if _load_tesserocr():
+        text, confidences = _recognize_tesserocr(image, language)
+    else:
+        text, confidences = _recognize_pytesseract(image, language)
+
+    confidences = [c for c in confidences if c >= 0]
+    return {
+        'text': text.strip(),
+        'confidence': round(sum(confidences) / len(confidences), 2) if confidences else 0.0,
+        'word_count': len(confidences),
+        'low_confidence_words': sum(1 for c in confidences if c < LOW_CONFIDENCE),
+        'backend': backend_name(),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+    }
+
+
+class TesseractEngine:
+    """Process pool front-end for recognize(), created lazily in each web worker"""
+
+    def __init__(self, processes=2, languages=('eng', 'jpn')):
+        self.processes = processes
+        self.languages = tuple(languages)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # tesserocr instances are not thread-safe, serialise in-process calls
+        self._inline_lock = threading.Lock()
+
+    def validate_language(self, language):
+        """True when every part of a language spec like 'eng+jpn' is allowed"""
+        if not LANGUAGE_PATTERN.match(language or ''):
+            return False
+        return all(part in self.languages for part in language.split('+'))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # forkserver avoids forking a web worker that already runs threads (and gRPC)
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.languages,)
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def warm(self):
+        """Start the pool processes now instead of on the first request"""
+        if self.processes > 0:
+            executor = self._get_executor()
+            for future in [executor.submit(backend_name) for _ in range(self.processes)]:
+                future.result()
+
+    def recognize(self, image_bytes, language='eng', timeout=None):
+        if not self.validate_language(language):
+            raise ValueError(f"Unsupported OCR language: {language}")
+        if self.processes <= 0:
+            # In-process mode, handy for development and platforms without forkserver
+            with self._inline_lock:
+                return recognize(image_bytes, language)
+        executor = self._get_executor()
+        try:
+            return self._result(executor.submit(recognize, bytes(image_bytes), language), timeout)
+        except BrokenProcessPool:
+            # A pool process died (e.g. OOM on a huge page); start a fresh pool and retry once
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            return self._result(self._get_executor().submit(recognize, bytes(image_bytes), language), timeout)
+
+    @staticmethod
+    def _result(future, timeout):
+        """future.result(timeout); raises concurrent.futures.TimeoutError (not the builtin
+        TimeoutError before Python 3.11) when the time runs out"""
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            # Drop the work if it has not started; a running recognition cannot be interrupted
+            future.cancel()
+            raise
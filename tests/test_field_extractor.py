@@ -0,0 +1,28 @@
+import datetime
+
+from field_extractor import extract_fields, parse_date, text_language
+
+VIETNAMESE_INVOICE = ("HÓA ĐƠN GIÁ TRỊ GIA TĂNG\nSố hóa đơn: 0012345\nNgày: 05/03/2024\n"
+                      "Tổng cộng: 1.234.000 VND\nThanh toán: Tiền mặt")
+
+
+def test_vietnamese_text_is_recognized_whatever_the_ocr_language():
+    assert text_language(VIETNAMESE_INVOICE, 'eng') == 'vie'
+    assert text_language(VIETNAMESE_INVOICE, 'jpn') == 'vie'
+    assert text_language('Invoice date: 05/03/2024\nCafé crème', 'eng') == 'eng'
+    assert text_language('Facture du 05/03/2024', 'fra') == 'fra'
+
+
+def test_vietnamese_numeric_dates_are_day_first_through_the_api_languages():
+    result = extract_fields(VIETNAMESE_INVOICE, 'eng')
+    date_text = ', '.join(value for value in result['dates'].values() if value)
+    assert '05/03/2024' in date_text
+    assert parse_date(date_text, text_language(result['text'], 'eng')) == datetime.date(2024, 3, 5)
+
+
+def test_english_numeric_dates_stay_month_first():
+    assert parse_date('05/03/2024', text_language('Invoice date: 05/03/2024', 'eng')) == datetime.date(2024, 5, 3)
+
+
+def test_payment_method_keeps_its_case():
+    assert extract_fields('Paid by VISA', 'eng')['transactional_info']['payment_method'] == 'VISA'
@@ -0,0 +1,42 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from preprocess import PreprocessOptions, is_effectively_grayscale, preprocess_image
+
+
+def transparent_text(mode):
+    """Dark text on a fully transparent background, encoded as PNG"""
+    image = Image.new('RGBA', (600, 200), (0, 0, 0, 0))
+    ImageDraw.Draw(image).rectangle((100, 80, 500, 120), fill=(20, 20, 20, 255))
+    if mode == 'LA':
+        image = image.convert('LA')
+    elif mode == 'P':
+        image = image.convert('P')
+        image.info['transparency'] = image.getpixel((0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', transparency=image.info.get('transparency'))
+    return buffer.getvalue()
+
+
+def decoded(payload):
+    return Image.open(io.BytesIO(payload)).convert('L')
+
+
+def test_transparent_background_becomes_white_in_every_mode():
+    options = PreprocessOptions(max_side=300, skip_below_bytes=0)
+    for mode in ('RGBA', 'LA', 'P'):
+        for grayscale in ('auto', 'always', 'never'):
+            options.grayscale = grayscale
+            payload, _, info = preprocess_image(transparent_text(mode), options)
+            image = decoded(payload)
+            assert image.getpixel((5, 5)) > 240, (mode, grayscale)
+            assert image.getpixel((150, 50)) < 60, (mode, grayscale)
+
+
+def test_grayscale_detection_looks_through_transparency():
+    image = Image.new('RGBA', (64, 64), (255, 0, 0, 0))
+    ImageDraw.Draw(image).rectangle((10, 10, 50, 50), fill=(30, 30, 30, 255))
+    # Red only where fully transparent: what is visible has no colour
+    assert is_effectively_grayscale(image)
+    assert not is_effectively_grayscale(Image.new('RGBA', (64, 64), (255, 0, 0, 255)))
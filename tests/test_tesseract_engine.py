@@ -0,0 +1,42 @@
+import concurrent.futures
+
+import pytest
+
+from tesseract_engine import TesseractEngine
+
+
+class StalledExecutor:
+    """Executor whose work never finishes"""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        self.futures.append(future)
+        return future
+
+
+def test_timeout_raises_the_futures_timeout_and_cancels_the_work(monkeypatch):
+    engine = TesseractEngine(processes=1)
+    executor = StalledExecutor()
+    monkeypatch.setattr(engine, '_get_executor', lambda: executor)
+
+    # concurrent.futures.TimeoutError, which before Python 3.11 is not the builtin TimeoutError
+    with pytest.raises(concurrent.futures.TimeoutError):
+        engine.recognize(b'image', 'eng', timeout=0.01)
+    assert executor.futures[0].cancelled()
+
+
+def test_app_reports_a_tesseract_timeout_as_deadline_exceeded(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test')
+    import app
+
+    class TimingOut:
+        def recognize(self, image_bytes, language, timeout=None):
+            raise concurrent.futures.TimeoutError()
+
+    monkeypatch.setattr(app.engines, 'get', lambda name: TimingOut())
+    result, _ = app.extract_text_tesseract(b'image', 'eng')
+    assert result['timed_out'] is True
+    assert result['error'] == 'Tesseract OCR timed out'
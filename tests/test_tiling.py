@@ -0,0 +1,70 @@
+from tiling import plan_tiles, stitch_text
+
+
+def test_similar_lines_are_not_taken_as_overlap():
+    texts = ['RECEIPT\nItem 1 $10\nItem 2 $20', 'Item 3 $30\nItem 4 $40\nTotal $100']
+    assert stitch_text(texts, 1) == 'RECEIPT\nItem 1 $10\nItem 2 $20\nItem 3 $30\nItem 4 $40\nTotal $100'
+
+
+def test_short_similar_lines_keep_every_row():
+    texts = ['a-left\nb-left', 'c-left\nd-left', 'e-left\nf-left']
+    assert stitch_text(texts, 1).splitlines() == ['a-left', 'b-left', 'c-left', 'd-left', 'e-left', 'f-left']
+
+
+def test_short_identical_line_is_kept():
+    assert stitch_text(['Subtotal\nTotal', 'Total\nThank you'], 1).splitlines() == \
+        ['Subtotal', 'Total', 'Total', 'Thank you']
+
+
+def test_vertical_overlap_is_dropped_once():
+    top = 'ACME Supplies Ltd\nCoffee beans 2 x 12.00\nMilk carton 1 x 1.99'
+    bottom = 'Coffee beans 2 x 12.00\nMilk carton 1 x 1.99\nTotal 25.99'
+    assert stitch_text([top, bottom], 1).splitlines() == \
+        ['ACME Supplies Ltd', 'Coffee beans 2 x 12.00', 'Milk carton 1 x 1.99', 'Total 25.99']
+
+
+def test_overlap_ignores_case_and_spacing_and_cut_lines():
+    top = 'ACME Supplies Ltd\nCoffee beans 2 x 12.00\nMi1k cart'
+    bottom = 'COFFEE  beans 2 x 12.00\nMilk carton 1 x 1.99\nTotal 25.99'
+    assert stitch_text([top, bottom], 1).splitlines() == \
+        ['ACME Supplies Ltd', 'Coffee beans 2 x 12.00', 'Milk carton 1 x 1.99', 'Total 25.99']
+
+
+def test_row_of_tiles_is_merged_line_by_line():
+    left = 'Coffee beans premium\nMilk whole organic\nBread'
+    right = 'beans premium 12.00 USD\nwhole organic 1.99 USD\n2.49 USD'
+    assert stitch_text([left, right], 2).splitlines() == \
+        ['Coffee beans premium 12.00 USD', 'Milk whole organic 1.99 USD', 'Bread 2.49 USD']
+
+
+def test_row_merge_drops_words_cut_by_the_tile_edge():
+    assert stitch_text(['Coffee beans premium grade quali', 'ans premium grade quality 12.00'], 2) == \
+        'Coffee beans premium grade quality 12.00'
+
+
+def test_row_merge_keeps_similar_words_apart():
+    left = 'Item one left\nItem two left'
+    right = 'Item one right\nItem two right'
+    assert stitch_text([left, right], 2).splitlines() == \
+        ['Item one left Item one right', 'Item two left Item two right']
+
+
+def test_grid_overlap_lines_appear_once_in_reading_order():
+    top_left = 'ACME Supplies Invoice\nCoffee beans premium\nMilk whole organic'
+    top_right = 'Number INV-0042\nbeans premium 12.00 USD\nwhole organic 1.99 USD'
+    bottom_left = 'Coffee beans premium\nMilk whole organic\nTotal amount due now'
+    bottom_right = 'beans premium 12.00 USD\nwhole organic 1.99 USD\namount due now 13.99 USD'
+    assert stitch_text([top_left, top_right, bottom_left, bottom_right], 2).splitlines() == [
+        'ACME Supplies Invoice Number INV-0042',
+        'Coffee beans premium 12.00 USD',
+        'Milk whole organic 1.99 USD',
+        'Total amount due now 13.99 USD',
+    ]
+
+
+def test_plan_tiles_covers_the_image_in_reading_order():
+    columns, boxes = plan_tiles(5000, 3000, tile_size=2048, overlap=192)
+    assert columns == 3
+    assert boxes[0] == (0, 0, 2048, 2048)
+    assert boxes[columns - 1][2] == 5000 and boxes[-1][3] == 3000
+    assert [box[1] for box in boxes] == sorted(box[1] for box in boxes)
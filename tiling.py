@@ -0,0 +1,195 @@
+"""
+Tiled extraction for very large scans.
+
+A3 scans, posters and long receipts are either too big for one request or get
+downscaled until small text is unreadable. Images whose longest side exceeds a
+threshold are cut into overlapping tiles of at most tile_size pixels a side,
+numbered in reading order (left to right, top to bottom). Each tile is then
+extracted like an ordinary image, and stitch_text() joins the tile texts back
+together: the tiles of a row line by line, then the rows top to bottom,
+dropping the text read twice in the overlap between neighbours.
+"""
+
+import io
+import re
+import math
+from itertools import zip_longest
+from PIL import Image
+from pages import encode_png
+
+# Lines (or words of a line) at most this far into a neighbour are compared when looking
+# for the overlap
+MAX_OVERLAP_LINES = 12
+MAX_OVERLAP_WORDS = 12
+
+# Only runs of at least this many characters read twice are dropped as overlap: different
+# short lines ('Total', '1', 'a-left') are too likely to match by chance
+MIN_OVERLAP_CHARS = 12
+
+# How many lines apart the readings of one line may be in two tiles of a row
+MAX_LINE_SHIFT = 8
+
+WORD = re.compile(r'\S+')
+
+
+def _axis(length, tile_size, overlap):
+    """Start offsets of evenly spread tiles covering 0..length with at least overlap between them"""
+    if length <= tile_size:
+        return [0]
+    count = math.ceil((length - overlap) / (tile_size - overlap))
+    step = (length - tile_size) / (count - 1)
+    return [round(i * step) for i in range(count)]
+
+
+def plan_tiles(width, height, tile_size=2048, overlap=192):
+    """Return (columns, boxes): the tile boxes (left, top, right, bottom) in reading order"""
+    if overlap >= tile_size:
+        raise ValueError("Tile overlap must be smaller than the tile size")
+    lefts = _axis(width, tile_size, overlap)
+    tops = _axis(height, tile_size, overlap)
+    boxes = [(left, top, min(left + tile_size, width), min(top + tile_size, height))
+             for top in tops for left in lefts]
+    return len(lefts), boxes
+
+
+def tile_layout(image_bytes, min_side, tile_size=2048, overlap=192):
+    """(columns, boxes) when the image should be tiled, None when it is small enough (or min_side is 0)"""
+    if min_side <= 0:
+        return None
+    try:
+        size = Image.open(io.BytesIO(image_bytes)).size
+    except Exception:
+        # Not an image Pillow can read; the engine reports that
+        return None
+    if max(size) <= min_side:
+        return None
+    return plan_tiles(size[0], size[1], tile_size, overlap)
+
+
+def iter_tiles(image_bytes, boxes):
+    """Yield (tile_number, png_bytes) for each box; the image is decoded once and cropped lazily"""
+    image = Image.open(io.BytesIO(image_bytes))
+    for number, box in enumerate(boxes, 1):
+        yield number, encode_png(image.crop(box))
+
+
+def _normalize(line):
+    return ' '.join(line.lower().split())
+
+
+def _overlap(previous, following, max_count):
+    """(items to drop from the end of previous, items to drop from the start of following).
+
+    Looks for the longest run of lines (or words) at the end of previous that reappears
+    exactly, after normalizing case and spacing, at the start of following. One item on
+    either side may be cut in half by the tile edge and is dropped with the run. A run
+    shorter than MIN_OVERLAP_CHARS is not taken as an overlap.
+    """
+    best = (0, 0, 0)
+    for cut_previous in (0, 1):
+        for cut_following in (0, 1):
+            tail = previous[:len(previous) - cut_previous]
+            head = following[cut_following:]
+            for count in range(min(len(tail), len(head), max_count), best[0], -1):
+                run = head[:count]
+                if tail[len(tail) - count:] == run and sum(len(item) for item in run) >= MIN_OVERLAP_CHARS:
+                    best = (count, cut_previous, cut_following)
+                    break
+    count, cut_previous, cut_following = best
+    if not count:
+        return 0, 0
+    return cut_previous, cut_following + count
+
+
+def _join(previous, following):
+    """Join the texts of vertically neighbouring tiles (or rows), dropping their overlap"""
+    lines_previous = [line for line in previous.splitlines() if line.strip()]
+    lines_following = [line for line in following.splitlines() if line.strip()]
+    if not lines_previous or not lines_following:
+        return '\n'.join(lines_previous + lines_following)
+    drop_previous, drop_following = _overlap([_normalize(line) for line in lines_previous],
+                                             [_normalize(line) for line in lines_following],
+                                             MAX_OVERLAP_LINES)
+    lines_previous = lines_previous[:len(lines_previous) - drop_previous]
+    return '\n'.join(lines_previous + lines_following[drop_following:])
+
+
+def _line_overlap(left, right):
+    """(words to drop from the end of left, words to drop from the start of right) for two
+    readings of one line on either side of a vertical tile edge; (0, 0) without an overlap"""
+    return _overlap([word.lower() for word in left.split()], [word.lower() for word in right.split()],
+                    MAX_OVERLAP_WORDS)
+
+
+def _merge_line(left, right, drop=(0, 0)):
+    """One line of the scan from its left and right tile readings, without the words both read"""
+    left_words = [match.start() for match in WORD.finditer(left)]
+    right_words = [match.start() for match in WORD.finditer(right)]
+    drop_left, drop_right = drop
+    left = left[:left_words[len(left_words) - drop_left]] if drop_left else left
+    right = right[right_words[drop_right]:] if drop_right < len(right_words) else ''
+    return ' '.join(part for part in (left.rstrip(), right.strip()) if part)
+
+
+def _anchors(left, right):
+    """Pairs (i, j, drop) of left and right lines that share words across the tile edge,
+    as the longest chain in top to bottom order on both sides"""
+    candidates = []
+    for i, line in enumerate(left):
+        for j in range(max(0, i - MAX_LINE_SHIFT), min(len(right), i + MAX_LINE_SHIFT + 1)):
+            drop = _line_overlap(line, right[j])
+            if drop != (0, 0):
+                candidates.append((i, j, drop))
+    # Longest chain increasing in both i and j (candidates are few, quadratic is fine)
+    chains = []
+    for index, (i, j, _) in enumerate(candidates):
+        previous = [k for k in range(index) if candidates[k][0] < i and candidates[k][1] < j]
+        best = max(previous, key=lambda k: len(chains[k]), default=None)
+        chains.append((chains[best] if best is not None else []) + [candidates[index]])
+    return max(chains, key=len, default=[])
+
+
+def _merge_row(left_text, right_text):
+    """Merge the texts of horizontally neighbouring tiles line by line.
+
+    Tiles of a row cover the same lines of the scan. Lines read on both sides of the edge
+    (sharing words in the overlap) anchor the pairing; the lines in between are paired in
+    order, so each line of the scan comes out once, left part first.
+    """
+    left = left_text.splitlines()
+    right = right_text.splitlines()
+    if not any(line.strip() for line in right):
+        return left_text
+    if not any(line.strip() for line in left):
+        return right_text
+    merged = []
+    i = j = 0
+    anchors = _anchors(left, right)
+    for index, (anchor_i, anchor_j, drop) in enumerate(anchors + [(len(left), len(right), None)]):
+        segment_left = left[i:anchor_i]
+        segment_right = right[j:anchor_j]
+        if index == 0 and anchors:
+            # Above the first anchor the lines line up from the bottom
+            width = max(len(segment_left), len(segment_right))
+            segment_left = [''] * (width - len(segment_left)) + segment_left
+            segment_right = [''] * (width - len(segment_right)) + segment_right
+        merged += [_merge_line(a, b) for a, b in zip_longest(segment_left, segment_right, fillvalue='')]
+        if drop is not None:
+            merged.append(_merge_line(left[anchor_i], right[anchor_j], drop))
+        i, j = anchor_i + 1, anchor_j + 1
+    return '\n'.join(merged)
+
+
+def stitch_text(texts, columns):
+    """Join tile texts in reading order, removing the text duplicated by the overlaps.
+
+    The tiles of each row are merged line by line, left to right, then the rows are joined
+    top to bottom.
+    """
+    stitched = ''
+    for start in range(0, len(texts), columns):
+        row = ''
+        for text in texts[start:start + columns]:
+            row = _merge_row(row, text) if row else text
+        stitched = _join(stitched, row)
+    return stitched
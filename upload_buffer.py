@@ -0,0 +1,37 @@
+"""
+In-memory handling of uploaded files.
+
+Werkzeug spools every upload larger than 500KB to a temporary file while parsing
+the multipart body. SpoolingRequest raises that threshold so typical images stay
+in memory from the socket to the engine; only very large uploads spill to disk.
+"""
+
+import io
+from tempfile import SpooledTemporaryFile
+from flask import Request
+
+DEFAULT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+class SpoolingRequest(Request):
+    """Request class that keeps uploads in memory up to spool_max_bytes"""
+
+    spool_max_bytes = DEFAULT_SPOOL_MAX_BYTES
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= self.spool_max_bytes:
+            return io.BytesIO()
+        return SpooledTemporaryFile(max_size=self.spool_max_bytes, mode='rb+')
+
+
+def read_upload(file_storage):
+    """Return the bytes of an uploaded file with as few copies as possible"""
+    stream = file_storage.stream
+    # SpooledTemporaryFile keeps its in-memory buffer in _file until it rolls over
+    buffer = getattr(stream, '_file', stream)
+    if isinstance(buffer, io.BytesIO):
+        # getvalue() shares the underlying buffer instead of copying it
+        return buffer.getvalue()
+    stream.seek(0)
+    return stream.read()
+